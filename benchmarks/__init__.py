@@ -0,0 +1 @@
+"""Benchmarks for the obfuscator, see benchmarks/benchmark.py"""
@@ -0,0 +1,416 @@
+"""Benchmark harness for the obfuscator.
+
+Generates synthetic csv files covering different row counts, column counts,
+quoting and proportions of PII columns, uploads them to a mocked S3 bucket
+and measures each stage of the pipeline (fetch, parse, obfuscate,
+serialise, upload) as well as the end-to-end entry points. Results are
+saved as json so that runs can be compared across versions.
+
+Usage:
+    python -m benchmarks.benchmark --rows 10000 100000 --columns 10 100
+    python -m benchmarks.benchmark --compare old.json new.json
+    python -m benchmarks.benchmark --import-time obfuscator obfuscator.main
+"""
+
+import argparse
+import csv
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+BUCKET = "benchmark-bucket"
+DEFAULT_ROWS = [10_000, 100_000]
+DEFAULT_COLUMNS = [10]
+DEFAULT_PII_RATIOS = [0.1, 0.5]
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def generate_csv(
+    rows: int,
+    columns: int,
+    quoted: bool = False,
+    multiline: bool = False,
+    seed: int = 0,
+) -> bytes:
+    """Generates a synthetic csv file.
+
+    Args:
+        rows (int): number of data rows.
+        columns (int): number of columns.
+        quoted (bool): include fields containing commas, which are quoted.
+        multiline (bool): include quoted fields containing newlines.
+        seed (int): seed for the random values.
+
+    Returns: csv file as utf-8 bytes, with header col_0, col_1, ..."""
+
+    rng = random.Random(seed)
+    words = ["alpha", "beta", "gamma", "delta", "Yûichirô", "epsilon"]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([f"col_{i}" for i in range(columns)])
+    for row in range(rows):
+        values = []
+        for column in range(columns):
+            value = f"{rng.choice(words)} {row}-{column}"
+            if quoted and column % 3 == 1:
+                value += f", {rng.choice(words)}"
+            if multiline and column % 5 == 2:
+                value += f"\n{rng.choice(words)}"
+            values.append(value)
+        writer.writerow(values)
+    return buffer.getvalue().encode("utf-8")
+
+
+def pii_fields_for(columns: int, ratio: float) -> list[str]:
+    """Chooses evenly spaced PII columns making up ratio of the columns."""
+
+    count = max(1, round(columns * ratio))
+    step = columns / count
+    return [f"col_{int(i * step)}" for i in range(count)]
+
+
+class StageRecorder:
+    """Measures duration, throughput and memory of named stages.
+
+    Each stage records how much the resident set size grew while it ran,
+    where the platform reports the current RSS. The peak RSS is only known
+    for the whole process, so it is recorded per scenario instead, see
+    peak_rss.
+
+    Args:
+        trace_allocations (bool): record peak Python allocations of each
+            stage with tracemalloc, which slows stages down noticeably."""
+
+    def __init__(self, trace_allocations: bool = False):
+        self.trace_allocations = trace_allocations
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0, bytes_in: int = 0):
+        """Times the body of the with block as stage name.
+
+        The yielded dictionary may be updated with rows and bytes_out."""
+
+        result = {"rows": rows, "bytes_in": bytes_in, "bytes_out": 0}
+        gc.collect()
+        if self.trace_allocations:
+            tracemalloc.start()
+        rss_before = current_rss()
+        start = time.perf_counter()
+        try:
+            yield result
+        finally:
+            seconds = time.perf_counter() - start
+            if self.trace_allocations:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                result["peak_allocated_bytes"] = peak
+            megabytes = max(result["bytes_in"], result["bytes_out"]) / 1e6
+            result["seconds"] = seconds
+            result["rows_per_second"] = result["rows"] / seconds
+            result["mb_per_second"] = megabytes / seconds
+            rss_after = current_rss()
+            result["rss_growth_bytes"] = (
+                None if rss_before is None else rss_after - rss_before
+            )
+            self.stages[name] = result
+
+
+def current_rss() -> int:
+    """Returns the current resident set size of this process in bytes, or
+    None where /proc/self/statm is not available, eg. on macOS."""
+
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * resource.getpagesize()
+
+
+def peak_rss() -> int:
+    """Returns peak resident set size of this process in bytes.
+
+    This is the high-water mark of the whole process so far, including
+    earlier scenarios, so it never falls between scenarios."""
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_scenario(
+    client,
+    rows: int,
+    columns: int,
+    pii_ratio: float,
+    quoted: bool,
+    multiline: bool,
+    trace_allocations: bool = False,
+) -> dict:
+    """Runs every stage and end-to-end entry point for one scenario.
+
+    Returns: dictionary describing the scenario and the results of each
+    stage, keyed by stage name."""
+
+    from obfuscator.csv_utils import (
+        get_field_indices,
+        obfuscate_row_lists,
+    )
+    from obfuscator.csv_bytes import rewrite_csv_bytes
+    from obfuscator.main import obfuscate_s3_object, obfuscator_parallel
+
+    key = f"bench_{rows}_{columns}_{pii_ratio}_{quoted}_{multiline}.csv"
+    data = generate_csv(rows, columns, quoted, multiline)
+    client.put_object(Bucket=BUCKET, Key=key, Body=data)
+    fields = pii_fields_for(columns, pii_ratio)
+    recorder = StageRecorder(trace_allocations)
+    size = len(data)
+
+    with recorder.stage("fetch", rows) as result:
+        body = client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+        result["bytes_out"] = len(body)
+
+    with recorder.stage("parse", rows, size) as result:
+        text = body.decode("utf-8")
+        parsed = list(csv.reader(io.StringIO(text, newline="")))
+    del text
+
+    with recorder.stage("obfuscate", rows, size):
+        indices = get_field_indices(parsed[0], fields)
+        obfuscate_row_lists(parsed[1:], indices)
+
+    with recorder.stage("serialise", rows) as result:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(parsed)
+        output = buffer.getvalue().encode("utf-8")
+        result["bytes_out"] = len(output)
+    del parsed, buffer
+
+    with recorder.stage("upload", rows, len(output)):
+        client.put_object(Bucket=BUCKET, Key="out/" + key, Body=output)
+    del output
+
+    with recorder.stage("bytes_rewrite", rows, size) as result:
+        result["bytes_out"] = len(rewrite_csv_bytes(body, fields))
+    del body
+
+    end_to_end = {
+        "streaming": lambda: obfuscate_s3_object(BUCKET, key, fields),
+        "streaming_bytes": lambda: obfuscate_s3_object(
+            BUCKET, key, fields, engine="bytes"
+        ),
+        "parallel": lambda: obfuscator_parallel(json.dumps({
+            "file_to_obfuscate": f"s3://{BUCKET}/{key}",
+            "pii_fields": fields,
+        }), range_size=1024 * 1024),
+        "parallel_processes": lambda: obfuscator_parallel(json.dumps({
+            "file_to_obfuscate": f"s3://{BUCKET}/{key}",
+            "pii_fields": fields,
+        }), range_size=1024 * 1024, processes=os.cpu_count()),
+    }
+    for name, run in end_to_end.items():
+        with recorder.stage(name, rows, size) as result:
+            result["bytes_out"] = sum(len(chunk) for chunk in run())
+
+    client.delete_object(Bucket=BUCKET, Key=key)
+    client.delete_object(Bucket=BUCKET, Key="out/" + key)
+    return {
+        "rows": rows,
+        "columns": columns,
+        "pii_ratio": pii_ratio,
+        "pii_fields": len(fields),
+        "quoted": quoted,
+        "multiline": multiline,
+        "input_bytes": size,
+        "process_peak_rss_bytes": peak_rss(),
+        "stages": recorder.stages,
+    }
+
+
+def run_benchmarks(
+    rows: list[int] = DEFAULT_ROWS,
+    columns: list[int] = DEFAULT_COLUMNS,
+    pii_ratios: list[float] = DEFAULT_PII_RATIOS,
+    quoting: list[str] = ("plain", "quoted", "multiline"),
+    trace_allocations: bool = False,
+) -> dict:
+    """Runs every combination of the given scenario parameters.
+
+    S3 is mocked in-process with moto, so fetch and upload measure the cost
+    of the client and serialisation rather than the network.
+
+    Returns: json serialisable dictionary of run metadata and results."""
+
+    from moto import mock_aws
+
+    for name in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"]:
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+
+    results = []
+    with mock_aws():
+        from obfuscator.clients import clear_s3_clients, get_s3_client
+
+        clear_s3_clients()
+        client = get_s3_client()
+        client.create_bucket(
+            Bucket=BUCKET,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        scenarios = itertools.product(rows, columns, pii_ratios, quoting)
+        for row_count, column_count, ratio, quote_mode in scenarios:
+            print(
+                f"rows={row_count} columns={column_count} "
+                f"pii_ratio={ratio} {quote_mode}",
+                file=sys.stderr,
+            )
+            results.append(run_scenario(
+                client, row_count, column_count, ratio,
+                quoted=quote_mode in ("quoted", "multiline"),
+                multiline=quote_mode == "multiline",
+                trace_allocations=trace_allocations,
+            ))
+        clear_s3_clients()
+
+    return {"metadata": run_metadata(), "results": results}
+
+
+def run_metadata() -> dict:
+    """Describes the environment and version of the code being measured."""
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def compare_results(old: dict, new: dict) -> list[str]:
+    """Compares throughput of matching scenarios & stages in two runs.
+
+    Returns: lines describing the change in rows per second of each stage,
+    eg. 'rows=10000 columns=10 pii_ratio=0.1 plain parse: 1.25x'"""
+
+    def scenario_key(result: dict) -> tuple:
+        return tuple(result[name] for name in (
+            "rows", "columns", "pii_ratio", "quoted", "multiline"
+        ))
+
+    old_results = {scenario_key(result): result for result in old["results"]}
+    lines = []
+    for result in new["results"]:
+        previous = old_results.get(scenario_key(result))
+        if previous is None:
+            continue
+        rows, columns, ratio, quoted, multiline = scenario_key(result)
+        quote_mode = "multiline" if multiline else (
+            "quoted" if quoted else "plain"
+        )
+        for stage, stats in result["stages"].items():
+            if stage not in previous["stages"]:
+                continue
+            before = previous["stages"][stage]["rows_per_second"]
+            ratio_change = stats["rows_per_second"] / before
+            lines.append(
+                f"rows={rows} columns={columns} pii_ratio={ratio} "
+                f"{quote_mode} {stage}: {ratio_change:.2f}x"
+            )
+    return lines
+
+
+def import_time_lines(module: str, count: int = 10) -> list[str]:
+    """Describes the total import time of module and its slowest imports.
+
+    Returns: lines eg. 'obfuscator.main: 245.6ms' for module and then the
+    count modules it imports which took longest, including their imports.
+    """
+
+    from obfuscator.registry import measure_import_time
+
+    times = measure_import_time(module)
+    slowest = sorted(
+        (name for name in times if name != module),
+        key=times.get, reverse=True,
+    )[:count]
+    lines = [f"{module}: {times[module] / 1000:.1f}ms"]
+    lines += [f"  {name}: {times[name] / 1000:.1f}ms" for name in slowest]
+    return lines
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument(
+        "--columns", type=int, nargs="+", default=DEFAULT_COLUMNS
+    )
+    parser.add_argument(
+        "--pii-ratios", type=float, nargs="+", default=DEFAULT_PII_RATIOS
+    )
+    parser.add_argument(
+        "--quoting", nargs="+", choices=["plain", "quoted", "multiline"],
+        default=["plain", "quoted", "multiline"],
+    )
+    parser.add_argument(
+        "--trace-allocations", action="store_true",
+        help="record peak allocations of each stage with tracemalloc",
+    )
+    parser.add_argument("--output", help="path of json file to write")
+    parser.add_argument(
+        "--compare", nargs=2, metavar=("OLD", "NEW"),
+        help="compare two saved result files instead of running",
+    )
+    parser.add_argument(
+        "--import-time", nargs="+", metavar="MODULE",
+        help="report the slowest imports of each module instead of running",
+    )
+    args = parser.parse_args(argv)
+
+    if args.import_time:
+        for module in args.import_time:
+            print("\n".join(import_time_lines(module)))
+        return
+
+    if args.compare:
+        with open(args.compare[0]) as old, open(args.compare[1]) as new:
+            print("\n".join(compare_results(json.load(old), json.load(new))))
+        return
+
+    results = run_benchmarks(
+        args.rows, args.columns, args.pii_ratios, args.quoting,
+        args.trace_allocations,
+    )
+    output = args.output
+    if output is None:
+        os.makedirs(DEFAULT_OUTPUT_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_OUTPUT_DIR, f"benchmark-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,22 @@
-from .main import obfuscator
+"""Obfuscates PII fields in csv, parquet and json files stored in S3.
+
+Importing the package is kept light for fast cold starts. The functions and
+classes below are imported, along with boto3, when they are first used, see
+obfuscator.registry."""
+
+import importlib
+
+# public names and the module each is imported from when first used
+_EXPORTS = {
+    "obfuscator": ".main",
+    "obfuscate_into": ".main",
+    "ObfuscationPlan": ".plan",
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(
+            f"module {__name__!r} has no attribute {name!r}"
+        )
+    return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
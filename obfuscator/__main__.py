@@ -0,0 +1,7 @@
+"""Allows the command line interface to be run with python -m obfuscator"""
+
+import sys
+from .cli import main
+
+
+sys.exit(main())
@@ -0,0 +1,342 @@
+"""asyncio counterparts of the obfuscator functions.
+
+boto3 has no asynchronous API, so every S3 call and read of an object body
+runs in the event loop's default thread pool executor and is awaited,
+leaving the loop free to serve other tasks. CSV records are obfuscated on
+the loop one block of rows at a time, yielding to the loop between blocks.
+Other file types are obfuscated by the synchronous streaming functions,
+each chunk being pulled in the executor.
+
+Example:
+    results = await obfuscate_many_async(json_strs, max_concurrency=200)
+"""
+
+import asyncio
+import logging
+from io import BytesIO
+from typing import AsyncIterable, AsyncIterator, Iterator
+from botocore.client import BaseClient
+from .clients import get_s3_client
+from .compression import open_decompressed, split_compression
+from .csv_utils import (
+    DEFAULT_CHUNK_SIZE,
+    MASK,
+    find_fields,
+    get_field_indices,
+    obfuscate_csv_block,
+    rows_to_csv_chunks,
+)
+from .main import (
+    get_bucket_and_key_from_string,
+    obfuscate_s3_object,
+    open_s3_object,
+    parse_request,
+)
+from .parallel import iter_record_blocks, read_header
+from .pseudonymise import Pseudonymiser
+from .s3_utils import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_PART_SIZE,
+    MIN_PART_SIZE,
+)
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# number of files obfuscated at once by obfuscate_many_async
+DEFAULT_ASYNC_CONCURRENCY = 100
+
+_END = object()
+
+
+async def obfuscator_async(
+    json_str: str,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+) -> BytesIO:
+    """Obfuscates file specified in json_str without blocking the loop.
+
+    Takes the same json string as obfuscator and returns the same output.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***
+
+    Returns: obfuscated file as a Bytes object."""
+
+    buffer = BytesIO()
+    async for chunk in obfuscator_streaming_async(
+        json_str, client=client, pseudonymiser=pseudonymiser
+    ):
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+
+async def obfuscator_streaming_async(
+    json_str: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+) -> AsyncIterator[bytes]:
+    """Obfuscates file specified in json_str, yielding output in chunks.
+
+    Compressed input is decompressed in the executor as it is read. Files
+    of other formats, or output to be compressed, are obfuscated by the
+    synchronous streaming functions in the executor.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        chunk_size(int): number of bytes read from S3 at a time.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        compression(str): optional codec to compress the output with.
+
+    Yields: bytes which together make up the obfuscated file."""
+
+    request = parse_request(json_str)
+    bucket, key, extension = get_bucket_and_key_from_string(
+        request["file_to_obfuscate"]
+    )
+    fields = request["pii_fields"]
+
+    if extension != "csv" or compression:
+        chunks = await asyncio.to_thread(
+            obfuscate_s3_object, bucket, key, fields, chunk_size, client,
+            pseudonymiser=pseudonymiser, compression=compression,
+        )
+        async for chunk in _iterate_in_thread(chunks):
+            yield chunk
+        return
+
+    body, codec = await asyncio.to_thread(open_s3_object, bucket, key, client)
+    try:
+        # reads, and so decompression and finding record boundaries, run in
+        # the executor
+        stream = open_decompressed(body, codec) if codec else body
+        blocks = _iterate_in_thread(iter_record_blocks(
+            iter(lambda: stream.read(chunk_size), b"")
+        ))
+        async for chunk in obfuscate_csv_blocks_async(
+            blocks, fields, pseudonymiser
+        ):
+            yield chunk
+    finally:
+        body.close()
+
+
+async def obfuscate_csv_blocks_async(
+    blocks: AsyncIterable[bytes],
+    fields: list[str],
+    pseudonymiser: Pseudonymiser = None,
+) -> AsyncIterator[bytes]:
+    """Obfuscates csv data arriving in blocks of whole records.
+
+    Each block is parsed and obfuscated on the event loop, control is given
+    back to the loop after every block. As in obfuscator, a utf-8 BOM is
+    dropped from the header and blank lines are left out.
+
+    Args:
+        blocks (AsyncIterable[bytes]): csv records, each block ending on a
+            record boundary, the first starting with the header.
+        fields (list[str]): list of fields that should be obfuscated.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+
+    Yields: obfuscated csv data as bytes, starting with the header."""
+
+    indices = None
+    found = []
+    async for block in blocks:
+        if indices is None:
+            # a utf-8 BOM is not part of the first field name
+            header, header_end = read_header(block, "utf-8-sig")
+            found = find_fields(header, fields)
+            indices = get_field_indices(header, found)
+            for chunk in rows_to_csv_chunks([header]):
+                yield chunk
+            block = block[header_end:]
+        if block:
+            yield obfuscate_csv_block(
+                block, indices, "utf-8", MASK, pseudonymiser, skip_blank=True
+            )
+        await asyncio.sleep(0)
+
+    # log warning if given no data to obfuscate
+    if indices is None:
+        logger.warning('No data found to obfuscate.')
+    elif found:
+        logger.info(
+            ', '.join(found) + ' fields have been successfully obfuscated'
+        )
+
+
+async def obfuscator_to_s3_async(
+    json_str: str,
+    bucket: str,
+    key: str,
+    part_size: int = DEFAULT_PART_SIZE,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+) -> dict:
+    """Obfuscates file specified in json_str and saves the output to S3.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        bucket (str): name of bucket to save obfuscated file to.
+        key (str): key to save obfuscated file to.
+        part_size (int): size in bytes of each uploaded part.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+
+    Returns: response from S3 for the completed upload, compressed if key
+    has a compression extension eg. .csv.gz"""
+
+    chunks = obfuscator_streaming_async(
+        json_str, client=client, pseudonymiser=pseudonymiser,
+        compression=split_compression(key)[1],
+    )
+    return await upload_stream_to_s3_async(
+        chunks, bucket, key, part_size=part_size, client=client
+    )
+
+
+async def obfuscate_many_async(
+    json_strs: list[str],
+    max_concurrency: int = DEFAULT_ASYNC_CONCURRENCY,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+) -> list:
+    """Obfuscates many files concurrently, at most max_concurrency at once.
+
+    S3 calls run in the loop's default executor, whose size limits how many
+    are in flight, see loop.set_default_executor.
+
+    Args:
+        json_strs (list[str]): json strings as taken by obfuscator.
+        max_concurrency (int): maximum number of files in progress at once.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+
+    Returns: list with the obfuscated Bytes object of each file, or the
+    exception raised when obfuscating it, in the order of json_strs."""
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    client = client or await asyncio.to_thread(get_s3_client)
+
+    async def obfuscate(json_str: str) -> BytesIO:
+        async with semaphore:
+            return await obfuscator_async(json_str, client, pseudonymiser)
+
+    return await asyncio.gather(
+        *(obfuscate(json_str) for json_str in json_strs),
+        return_exceptions=True,
+    )
+
+
+async def upload_stream_to_s3_async(
+    chunks: AsyncIterable[bytes],
+    bucket: str,
+    key: str,
+    part_size: int = DEFAULT_PART_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: BaseClient = None,
+) -> dict:
+    """Uploads chunks of bytes to S3 as they are produced.
+
+    Works like s3_utils.upload_stream_to_s3, uploading parts of a multipart
+    upload in the executor while the next part is produced.
+
+    Args:
+        chunks (AsyncIterable[bytes]): data to upload.
+        bucket (str): name of bucket to be written to
+        key (str): name of the key to save the file to.
+        part_size (int): size in bytes of each part, at least 5 MiB.
+        max_concurrency (int): maximum number of parts uploading at once.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: response from complete_multipart_upload or put_object."""
+
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes')
+
+    client = client or await asyncio.to_thread(get_s3_client)
+    chunks = aiter(chunks)
+    buffer = bytearray()
+
+    # fill the first part before deciding whether multipart is needed
+    async for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= part_size:
+            break
+    else:
+        return await asyncio.to_thread(
+            client.put_object, Bucket=bucket, Key=key, Body=bytes(buffer)
+        )
+
+    response = await asyncio.to_thread(
+        client.create_multipart_upload, Bucket=bucket, Key=key
+    )
+    upload_id = response["UploadId"]
+
+    async def upload(part_number: int, body: bytes) -> dict:
+        response = await asyncio.to_thread(
+            client.upload_part, Bucket=bucket, Key=key, UploadId=upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    parts = []
+    pending: list[asyncio.Task] = []
+
+    async def submit(body: bytes) -> None:
+        if len(pending) >= max_concurrency:
+            parts.append(await pending.pop(0))
+        part_number = len(parts) + len(pending) + 1
+        pending.append(asyncio.create_task(upload(part_number, body)))
+
+    try:
+        while True:
+            while len(buffer) >= part_size:
+                await submit(bytes(buffer[:part_size]))
+                del buffer[:part_size]
+            chunk = await anext(chunks, None)
+            if chunk is None:
+                break
+            buffer += chunk
+
+        if buffer:
+            await submit(bytes(buffer))
+        for task in pending:
+            parts.append(await task)
+        response = await asyncio.to_thread(
+            client.complete_multipart_upload, Bucket=bucket, Key=key,
+            UploadId=upload_id, MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        logger.error(f'Upload to s3://{bucket}/{key} failed, aborting.')
+        for task in pending:
+            task.cancel()
+        await asyncio.to_thread(
+            client.abort_multipart_upload, Bucket=bucket, Key=key,
+            UploadId=upload_id,
+        )
+        raise
+
+    logger.info(f'Uploaded {len(parts)} parts to s3://{bucket}/{key}')
+    return response
+
+
+async def _iterate_in_thread(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Pulls each item of a blocking iterator in the executor."""
+
+    while (chunk := await asyncio.to_thread(next, chunks, _END)) is not _END:
+        yield chunk
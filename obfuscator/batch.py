@@ -0,0 +1,198 @@
+"""Obfuscating many S3 objects in one call."""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Union
+from botocore.client import BaseClient
+from .cache import (
+    CACHE_METADATA_KEY,
+    find_current_output,
+    request_cache_key,
+)
+from .clients import get_s3_client
+from .compression import split_compression
+from .main import (
+    SUPPORTED_EXTENSIONS,
+    get_bucket_and_key_from_string,
+    obfuscate_s3_object,
+)
+from .parallel import bounded_map
+from .probe import check_schema, check_schema_policy
+from .s3_utils import upload_stream_to_s3
+from .exceptions import InvalidFileToObfuscate
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+DEFAULT_OUTPUT_PREFIX = "obfuscated/"
+DEFAULT_BATCH_CONCURRENCY = 8
+
+
+def obfuscate_batch(
+    files: Union[str, list[str]],
+    pii_fields: list[str],
+    output_prefix: str = DEFAULT_OUTPUT_PREFIX,
+    max_concurrency: int = DEFAULT_BATCH_CONCURRENCY,
+    client: BaseClient = None,
+    skip_unchanged: bool = False,
+    schema_policy: str = None,
+) -> list[dict]:
+    """Obfuscates many S3 objects concurrently, saving each back to S3.
+
+    Each obfuscated file is saved in the same bucket under output_prefix,
+    eg. s3://my_bucket/new_data/file1.csv is saved to
+    s3://my_bucket/obfuscated/new_data/file1.csv. A failure on one object is
+    recorded in the manifest and does not stop the others.
+
+    Args:
+        files (str | list[str]): list of S3 addresses of files, or a single
+            S3 prefix ending in / under which all supported files are
+            obfuscated eg. 's3://my_ingestion_bucket/new_data/'.
+        pii_fields (list[str]): fields to be obfuscated in every file.
+        output_prefix (str): prefix added to the key of each obfuscated file.
+        max_concurrency (int): maximum number of files processed at once.
+        client (BaseClient): optional S3 client shared by all files, defaults
+            to get_s3_client() with a large enough connection pool.
+        skip_unchanged (bool): files whose output was saved by an earlier
+            run with skip_unchanged from the same version of the file with
+            the same pii_fields are not obfuscated again, costing only two
+            HEAD requests.
+        schema_policy (str): optional, check pii_fields against the header
+            of each file before downloading it, see obfuscator.probe.
+
+    Returns: manifest with a dictionary for each file, in input order, eg.
+        {
+            "file_to_obfuscate": "s3://my_bucket/new_data/file1.csv",
+            "obfuscated_file": "s3://my_bucket/obfuscated/new_data/file1.csv",
+            "status": "success",
+        }
+        failed files have status "error" and an "error" message instead of
+        obfuscated_file, unchanged files, and files skipped by
+        schema_policy, have status "skipped"."""
+
+    if schema_policy:
+        check_schema_policy(schema_policy)
+    client = client or get_s3_client(max_pool_connections=max_concurrency)
+
+    if isinstance(files, str):
+        bucket, prefix = get_bucket_and_prefix_from_string(files)
+        files = (
+            f's3://{bucket}/{key}'
+            for key in list_s3_keys(bucket, prefix, client)
+            if not key.startswith(output_prefix)
+        )
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        manifest = list(bounded_map(
+            executor, _obfuscate_file, files, pii_fields, output_prefix,
+            client, skip_unchanged, schema_policy, window=max_concurrency,
+        ))
+
+    failed = sum(1 for entry in manifest if entry["status"] == "error")
+    logger.info(
+        f'Obfuscated {len(manifest) - failed} of {len(manifest)} files.'
+    )
+    return manifest
+
+
+def _obfuscate_file(
+    filename: str,
+    pii_fields: list[str],
+    output_prefix: str,
+    client: BaseClient,
+    skip_unchanged: bool = False,
+    schema_policy: str = None,
+) -> dict:
+    """Obfuscates one file for obfuscate_batch, returning manifest entry."""
+
+    entry = {"file_to_obfuscate": filename}
+    try:
+        bucket, key, _ = get_bucket_and_key_from_string(filename)
+        output_key = output_prefix + key
+        # compressed files are saved compressed with the same codec
+        compression = split_compression(key)[1]
+        metadata = None
+        etag = None
+        if skip_unchanged:
+            cache_key, etag = request_cache_key(
+                bucket, key, pii_fields, compression=compression,
+                client=client,
+            )
+            if find_current_output(bucket, output_key, cache_key, client):
+                entry["obfuscated_file"] = f's3://{bucket}/{output_key}'
+                entry["status"] = "skipped"
+                return entry
+            metadata = {CACHE_METADATA_KEY: cache_key}
+        encoding = "utf-8"
+        if schema_policy:
+            probe = check_schema(
+                bucket, key, pii_fields, schema_policy, client
+            )
+            if probe is None:
+                entry["status"] = "skipped"
+                return entry
+            encoding = probe.encoding
+        chunks = obfuscate_s3_object(
+            bucket, key, pii_fields, client=client, compression=compression,
+            encoding=encoding, if_match=etag,
+        )
+        upload_stream_to_s3(
+            chunks, bucket, output_key, client=client, metadata=metadata
+        )
+    except Exception as err:
+        logger.error(f'Unable to obfuscate {filename}: {err!r}')
+        entry["status"] = "error"
+        entry["error"] = repr(err)
+        return entry
+
+    entry["obfuscated_file"] = f's3://{bucket}/{output_key}'
+    entry["status"] = "success"
+    return entry
+
+
+def get_bucket_and_prefix_from_string(prefix: str) -> tuple[str]:
+    """Obtains bucket name and key prefix from S3 prefix address.
+
+    Args:
+        prefix (str): S3 prefix eg. 's3://my_ingestion_bucket/new_data/'
+
+    Returns: bucket name and key prefix as a tuple.
+        eg. ('my_ingestion_bucket', 'new_data/')"""
+
+    if not prefix.startswith('s3://'):
+        logger.error('Unable to process. Prefix should start with s3://')
+        raise InvalidFileToObfuscate
+
+    bucket, _, key_prefix = prefix[5:].partition('/')
+    if not bucket:
+        logger.error('Unable to process. Invalid prefix.')
+        raise InvalidFileToObfuscate
+
+    return bucket, key_prefix
+
+
+def list_s3_keys(
+    bucket: str, prefix: str = "", client: BaseClient = None
+) -> Iterator[str]:
+    """Lists keys of supported files in bucket under prefix.
+
+    Results are paginated so any number of objects can be listed without
+    holding every key in memory.
+
+    Args:
+        bucket (str): bucket name
+        prefix (str): only keys starting with prefix are listed.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Yields: key of each object with a supported file extension."""
+
+    client = client or get_s3_client()
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            name = split_compression(obj["Key"])[0]
+            extension = name.rpartition('.')[2].lower()
+            if extension in SUPPORTED_EXTENSIONS:
+                yield obj["Key"]
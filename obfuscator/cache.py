@@ -0,0 +1,303 @@
+"""Skipping obfuscation of S3 objects which have not changed.
+
+Retries and replays often obfuscate the same unchanged object again. A
+result is identified by a cache key made from the object's bucket, key and
+VersionId or ETag, the sorted pii_fields and how values are replaced, so the
+key can be worked out with a single HEAD request before any data is read.
+The object is then read with the ETag from that request as IfMatch, so the
+output cached under the key is always made from the version it names.
+
+Two backends are provided. DiskCache keeps obfuscated output on local disk,
+evicting the least recently used results once it grows past a maximum size.
+S3MetadataCache keeps obfuscated output as S3 objects which record their
+cache key in user metadata. Outputs saved by obfuscator_to_s3 and
+obfuscate_batch record their cache key in the same way, and
+find_current_output checks it so they are only rewritten when stale."""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING
+from .clients import get_s3_client
+from .detect import PIIDetector
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+from .s3_select import SelectQuery
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+    from botocore.exceptions import ClientError
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+DEFAULT_CACHE_PREFIX = "obfuscator-cache/"
+
+# user metadata key of obfuscated objects, sent as x-amz-meta-<key>
+CACHE_METADATA_KEY = "obfuscator-cache-key"
+
+
+def source_version(bucket: str, key: str, client: BaseClient = None) -> str:
+    """Identifies the current version of an S3 object with a HEAD request.
+
+    Args:
+        bucket (str): bucket name
+        key (str): key name
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: VersionId of the object in a versioned bucket, otherwise its
+    ETag, which changes whenever the object is overwritten."""
+
+    client = client or get_s3_client()
+    return _version(client.head_object(Bucket=bucket, Key=key))
+
+
+def make_cache_key(
+    bucket: str,
+    key: str,
+    version: str,
+    fields: list[str],
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> str:
+    """Makes the key identifying one obfuscated version of an S3 object.
+
+    Args:
+        bucket (str): bucket name
+        key (str): key name
+        version (str): VersionId or ETag from source_version.
+        fields (list[str]): fields obfuscated, in any order.
+        pseudonymiser (Pseudonymiser): optional, pseudonymiser used instead
+            of the mask, identified by its fingerprint and not its key.
+        compression (str): optional codec the output is compressed with.
+        detector (PIIDetector): optional detector of further fields.
+        redactor (Redactor): optional redactor of spans within fields.
+        select (SelectQuery): optional query of the columns and rows kept.
+
+    Returns: sha256 hex digest, safe to use as a file name or S3 key."""
+
+    mode = pseudonymiser.fingerprint() if pseudonymiser else "mask"
+    identity = [bucket, key, version, sorted(set(fields)), mode, compression]
+    if detector is not None:
+        identity.append(detector.fingerprint())
+    if redactor is not None:
+        identity.append(["redactor", redactor.fingerprint()])
+    if select is not None:
+        identity.append(["select", select.fingerprint()])
+    identity = json.dumps(identity)
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def request_cache_key(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    client: BaseClient = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> tuple[str, str]:
+    """Makes the cache key of the current version of an S3 object.
+
+    Takes the same arguments as make_cache_key, finding the version with a
+    HEAD request.
+
+    Returns: the cache key and the ETag of the version it was made from.
+    Pass the ETag as if_match to obfuscate_s3_object so the output stored
+    under the key is made from that version, even if the object is
+    overwritten in between."""
+
+    client = client or get_s3_client()
+    response = client.head_object(Bucket=bucket, Key=key)
+    cache_key = make_cache_key(
+        bucket, key, _version(response), fields, pseudonymiser, compression,
+        detector, redactor, select,
+    )
+    return cache_key, response["ETag"]
+
+
+def find_current_output(
+    bucket: str, key: str, cache_key: str, client: BaseClient = None
+) -> dict:
+    """Checks whether an output object was made from the same request.
+
+    Args:
+        bucket (str): bucket of the obfuscated output.
+        key (str): key of the obfuscated output.
+        cache_key (str): cache key of the request about to be made.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: response of the HEAD request for the output if it exists and
+    its metadata records cache_key, otherwise None."""
+
+    from botocore.exceptions import ClientError
+
+    client = client or get_s3_client()
+    try:
+        response = client.head_object(Bucket=bucket, Key=key)
+    except ClientError as err:
+        if _is_not_found(err):
+            return None
+        raise
+    if response.get("Metadata", {}).get(CACHE_METADATA_KEY) != cache_key:
+        return None
+    return response
+
+
+class ResultCache(ABC):
+    """Base class of caches of obfuscated output, keyed by cache key."""
+
+    @abstractmethod
+    def get(self, cache_key: str) -> bytes:
+        """Returns cached output for cache_key, or None if not cached."""
+
+    @abstractmethod
+    def put(self, cache_key: str, data: bytes) -> None:
+        """Stores output for cache_key."""
+
+
+class DiskCache(ResultCache):
+    """Keeps obfuscated output in files in a local directory.
+
+    Reading a result marks it as recently used. Once the files add up to
+    more than max_bytes the least recently used are deleted. Files are
+    written atomically so a directory can be shared by several processes.
+
+    Args:
+        directory (str): directory to keep results in, created if needed.
+        max_bytes (int): maximum total size of cached results.
+
+    Example:
+        cache = DiskCache("/tmp/obfuscator-cache")
+        obfuscator(json_str, cache=cache)
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, cache_key: str) -> str:
+        return os.path.join(self.directory, cache_key)
+
+    def get(self, cache_key: str) -> bytes:
+        path = self._path(cache_key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, cache_key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(cache_key))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """Deletes least recently used results until within max_bytes."""
+
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    # already evicted by another process
+                    pass
+                total -= size
+
+
+class S3MetadataCache(ResultCache):
+    """Keeps obfuscated output as objects under a prefix in S3.
+
+    Each object records its cache key in its user metadata. Old results are
+    not deleted, use an S3 lifecycle rule on prefix to expire them.
+
+    Args:
+        bucket (str): bucket to keep results in.
+        prefix (str): prefix of the key of every result.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = DEFAULT_CACHE_PREFIX,
+        client: BaseClient = None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def get(self, cache_key: str) -> bytes:
+        from botocore.exceptions import ClientError
+
+        client = self.client or get_s3_client()
+        try:
+            response = client.get_object(
+                Bucket=self.bucket, Key=self.prefix + cache_key
+            )
+        except ClientError as err:
+            if _is_not_found(err):
+                return None
+            raise
+        if response.get("Metadata", {}).get(CACHE_METADATA_KEY) != cache_key:
+            return None
+        return response["Body"].read()
+
+    def put(self, cache_key: str, data: bytes) -> None:
+        client = self.client or get_s3_client()
+        client.put_object(
+            Bucket=self.bucket,
+            Key=self.prefix + cache_key,
+            Body=data,
+            Metadata={CACHE_METADATA_KEY: cache_key},
+        )
+
+
+def _version(response: dict) -> str:
+    """Finds the VersionId, or else the ETag, in a HEAD response."""
+
+    version = response.get("VersionId")
+    if version and version != "null":
+        return version
+    return response["ETag"]
+
+
+def _is_not_found(err: ClientError) -> bool:
+    """Checks whether a ClientError is a missing object or bucket."""
+
+    code = err.response.get("Error", {}).get("Code")
+    return code in ("404", "NoSuchKey", "NotFound")
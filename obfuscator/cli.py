@@ -0,0 +1,217 @@
+"""Command line entry point for obfuscating local files, stdin and S3 objects.
+
+Input and output may each be an s3:// URI, a local path or - for stdin and
+stdout, so the obfuscator can be used in shell pipelines or to benchmark the
+engine without S3. Local files are read through a memory map and output is
+written in large buffered writes.
+
+Usage:
+    obfuscator data.csv -f name,email_address -o obfuscated.csv
+    gunzip -c data.csv.gz | obfuscator - -f name --format csv > out.csv
+    python -m obfuscator s3://bucket/data.parquet -f name -o s3://b/out.parquet
+"""
+
+import argparse
+import csv
+import logging
+import os
+import sys
+import tempfile
+from typing import Iterator
+from botocore.exceptions import BotoCoreError, ClientError
+from .compression import CODECS, split_compression
+from .csv_utils import DEFAULT_CHUNK_SIZE
+from .exceptions import InvalidFileToObfuscate, PIIFieldsNotFound
+from .main import (
+    ENGINES,
+    SUPPORTED_EXTENSIONS,
+    get_bucket_and_key_from_string,
+    obfuscate_s3_object,
+    obfuscate_stream,
+)
+from .registry import STORAGE, storage_scheme
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+STDIO = "-"
+
+
+def main(argv: list[str] = None) -> int:
+    """Runs the command line interface.
+
+    Args: argv (list[str]): optional arguments, defaults to sys.argv[1:].
+
+    Returns: exit status, 0 on success and 1 if the file could not be
+    obfuscated. Invalid arguments exit with status 2."""
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    fields = [name for name in args.fields.split(",") if name]
+    try:
+        extension, codec = detect_format(args.input, args.format)
+    except ValueError as err:
+        parser.error(str(err))
+    if is_same_file(args.input, args.output):
+        parser.error('output must not be the same file as input')
+    compression = args.compression
+    if compression is None and args.output != STDIO:
+        compression = split_compression(args.output)[1]
+
+    try:
+        chunks = obfuscate_input(
+            args.input, fields, extension, codec, compression, args.engine,
+            args.chunk_size,
+        )
+        write_output(chunks, args.output)
+    except (
+        BotoCoreError, ClientError, csv.Error, InvalidFileToObfuscate,
+        OSError, PIIFieldsNotFound, UnicodeDecodeError, ValueError,
+    ) as err:
+        print(f"{parser.prog}: error: {err}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Builds the parser of the command line arguments."""
+
+    parser = argparse.ArgumentParser(
+        prog="obfuscator", description=__doc__.splitlines()[0]
+    )
+    parser.add_argument(
+        "input", help="s3:// URI, local path or - to read from stdin"
+    )
+    parser.add_argument(
+        "-f", "--fields", required=True,
+        help="comma separated names of the fields to obfuscate",
+    )
+    parser.add_argument(
+        "-o", "--output", default=STDIO,
+        help="s3:// URI, local path or - to write to stdout (default)",
+    )
+    parser.add_argument(
+        "--format", choices=SUPPORTED_EXTENSIONS,
+        help="file format, by default from the extension of input and csv "
+        "for stdin",
+    )
+    parser.add_argument(
+        "--compression", choices=CODECS,
+        help="codec to compress the output with, by default from the "
+        "extension of output",
+    )
+    parser.add_argument("--engine", choices=ENGINES, default="csv")
+    parser.add_argument(
+        "--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+        help="approximate size in bytes of each chunk of output",
+    )
+    return parser
+
+
+def detect_format(path: str, file_format: str = None) -> tuple[str, str]:
+    """Finds the file format and compression of the input.
+
+    Args:
+        path (str): s3:// URI, local path or - for stdin.
+        file_format (str): optional format given by the user.
+
+    Returns: file format eg. 'csv' and codec eg. 'gzip', or None if the
+    input is not compressed.
+
+    Raises:
+        ValueError: if no format is given and the extension is unknown."""
+
+    name, codec = split_compression(path)
+    if path == STDIO:
+        return file_format or "csv", None
+    extension = file_format or name.rpartition('.')[2].lower()
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(
+            f'unknown format of {path}, use --format to give one of '
+            f'{", ".join(SUPPORTED_EXTENSIONS)}'
+        )
+    return extension, codec
+
+
+def obfuscate_input(
+    path: str,
+    fields: list[str],
+    extension: str,
+    codec: str = None,
+    compression: str = None,
+    engine: str = "csv",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Opens and obfuscates the input, yielding output in chunks.
+
+    Args:
+        path (str): s3:// URI, local path or - for stdin.
+        fields (list[str]): fields to obfuscate.
+        extension (str): file format, see detect_format.
+        codec (str): codec the input is compressed with, or None.
+        compression (str): codec to compress the output with, or None.
+        engine (str): "csv" or "bytes", see obfuscate_s3_object.
+        chunk_size (int): approximate size of each chunk of output.
+
+    Returns: iterator of bytes which together make up the obfuscated file.
+    """
+
+    if storage_scheme(path) == "s3":
+        bucket, key, _ = get_bucket_and_key_from_string(path)
+        return obfuscate_s3_object(
+            bucket, key, fields, chunk_size, engine=engine,
+            compression=compression,
+        )
+    if path == STDIO:
+        stream = sys.stdin.buffer
+    else:
+        stream = STORAGE.load("file").MappedFile(path)
+    # a utf-8 BOM, eg. from a spreadsheet export, is not part of the header
+    return obfuscate_stream(
+        stream, fields, extension, chunk_size, engine, codec=codec,
+        compression=compression, encoding="utf-8-sig",
+    )
+
+
+def is_same_file(input_path: str, output_path: str) -> bool:
+    """Checks whether the input and output are the same local file."""
+
+    paths = (input_path, output_path)
+    if STDIO in paths or any(storage_scheme(p) != "file" for p in paths):
+        return False
+    try:
+        return os.path.samefile(input_path, output_path)
+    except OSError:
+        # either file does not exist yet
+        return False
+
+
+def write_output(chunks: Iterator[bytes], path: str) -> None:
+    """Writes chunks to an s3:// URI, a local path or - for stdout.
+
+    Local files are written to a temporary file in the same directory which
+    replaces path once all chunks are written, so a failed run never leaves
+    a partial file behind or truncates an existing one."""
+
+    scheme = storage_scheme(path)
+    if scheme == "s3":
+        bucket, key, _ = get_bucket_and_key_from_string(path)
+        STORAGE.load(scheme).upload_stream_to_s3(chunks, bucket, key)
+    elif path == STDIO:
+        STORAGE.load(scheme).write_chunks(chunks, sys.stdout.buffer)
+    else:
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                STORAGE.load(scheme).write_chunks(chunks, out)
+            # mkstemp creates files only the owner can read
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
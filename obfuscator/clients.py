@@ -0,0 +1,116 @@
+"""Cached, thread-safe boto3 clients shared by the obfuscator's I/O functions.
+
+Creating a boto3 client resolves credentials and endpoints, loads botocore
+models and opens a new connection pool, so clients are created once per
+configuration and reused across calls and threads. boto3 is only imported
+once the first client is created, so importing the obfuscator does not
+load it."""
+
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING
+from weakref import WeakKeyDictionary
+from .parallel import DEFAULT_MAX_WORKERS
+
+if TYPE_CHECKING:
+    import boto3
+    from botocore.client import BaseClient
+
+
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 60
+
+_lock = threading.Lock()
+_clients: dict[tuple, BaseClient] = {}
+# clients of given sessions are dropped along with the session, so callers
+# creating a session per call do not keep every session alive
+_session_clients: WeakKeyDictionary[
+    boto3.session.Session, dict[tuple, BaseClient]
+] = WeakKeyDictionary()
+_injected_client: BaseClient = None
+
+
+def get_s3_client(
+    max_pool_connections: int = DEFAULT_MAX_WORKERS,
+    retry_mode: str = DEFAULT_RETRY_MODE,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    read_timeout: float = DEFAULT_READ_TIMEOUT,
+    session: boto3.session.Session = None,
+) -> BaseClient:
+    """Returns a cached S3 client, creating it on first use.
+
+    One client is kept for each combination of arguments, those created from
+    a given session only for as long as the session is referenced elsewhere.
+    If a client has been injected with set_s3_client it is returned instead.
+
+
+    Args:
+        max_pool_connections (int): size of the client's connection pool,
+            should be at least the number of threads sharing the client.
+        retry_mode (str): botocore retry mode, legacy, standard or adaptive.
+        max_attempts (int): maximum attempts for each request.
+        connect_timeout (float): seconds to wait when opening a connection.
+        read_timeout (float): seconds to wait when reading a response.
+        session (Session): optional boto3 session to create the client from,
+            defaults to a new session using the default credential chain.
+
+    Returns: boto3 S3 client which is safe to share between threads."""
+
+    if _injected_client is not None:
+        return _injected_client
+
+    cache_key = (
+        max_pool_connections, retry_mode, max_attempts, connect_timeout,
+        read_timeout,
+    )
+    clients = _clients
+    if session is not None:
+        clients = _session_clients.get(session, {})
+    client = clients.get(cache_key)
+    if client is not None:
+        return client
+
+    import boto3
+    from botocore.config import Config
+
+    with _lock:
+        if session is not None:
+            clients = _session_clients.setdefault(session, {})
+        # another thread may have created the client while waiting for lock
+        if cache_key not in clients:
+            config = Config(
+                max_pool_connections=max_pool_connections,
+                retries={"mode": retry_mode, "max_attempts": max_attempts},
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+            )
+            # boto3.client uses a shared default session which is not safe
+            # to create clients from concurrently, so always use a session
+            if session is None:
+                session = boto3.session.Session()
+            clients[cache_key] = session.client("s3", config=config)
+        return clients[cache_key]
+
+
+def set_s3_client(client: BaseClient = None) -> None:
+    """Injects a client to be returned by get_s3_client.
+
+    Args: client (BaseClient): client used for all S3 calls, or None to go
+        back to creating cached clients."""
+
+    global _injected_client
+    _injected_client = client
+
+
+def clear_s3_clients() -> None:
+    """Removes all cached and injected clients eg. after credentials change.
+    """
+
+    set_s3_client(None)
+    with _lock:
+        _clients.clear()
+        _session_clients.clear()
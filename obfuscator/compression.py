@@ -0,0 +1,169 @@
+"""Streaming compression and decompression of obfuscator input and output.
+
+Compressed objects are decompressed as they are read and output is
+compressed as it is produced, so neither is ever held uncompressed in
+memory in full. The codec is chosen from a compound extension such as
+file.csv.gz or from the Content-Encoding of the S3 object.
+
+zstd requires zstandard, which can be installed with:
+    pip install obfuscator[zstd]"""
+
+import bz2
+import gzip
+import logging
+import zlib
+from typing import BinaryIO, Iterable, Iterator
+from .registry import CODEC_LIBRARIES
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+CODECS = ['gzip', 'bz2', 'zstd']
+
+# file extensions and the codec they are compressed with
+COMPRESSION_EXTENSIONS = {
+    'gz': 'gzip',
+    'gzip': 'gzip',
+    'bz2': 'bz2',
+    'zst': 'zstd',
+    'zstd': 'zstd',
+}
+
+# values of the Content-Encoding header and the codec they refer to
+CONTENT_ENCODINGS = {
+    'gzip': 'gzip',
+    'x-gzip': 'gzip',
+    'bzip2': 'bz2',
+    'x-bzip2': 'bz2',
+    'zstd': 'zstd',
+}
+
+DEFAULT_LEVELS = {'gzip': 6, 'bz2': 9, 'zstd': 3}
+
+
+def split_compression(key: str) -> tuple[str, str]:
+    """Splits a compression extension from the end of a key.
+
+    Args: key (str): key or file name eg. 'new_data/file1.csv.gz'
+
+    Returns: key without the compression extension and the codec, or the
+    key unchanged and None if it is not compressed.
+        eg. ('new_data/file1.csv', 'gzip')"""
+
+    base, dot, extension = key.rpartition('.')
+    codec = COMPRESSION_EXTENSIONS.get(extension.lower()) if dot else None
+    if codec is None:
+        return key, None
+    return base, codec
+
+
+def codec_from_content_encoding(content_encoding: str) -> str:
+    """Finds the codec named by a Content-Encoding header, if any.
+
+    The header may list several codings eg. 'gzip,aws-chunked', codings
+    which are not compression such as aws-chunked are ignored.
+
+    Args: content_encoding (str): header value eg. 'gzip', may be None.
+
+    Returns: codec name or None if no supported codec is named."""
+
+    if not content_encoding:
+        return None
+    for coding in content_encoding.split(','):
+        codec = CONTENT_ENCODINGS.get(coding.strip().lower())
+        if codec:
+            return codec
+    return None
+
+
+def check_codec(codec: str) -> None:
+    """Raises ValueError if codec is not supported."""
+
+    if codec not in CODECS:
+        raise ValueError(f'codec must be one of {", ".join(CODECS)}')
+
+
+def open_decompressed(stream: BinaryIO, codec: str) -> BinaryIO:
+    """Wraps a stream of compressed data to be decompressed as it is read.
+
+    Concatenated gzip members, bz2 streams and zstd frames are all read.
+
+    Args:
+        stream (BinaryIO): readable binary stream eg. S3 StreamingBody.
+        codec (str): one of CODECS.
+
+    Returns: readable binary stream of the decompressed data. Closing it
+    does not close stream."""
+
+    check_codec(codec)
+    if codec == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if codec == 'bz2':
+        return bz2.BZ2File(stream, mode='rb')
+    zstandard = CODEC_LIBRARIES.load('zstd')
+    return zstandard.ZstdDecompressor().stream_reader(
+        stream, read_across_frames=True, closefd=False
+    )
+
+
+def decompress_prefix(data: bytes, codec: str) -> bytes:
+    """Decompresses as much as possible of the start of a compressed file.
+
+    Args:
+        data (bytes): first bytes of the compressed file, eg. from a ranged
+            GET, which may end part way through.
+        codec (str): one of CODECS.
+
+    Returns: the decompressed data which data holds."""
+
+    check_codec(codec)
+    if codec == 'gzip':
+        decompressor = zlib.decompressobj(31)
+    elif codec == 'bz2':
+        decompressor = bz2.BZ2Decompressor()
+    else:
+        zstandard = CODEC_LIBRARIES.load('zstd')
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    return decompressor.decompress(data)
+
+
+def make_compressor(codec: str, level: int = None):
+    """Makes an incremental compressor writing one complete stream.
+
+    Args:
+        codec (str): one of CODECS.
+        level (int): compression level, defaults to DEFAULT_LEVELS[codec].
+
+    Returns: object with compress(data) and flush() methods, as returned by
+    zlib.compressobj."""
+
+    check_codec(codec)
+    level = DEFAULT_LEVELS[codec] if level is None else level
+    if codec == 'gzip':
+        # wbits of 31 writes a gzip header and trailer
+        return zlib.compressobj(level, zlib.DEFLATED, 31)
+    if codec == 'bz2':
+        return bz2.BZ2Compressor(level)
+    zstandard = CODEC_LIBRARIES.load('zstd')
+    return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+def compress_chunks(
+    chunks: Iterable[bytes], codec: str, level: int = None
+) -> Iterator[bytes]:
+    """Compresses chunks of bytes as they are produced.
+
+    Args:
+        chunks (Iterable[bytes]): data to compress.
+        codec (str): one of CODECS.
+        level (int): compression level, defaults to DEFAULT_LEVELS[codec].
+
+    Yields: compressed data, skipping chunks the compressor buffered."""
+
+    compressor = make_compressor(codec, level)
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,203 @@
+"""Byte-level csv rewriter which obfuscates fields without full parsing.
+
+Rather than decoding, parsing and re-serialising every field, the raw utf-8
+bytes are scanned only as far as the last field to be obfuscated in each
+record. The bytes of obfuscated fields are replaced with the mask and every
+other byte range is copied through unchanged using memoryview slices, so
+non-PII data, quoting and line endings are preserved byte-for-byte."""
+
+import logging
+import re
+from typing import BinaryIO, Callable, Iterable, Iterator, Union
+from .csv_utils import (
+    DEFAULT_CHUNK_SIZE,
+    obfuscate_csv_block,
+    resolve_fields,
+)
+from .parallel import find_first_record_end, iter_record_blocks, read_header
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+MASK_BYTES = b"***"
+
+# a quoted or unquoted field followed by its delimiter or the end of data
+FIELD = re.compile(rb'("(?:[^"]|"")*"|[^,"\r\n]*)(,|\r\n|\n|\r|\Z)')
+
+
+def rewrite_csv_block(
+    block: Union[bytes, memoryview],
+    indices: list[int],
+    mask: bytes = MASK_BYTES,
+) -> bytes:
+    """Obfuscates the columns at the given indices in a block of csv records.
+
+    A drop-in replacement for csv_utils.obfuscate_csv_block which leaves all
+    other bytes untouched. The block must start and end on a record boundary
+    and should not contain the header.
+
+    Args:
+        block (bytes | memoryview): complete utf-8 csv records.
+        indices (list[int]): positions of the columns to be obfuscated.
+        mask (bytes): value to replace obfuscated fields with.
+
+    Returns: the block with obfuscated fields replaced by mask. If the block
+    is not valid csv it is obfuscated with full parsing instead."""
+
+    data = bytes(block)
+    if not indices or not data:
+        return data
+    if b'"' not in data:
+        return _rewrite_unquoted(data, indices, mask)
+    try:
+        return _rewrite_quoted(data, indices, mask)
+    except ValueError as err:
+        logger.warning(f'{err}, falling back to full csv parsing.')
+        return obfuscate_csv_block(data, indices, mask=mask.decode("utf-8"))
+
+
+def _rewrite_unquoted(data: bytes, indices: list[int], mask: bytes) -> bytes:
+    """Rewrites a block with no quotes by splitting only the needed fields.
+    """
+
+    last = indices[-1]
+    lines = data.split(b"\n")
+    for n, line in enumerate(lines):
+        if not line or line == b"\r":
+            continue
+        # only split as far as the last obfuscated field
+        fields = line.split(b",", last + 1)
+        if len(fields) > last:
+            for i in indices:
+                fields[i] = mask
+        else:
+            for i in indices:
+                if i < len(fields):
+                    fields[i] = mask
+        new_line = b",".join(fields)
+        # put back carriage return if it was on a field that was replaced
+        if line[-1:] == b"\r" and new_line[-1:] != b"\r":
+            new_line += b"\r"
+        lines[n] = new_line
+    return b"\n".join(lines)
+
+
+def _rewrite_quoted(data: bytes, indices: list[int], mask: bytes) -> bytes:
+    """Rewrites a block which may contain quoted fields with a tokenizer."""
+
+    view = memoryview(data)
+    wanted = set(indices)
+    last = indices[-1]
+    size = len(data)
+    parts = []
+    copy_from = 0
+    pos = 0
+
+    while pos < size:
+        # blank lines are not records, so are passed through unchanged
+        if data[pos:pos + 1] == b"\n":
+            pos += 1
+            continue
+        if data[pos:pos + 2] == b"\r\n":
+            pos += 2
+            continue
+        record_ended = False
+        for column in range(last + 1):
+            match = FIELD.match(data, pos)
+            if match is None or match.end() == pos and pos < size:
+                raise ValueError(f"Invalid csv data at byte {pos}")
+            if column in wanted:
+                parts.append(view[copy_from:match.start(1)])
+                parts.append(mask)
+                copy_from = match.end(1)
+            pos = match.end()
+            if match.group(2) != b",":
+                record_ended = True
+                break
+
+        if not record_ended:
+            end = find_first_record_end(data, pos)
+            pos = size if end == -1 else end
+
+    parts.append(view[copy_from:])
+    return b"".join(parts)
+
+
+def rewrite_csv_bytes(
+    data: Union[bytes, memoryview], fields: list[str], mask: bytes = MASK_BYTES
+) -> bytes:
+    """Obfuscates given fields in csv data, passing other bytes through.
+
+    Args:
+        data (bytes | memoryview): utf-8 csv data including the header.
+        fields (list[str]): list of fields that should be obfuscated.
+        mask (bytes): value to replace obfuscated fields with.
+
+    Returns: csv data with the given fields replaced by mask."""
+
+    return b"".join(rewrite_csv_blocks([bytes(data)], fields, mask))
+
+
+def rewrite_csv_stream(
+    stream: BinaryIO,
+    fields: list[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    mask: bytes = MASK_BYTES,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[bytes]:
+    """Obfuscates given fields in a binary stream of csv data.
+
+    Args:
+        stream (BinaryIO): readable binary stream eg. S3 StreamingBody.
+        fields (list[str]): list of fields that should be obfuscated.
+        chunk_size (int): number of bytes read from the stream at a time.
+        mask (bytes): value to replace obfuscated fields with.
+        field_indices (Callable): optional, resolves the header to the
+            indices of fields, see csv_utils.resolve_fields.
+
+    Yields: obfuscated csv data as bytes, starting with the header."""
+
+    blocks = iter(lambda: stream.read(chunk_size), b"")
+    yield from rewrite_csv_blocks(blocks, fields, mask, field_indices)
+
+
+def rewrite_csv_blocks(
+    blocks: Iterable[bytes],
+    fields: list[str],
+    mask: bytes = MASK_BYTES,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[bytes]:
+    """Obfuscates given fields in csv data arriving in blocks of bytes.
+
+    Args:
+        blocks (Iterable[bytes]): consecutive pieces of a csv file.
+        fields (list[str]): list of fields that should be obfuscated.
+        mask (bytes): value to replace obfuscated fields with.
+        field_indices (Callable): optional, resolves the header to the
+            indices of fields, see csv_utils.resolve_fields.
+
+    Yields: obfuscated csv data as bytes, starting with the header."""
+
+    records = iter_record_blocks(blocks)
+    first = next(records, None)
+
+    # log warning and return if given no data to obfuscate
+    if first is None:
+        logger.warning('No data found to obfuscate.')
+        return
+
+    first = bytes(first)
+    header, header_end = read_header(first, "utf-8-sig")
+    found, indices = resolve_fields(header, fields, field_indices)
+
+    yield first[:header_end]
+    yield rewrite_csv_block(first[header_end:], indices, mask)
+    for block in records:
+        yield rewrite_csv_block(block, indices, mask)
+
+    if found:
+        logger.info(
+            ', '.join(found) + ' fields have been successfully obfuscated'
+        )
@@ -1,8 +1,22 @@
 """Helper functions used by obfuscator for parsing csv files"""
 
 import logging
-from io import StringIO
-from csv import DictReader, DictWriter
+from io import StringIO, TextIOWrapper
+from csv import DictReader, DictWriter, reader, writer
+from itertools import chain, islice
+from typing import BinaryIO, Callable, Iterable, Iterator
+from .detect import PIIDetector, merge_fields
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+
+
+# size in bytes of each chunk yielded when streaming csv output
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# number of rows obfuscated together when streaming
+ROW_BATCH_SIZE = 1024
+
+MASK = "***"
 
 
 logger = logging.getLogger(__name__)
@@ -22,50 +36,108 @@ def object_body_to_list(body: str) -> list[dict]:
     return list(reader)
 
 
-def obfuscate_fields(data: list[dict], fields: list[str]) -> list[dict]:
+def obfuscate_fields(
+    data: list[dict],
+    fields: list[str],
+    pseudonymiser: Pseudonymiser = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+) -> list[dict]:
     """Takes a list of dictionaries and obfuscates all fields from given list
 
     Args:
         data (list[dict]): data as a list of dictionaries
         fields(list): list of fields that should be obfuscated.
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            from the pseudonymiser instead of ***
+        detector(PIIDetector): optional, also obfuscate fields it detects
+            as PII from their names and a sample of rows.
+        redactor(Redactor): optional, replace only the spans of PII within
+            values of its fields which are not in fields.
 
     Returns: Identical dictionary with all values on given fields to be
-    obfuscated equal to ***"""
+    obfuscated equal to *** or their token"""
 
     # log warning and return if given no data to obfuscate
     if len(data) == 0:
         logger.warning('No data found to obfuscate.')
         return []
 
-    # check which fields are present in given data
-    not_found = [field for field in fields if field not in data[0]]
-    found = [field for field in fields if field in data[0]]
+    if detector is not None:
+        header = list(data[0])
+        rows = (
+            [row.get(name) for name in header]
+            for row in islice(data, detector.max_rows)
+        )
+        fields = merge_fields(fields, detector.detect_columns(header, rows))
 
-    # log warning if any of the fields are not in given data
-    if not_found:
-        logger.warning(', '.join(not_found) + ' fields not found in data.')
+    if redactor is not None:
+        data = _redact_dicts(data, fields, redactor)
+
+    # check which fields are present in given data
+    found = find_fields(data[0], fields)
 
-    # log warning and return original data if no fields to obfuscate
+    # return original data if no fields to obfuscate
     if len(found) == 0:
-        logger.warning('No fields found to obfuscate')
         return data
 
-    # obfuscate data
+    if pseudonymiser is not None:
+        obfuscated_list = [row.copy() for row in data]
+        for field in found:
+            # tokenise the whole column at once, skipping missing values
+            rows = [
+                row for row in obfuscated_list if row.get(field) is not None
+            ]
+            tokens = pseudonymiser.tokenise([row[field] for row in rows])
+            for row, token in zip(rows, tokens):
+                row[field] = token
+        logger.info(
+            ', '.join(found) + ' fields have been successfully pseudonymised'
+        )
+        return obfuscated_list
+
+    # obfuscate data, merging in the masked values for every row at once
+    mask = dict.fromkeys(found, MASK)
+    mask_keys = mask.keys()
     obfuscated_list = []
     for row in data:
-        new_dict = {}
-        for key, value in row.items():
-            if key in fields:
-                new_dict[key] = "***"
-            else:
-                new_dict[key] = value
-        obfuscated_list.append(new_dict)
+        if mask_keys <= row.keys():
+            obfuscated_list.append(row | mask)
+        else:
+            obfuscated_list.append(
+                {key: MASK if key in mask else value
+                 for key, value in row.items()}
+            )
 
     # log obfuscated fields & return obfuscated data
     logger.info(', '.join(found) + ' fields have been successfully obfuscated')
     return obfuscated_list
 
 
+def _redact_dicts(
+    data: list[dict], fields: list[str], redactor: Redactor
+) -> list[dict]:
+    """Copies rows, redacting values of the redactor's fields not in fields.
+    """
+
+    targets = [
+        name for name in redactor.fields
+        if name in data[0] and name not in fields
+    ]
+    if not targets:
+        return data
+
+    data = [row.copy() for row in data]
+    for name in targets:
+        # redact the whole column at once, skipping missing values
+        rows = [row for row in data if row.get(name) is not None]
+        values = redactor.redact_values([row[name] for row in rows])
+        for row, value in zip(rows, values):
+            row[name] = value
+    logger.info(', '.join(targets) + ' fields have been successfully redacted')
+    return data
+
+
 def list_to_csv_streaming_object(data: list[str]) -> StringIO:
     """Converts list of dictionaries to streaming object with csv data.
 
@@ -83,3 +155,303 @@ def list_to_csv_streaming_object(data: list[str]) -> StringIO:
         writer.writerow(row)
     buffer.seek(0)  # goes to the start of StringIO object to read contents
     return buffer
+
+
+def find_fields(available: Iterable[str], fields: list[str]) -> list[str]:
+    """Checks which of the given fields are present in the available fields.
+
+    Logs a warning for any fields that are missing, and if none are present.
+
+    Args:
+        available (Iterable[str]): field names present in the data, eg. the
+            csv header or the keys of the first row.
+        fields (list[str]): fields that should be obfuscated.
+
+    Returns: list of the given fields that were found, in the given order."""
+
+    available = set(available)
+    not_found = [field for field in fields if field not in available]
+    found = [field for field in fields if field in available]
+
+    # log warning if any of the fields are not in given data
+    if not_found:
+        logger.warning(', '.join(not_found) + ' fields not found in data.')
+
+    # log warning if no fields to obfuscate
+    if len(found) == 0:
+        logger.warning('No fields found to obfuscate')
+
+    return found
+
+
+def iter_csv_rows(stream: BinaryIO, encoding: str = "utf-8") -> Iterator[list]:
+    """Lazily reads rows from a binary stream containing csv data.
+
+    The stream is decoded incrementally so only a small buffer of the file
+    is held in memory at any time.
+
+    Args:
+        stream (BinaryIO): readable binary stream eg. the Body StreamingBody
+            of an S3 object.
+        encoding (str): text encoding of the stream, defaults to utf-8.
+
+    Yields: each row of the csv as a list of strings, starting with header."""
+
+    text = TextIOWrapper(stream, encoding=encoding, newline="")
+    try:
+        yield from reader(text)
+    finally:
+        text.detach()  # leave closing the stream to the caller
+
+
+def obfuscate_rows(
+    rows: Iterable[list],
+    fields: list[str],
+    pseudonymiser: Pseudonymiser = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[list]:
+    """Obfuscates given fields in rows one at a time as they are consumed.
+
+    Args:
+        rows (Iterable[list]): csv rows as lists, the first being the header.
+        fields (list[str]): list of fields that should be obfuscated.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        detector (PIIDetector): optional, also obfuscate fields it detects
+            as PII. The first detector.max_rows rows are held in memory
+            while a sample of them is checked.
+        redactor (Redactor): optional, replace only the spans of PII within
+            values of its fields which are not in fields.
+        field_indices (Callable): optional, resolves the header to the
+            indices of fields, see resolve_fields. Not used with a detector
+            as it changes the fields of each file.
+
+    Yields: header followed by each row with values on the given fields
+    replaced with *** or their token"""
+
+    rows = iter(rows)
+    header = next(rows, None)
+
+    # log warning and return if given no data to obfuscate
+    if header is None:
+        logger.warning('No data found to obfuscate.')
+        return
+
+    if detector is not None:
+        head = list(islice(rows, detector.max_rows))
+        fields = merge_fields(fields, detector.detect_columns(header, head))
+        rows = chain(head, rows)
+        field_indices = None
+
+    found, indices = resolve_fields(header, fields, field_indices)
+    redact_indices = get_field_indices(
+        header, set(redactor.fields).difference(found)
+    ) if redactor is not None else []
+    yield header
+
+    if not indices and not redact_indices:
+        yield from rows
+        return
+
+    while batch := list(islice(rows, ROW_BATCH_SIZE)):
+        obfuscate_row_lists(batch, indices, MASK, pseudonymiser)
+        yield from redact_row_lists(batch, redact_indices, redactor)
+
+    if found:
+        logger.info(
+            ', '.join(found) + ' fields have been successfully obfuscated'
+        )
+    if redact_indices:
+        logger.info(
+            ', '.join(header[i] for i in redact_indices) +
+            ' fields have been successfully redacted'
+        )
+
+
+def rows_to_csv_chunks(
+    rows: Iterable[list],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: str = "utf-8",
+) -> Iterator[bytes]:
+    """Serialises rows to csv and yields encoded chunks as they fill up.
+
+    Args:
+        rows (Iterable[list]): csv rows as lists, the first being the header.
+        chunk_size (int): minimum size in characters of each yielded chunk,
+            the final chunk may be smaller.
+        encoding (str): encoding of the yielded bytes, defaults to utf-8.
+
+    Yields: csv data as bytes in chunks of roughly chunk_size."""
+
+    buffer = StringIO()
+    csv_writer = writer(buffer)
+    for row in rows:
+        csv_writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode(encoding)
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode(encoding)
+
+
+def obfuscate_csv_block(
+    block: bytes,
+    indices: list[int],
+    encoding: str = "utf-8",
+    mask: str = MASK,
+    pseudonymiser: Pseudonymiser = None,
+    skip_blank: bool = False,
+) -> bytes:
+    """Obfuscates the columns at the given indices in a block of csv records.
+
+    The block must start and end on a record boundary and should not contain
+    the header. Kept at module level so it can be sent to worker processes.
+
+    Args:
+        block (bytes): complete csv records without the header.
+        indices (list[int]): positions of the columns to be obfuscated.
+        encoding (str): encoding of the block, defaults to utf-8.
+        mask (str): value to replace obfuscated cells with.
+        pseudonymiser (Pseudonymiser): optional, replace cells with tokens
+            instead of mask.
+        skip_blank (bool): leave out blank lines, as obfuscator does,
+            rather than writing them as empty records.
+
+    Returns: the obfuscated records serialised as csv bytes."""
+
+    rows = list(reader(StringIO(block.decode(encoding), newline="")))
+    if skip_blank:
+        rows = [row for row in rows if row]
+    buffer = StringIO()
+    writer(buffer).writerows(
+        obfuscate_row_lists(rows, indices, mask, pseudonymiser)
+    )
+    return buffer.getvalue().encode(encoding)
+
+
+def get_field_indices(header: list[str], fields: Iterable[str]) -> list[int]:
+    """Resolves the positions in the header of the fields to be obfuscated.
+
+    Args:
+        header (list[str]): field names from the first row of the csv.
+        fields (Iterable[str]): fields that should be obfuscated.
+
+    Returns: sorted list of column indices, including every column whose
+    name is in fields if a name appears more than once."""
+
+    fields = set(fields)
+    return [i for i, name in enumerate(header) if name in fields]
+
+
+def resolve_fields(
+    header: list[str],
+    fields: list[str],
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> tuple[list[str], list[int]]:
+    """Finds which fields are in the header and the columns they are in.
+
+    Logs a warning for any fields that are missing, as find_fields does.
+
+    Args:
+        header (list[str]): field names from the first row of the csv.
+        fields (list[str]): fields that should be obfuscated.
+        field_indices (Callable): optional, returns the column indices of
+            fields in a header, eg. ObfuscationPlan.field_indices which
+            keeps those of recently seen headers.
+
+    Returns: the fields found, in the given order, and their sorted column
+    indices, see get_field_indices."""
+
+    if field_indices is None:
+        found = find_fields(header, fields)
+        return found, get_field_indices(header, found)
+
+    indices = field_indices(header)
+    names = {header[i] for i in indices}
+    found = [field for field in fields if field in names]
+    if len(found) < len(fields):
+        find_fields(header, fields)  # logs the missing fields
+    return found, indices
+
+
+def obfuscate_row_lists(
+    rows: list[list],
+    indices: list[int],
+    mask: str = MASK,
+    pseudonymiser: Pseudonymiser = None,
+) -> list[list]:
+    """Obfuscates the columns at the given indices in a batch of rows.
+
+    Works one column at a time over the whole batch so the only Python-level
+    work is one assignment per obfuscated cell, non-PII cells are not
+    touched. Rows are modified in place.
+
+    Args:
+        rows (list[list]): csv rows as lists, without the header.
+        indices (list[int]): positions of the columns to be obfuscated, see
+            get_field_indices.
+        mask (str): value to replace obfuscated cells with.
+        pseudonymiser (Pseudonymiser): optional, replace cells with tokens
+            instead of mask, tokenising each column of the batch at once.
+
+    Returns: the same list of rows, obfuscated."""
+
+    if pseudonymiser is not None:
+        return _pseudonymise_row_lists(rows, indices, pseudonymiser)
+
+    try:
+        for i in indices:
+            for row in rows:
+                row[i] = mask
+    except IndexError:
+        # some rows are shorter than the header, only mask cells present
+        for i in indices:
+            for row in rows:
+                if i < len(row):
+                    row[i] = mask
+    return rows
+
+
+def redact_row_lists(
+    rows: list[list], indices: list[int], redactor: Redactor
+) -> list[list]:
+    """Redacts spans of PII in the columns at the given indices of rows.
+
+    Like obfuscate_row_lists, works one column of the batch at a time and
+    modifies rows in place.
+
+    Args:
+        rows (list[list]): csv rows as lists, without the header.
+        indices (list[int]): positions of the columns to be redacted.
+        redactor (Redactor): redactor to replace spans of PII with.
+
+    Returns: the same list of rows, redacted."""
+
+    for i in indices:
+        targets = [row for row in rows if i < len(row)]
+        values = redactor.redact_values([row[i] for row in targets])
+        for row, value in zip(targets, values):
+            row[i] = value
+    return rows
+
+
+def _pseudonymise_row_lists(
+    rows: list[list], indices: list[int], pseudonymiser: Pseudonymiser
+) -> list[list]:
+    """Replaces cells at the given indices with tokens, column by column."""
+
+    for i in indices:
+        try:
+            targets = rows
+            tokens = pseudonymiser.tokenise([row[i] for row in rows])
+        except IndexError:
+            # some rows are shorter than the header, only replace cells present
+            targets = [row for row in rows if i < len(row)]
+            tokens = pseudonymiser.tokenise([row[i] for row in targets])
+        for row, token in zip(targets, tokens):
+            row[i] = token
+    return rows
@@ -0,0 +1,295 @@
+"""Detecting PII in fields which are not listed in pii_fields.
+
+Upstream data often gains new columns holding PII, eg. contact_email2, which
+are not named in pii_fields. A PIIDetector finds them in two ways:
+
+    by name: the field name matches a pattern such as email or postcode.
+    by content: most sampled values match a pattern such as an email
+        address, phone number, UK National Insurance number, postcode or a
+        card number which passes the Luhn check.
+
+Values are only checked for a bounded sample of rows, chosen by reservoir
+sampling from the first max_rows rows, so detection costs little compared
+to obfuscating the file. The patterns of each kind are compiled once into a
+single alternation and each value is matched against it in one pass.
+
+Example:
+    obfuscator(json_str, detector=PIIDetector())
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+from itertools import islice
+from math import exp, floor, log
+from typing import Any, Iterable
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# patterns searched for in field names, after lower casing and replacing
+# anything other than letters and digits with _
+NAME_PATTERNS = [
+    r'e_?mail',
+    r'phone|mobile|(^|_)(tel|fax)(_|\d|$)',
+    r'^(first_?|last_?|full_?|given_?|sur|family_?|middle_?|maiden_?|'
+    r'customer_?|contact_?|person_?)?name\d*$',
+    r'address',
+    r'(post|zip)_?code',
+    r'(^|_)ni_?(number|no)(_|\d|$)|national_?insurance',
+    r'(card|pan|cc)_?(number|no|num)',
+    r'(^|_)dob(_|$)|birth',
+    r'passport|ssn|social_?security|iban|sort_?code|account_?number',
+]
+
+# patterns a whole value must match, named by the kind of PII they find
+VALUE_PATTERNS = {
+    'email': r'[\w.%+-]+@[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}',
+    'card_number': r'\d(?:[ -]?\d){12,18}',
+    'ni_number': r'[a-ceghj-pr-tw-z]{2} ?\d{2} ?\d{2} ?\d{2} ?[a-d]',
+    'postcode': r'[a-z]{1,2}\d[a-z\d]? ?\d[a-z]{2}',
+    'phone': r'(?:\+\d{1,3}[ -]?|0)\d{2,4}[ -]?\d{3,4}[ -]?\d{3,4}',
+}
+
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_MAX_ROWS = 10000
+
+# fraction of non empty sampled values which must match for a field to be
+# detected
+DEFAULT_THRESHOLD = 0.5
+
+_NON_ALPHANUMERIC = re.compile(r'[^a-z0-9]+')
+
+
+def luhn_valid(number: str) -> bool:
+    """Checks the Luhn checksum of a card number.
+
+    Args: number (str): digits, other characters are ignored.
+
+    Returns: True if the checksum of the digits is valid."""
+
+    digits = [int(char) for char in number if char.isdigit()]
+    total = sum(digits[-1::-2])
+    for digit in digits[-2::-2]:
+        total += digit * 2 - 9 if digit > 4 else digit * 2
+    return total % 10 == 0
+
+
+def reservoir_sample(
+    items: Iterable, k: int, rng: random.Random = None
+) -> list:
+    """Chooses k items uniformly at random from items in a single pass.
+
+    Uses Algorithm L, which skips over items between replacements so only
+    O(k log(n / k)) random numbers are drawn for n items.
+
+    Args:
+        items (Iterable): items to sample, consumed once.
+        k (int): number of items to choose.
+        rng (Random): optional random number generator.
+
+    Returns: list of min(k, number of items) items, in no particular order.
+    """
+
+    rng = rng or random.Random()
+    items = iter(items)
+    sample = list(islice(items, k))
+    if len(sample) < k or k == 0:
+        return sample
+
+    def uniform() -> float:
+        # random() may return 0, which has no logarithm
+        return rng.random() or 5e-324
+
+    weight = exp(log(uniform()) / k)
+    while True:
+        skip = floor(log(uniform()) / log(1 - weight))
+        for item in islice(items, skip, skip + 1):
+            sample[rng.randrange(k)] = item
+            break
+        else:
+            return sample
+        weight *= exp(log(uniform()) / k)
+
+
+class PIIDetector:
+    """Finds fields holding PII from their names and a sample of values.
+
+    Args:
+        name_patterns (list[str]): regular expressions searched for in
+            normalised field names, see NAME_PATTERNS.
+        value_patterns (dict[str, str]): regular expressions values must
+            match in full, keyed by kind, see VALUE_PATTERNS. Matches of
+            the card_number kind must also pass the Luhn check.
+        sample_size (int): number of rows whose values are checked.
+        max_rows (int): number of rows at the start of the file the sample
+            is chosen from.
+        threshold (float): fraction of non empty sampled values of a field
+            which must match for it to be detected.
+        seed (int): seed for choosing the sample, so the same file always
+            gives the same fields.
+    """
+
+    def __init__(
+        self,
+        name_patterns: list[str] = NAME_PATTERNS,
+        value_patterns: dict[str, str] = VALUE_PATTERNS,
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        max_rows: int = DEFAULT_MAX_ROWS,
+        threshold: float = DEFAULT_THRESHOLD,
+        seed: int = 0,
+    ):
+        if max_rows < sample_size:
+            raise ValueError("max_rows must be at least sample_size")
+        self.name_regex = re.compile(
+            '|'.join(f'(?:{pattern})' for pattern in name_patterns)
+        ) if name_patterns else None
+        self.value_regex = re.compile(
+            '|'.join(
+                f'(?P<{kind}>{pattern})'
+                for kind, pattern in value_patterns.items()
+            ),
+            re.IGNORECASE,
+        ) if value_patterns else None
+        self.sample_size = sample_size
+        self.max_rows = max_rows
+        self.threshold = threshold
+        self.seed = seed
+
+    def fingerprint(self) -> str:
+        """Identifies the patterns and settings, eg. for cache keys."""
+
+        settings = [
+            self.name_regex and self.name_regex.pattern,
+            self.value_regex and self.value_regex.pattern,
+            self.sample_size, self.max_rows, self.threshold, self.seed,
+        ]
+        return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+    def matches_name(self, name: str) -> bool:
+        """Checks whether a field name matches any of the name patterns."""
+
+        if self.name_regex is None:
+            return False
+        normalised = _NON_ALPHANUMERIC.sub('_', name.lower()).strip('_')
+        return self.name_regex.search(normalised) is not None
+
+    def classify(self, value: str) -> str:
+        """Finds the kind of PII a value holds.
+
+        Args: value (str): value to check.
+
+        Returns: kind of the value pattern it matches eg. 'email', or None.
+        """
+
+        if self.value_regex is None:
+            return None
+        match = self.value_regex.fullmatch(value.strip())
+        if match is None:
+            return None
+        if match.lastgroup == 'card_number' and not luhn_valid(value):
+            return None
+        return match.lastgroup
+
+    def detect_columns(
+        self, header: list[str], rows: Iterable[list]
+    ) -> list[str]:
+        """Finds fields of csv rows holding PII.
+
+        Args:
+            header (list[str]): field names.
+            rows (Iterable[list]): rows after the header, at most max_rows
+                of which are read.
+
+        Returns: detected field names, in header order."""
+
+        detected = [name for name in header if self.matches_name(name)]
+        remaining = [
+            (index, name) for index, name in enumerate(header)
+            if name not in detected
+        ]
+        if not remaining or self.value_regex is None:
+            return detected
+
+        sample = reservoir_sample(
+            islice(rows, self.max_rows), self.sample_size,
+            random.Random(self.seed),
+        )
+        for index, name in remaining:
+            values = (row[index] for row in sample if index < len(row))
+            if self._mostly_pii(values):
+                detected.append(name)
+        return [name for name in header if name in detected]
+
+    def detect_records(self, records: Iterable) -> list[str]:
+        """Finds fields of json records holding PII.
+
+        Fields of nested objects are checked with dotted names eg.
+        "contact.email", so the result can be used as pii_fields.
+
+        Args: records (Iterable): parsed json records, at most max_rows of
+            which are read.
+
+        Returns: detected field names, in the order first seen."""
+
+        sample = reservoir_sample(
+            islice(records, self.max_rows), self.sample_size,
+            random.Random(self.seed),
+        )
+        values: dict[str, list] = {}
+        for record in sample:
+            for name, value in _flatten(record):
+                values.setdefault(name, []).append(value)
+
+        detected = []
+        for name, field_values in values.items():
+            if self.matches_name(name.rpartition('.')[2]):
+                detected.append(name)
+            elif self.value_regex is not None and self._mostly_pii(
+                value for value in field_values if isinstance(value, str)
+            ):
+                detected.append(name)
+        return detected
+
+    def _mostly_pii(self, values: Iterable[str]) -> bool:
+        """Checks whether enough of the non empty values hold PII."""
+
+        total = matched = 0
+        for value in values:
+            if value and not value.isspace():
+                total += 1
+                if self.classify(value) is not None:
+                    matched += 1
+        return total > 0 and matched >= total * self.threshold
+
+
+def merge_fields(fields: list[str], detected: list[str]) -> list[str]:
+    """Adds detected fields to fields, logging any which were added.
+
+    Args:
+        fields (list[str]): fields from pii_fields.
+        detected (list[str]): fields found by a PIIDetector.
+
+    Returns: fields followed by detected fields not already in fields."""
+
+    added = [name for name in detected if name not in fields]
+    if added:
+        logger.info(', '.join(added) + ' fields detected as PII.')
+    return list(fields) + added
+
+
+def _flatten(record: Any, prefix: str = '') -> Iterable[tuple[str, Any]]:
+    """Yields dotted names and values of the leaves of a json record."""
+
+    if not isinstance(record, dict):
+        return
+    for key, value in record.items():
+        name = prefix + str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name + '.')
+        else:
+            yield name, value
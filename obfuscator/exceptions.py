@@ -14,3 +14,13 @@ class InvalidFileToObfuscate(Exception):
 class NoPIIFields(Exception):
     """Traps error when pii_fields are not provided."""
     pass
+
+
+class PIIFieldsNotFound(Exception):
+    """Traps error when pii_fields are missing from the file's header."""
+    pass
+
+
+class IncompleteSelectResults(Exception):
+    """Traps error when S3 Select results end before the End event."""
+    pass
@@ -0,0 +1,190 @@
+"""Helper functions used by obfuscator for local files, in-memory buffers,
+stdin and stdout."""
+
+import io
+import logging
+import mmap
+import os
+from typing import BinaryIO, Iterable
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# size in bytes of the writes made by write_chunks
+DEFAULT_WRITE_SIZE = 1024 * 1024
+
+
+class BufferFile(io.RawIOBase):
+    """Read-only binary file-like over bytes, a bytearray or a memoryview.
+
+    Unlike BytesIO the buffer is never copied, reads take slices of it.
+
+    Args:
+        buffer (bytes | bytearray | memoryview): data to read, which must
+            not be changed while it is being read.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._position = 0
+
+    @property
+    def size(self) -> int:
+        return len(self._view)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self._position = position
+        return position
+
+    def readinto(self, buffer) -> int:
+        data = self._view[self._position:self._position + len(buffer)]
+        size = len(data)
+        memoryview(buffer).cast("B")[:size] = data
+        self._position += size
+        return size
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size is None or size < 0 else self._position + size
+        data = self._view[self._position:end].tobytes()
+        self._position += len(data)
+        return data
+
+    def readall(self) -> bytes:
+        return self.read()
+
+    def getbuffer(self) -> memoryview:
+        """Returns the whole file as a memoryview, without copying it."""
+
+        return self._view
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class MappedFile(BufferFile):
+    """Read-only binary file-like backed by a memory map of a local file.
+
+    Reads copy straight from the page cache without a system call each, and
+    getbuffer gives the whole file as a memoryview without copying it, eg.
+    for pyarrow to read a parquet file in place.
+
+    Args:
+        path (str): path of the local file.
+
+    Example:
+        with MappedFile("big.csv") as source:
+            for chunk in obfuscate_stream(source, ["name"], "csv"):
+                ...
+    """
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            # empty files cannot be mapped
+            self._map = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) if size else None
+        if self._map is not None and hasattr(self._map, "madvise"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        super().__init__(self._map if self._map is not None else b"")
+        self.name = path
+
+    def close(self) -> None:
+        if not self.closed:
+            super().close()
+            if self._map is not None:
+                self._map.close()
+
+
+class UnclosedReader(io.RawIOBase):
+    """Reads a binary stream owned by the caller, leaving it open on close.
+
+    Args:
+        stream (BinaryIO): readable binary stream eg. an HTTP request body.
+    """
+
+    def __init__(self, stream: BinaryIO):
+        super().__init__()
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self._stream.seekable()
+
+    def tell(self) -> int:
+        return self._stream.tell()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._stream.seek(offset, whence)
+
+    def readinto(self, buffer) -> int:
+        if hasattr(self._stream, "readinto"):
+            return self._stream.readinto(buffer)
+        data = self._stream.read(len(buffer))
+        memoryview(buffer).cast("B")[:len(data)] = data
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+
+def write_chunks(
+    chunks: Iterable[bytes],
+    out: BinaryIO,
+    write_size: int = DEFAULT_WRITE_SIZE,
+) -> int:
+    """Writes chunks to a binary file, joining them into large writes.
+
+    Output is often made of many small chunks, eg. one per row group or
+    64 KB of csv, so gathering them keeps the number of system calls low
+    when writing to a pipe or disk.
+
+    Args:
+        chunks (Iterable[bytes]): data to write, in order.
+        out (BinaryIO): writable binary file eg. sys.stdout.buffer.
+        write_size (int): minimum size in bytes of each write, the final
+            write may be smaller.
+
+    Returns: total number of bytes written."""
+
+    pending = []
+    pending_size = total = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        pending_size += len(chunk)
+        if pending_size >= write_size:
+            out.write(b"".join(pending))
+            total += pending_size
+            pending = []
+            pending_size = 0
+    if pending:
+        out.write(b"".join(pending))
+        total += pending_size
+    out.flush()
+    return total
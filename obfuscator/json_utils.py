@@ -0,0 +1,397 @@
+"""Helper functions used by obfuscator for parsing json and json lines files.
+
+Records are parsed incrementally from the stream and written back out as
+soon as they are obfuscated, so memory is bounded by the largest single
+record rather than the whole file. A json file may hold a top-level array
+of records, which is streamed one element at a time, or a single value."""
+
+import json
+import logging
+from io import TextIOWrapper
+from itertools import chain, islice
+from typing import Any, BinaryIO, Iterable, Iterator
+from .csv_utils import DEFAULT_CHUNK_SIZE, MASK
+from .detect import PIIDetector, merge_fields
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+from .s3_select import SelectQuery
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+JSON_LINES_EXTENSIONS = ['jsonl', 'ndjson']
+
+_decoder = json.JSONDecoder()
+_END = object()
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_lines(stream: BinaryIO, encoding: str = "utf-8") -> Iterator:
+    """Lazily parses records from a json lines stream, one per line.
+
+    Args:
+        stream (BinaryIO): readable binary stream with a json value per line.
+        encoding (str): text encoding of the stream, defaults to utf-8.
+
+    Yields: each record parsed from the stream, skipping blank lines."""
+
+    text = TextIOWrapper(stream, encoding=encoding)
+    try:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        text.detach()  # leave closing the stream to the caller
+
+
+class JsonArrayReader:
+    """Lazily parses the elements of a top-level json array from a stream.
+
+    If the stream holds a single value which is not an array, that value is
+    the only record and is_array is set to False once reading has started.
+
+    Args:
+        stream (BinaryIO): readable binary stream containing json.
+        chunk_size (int): number of characters read at a time.
+        encoding (str): text encoding of the stream, defaults to utf-8.
+
+    Attributes:
+        is_array (bool): whether the stream holds an array, None until the
+            first record has been requested."""
+
+    def __init__(
+        self,
+        stream: BinaryIO,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        encoding: str = "utf-8",
+    ):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.encoding = encoding
+        self.is_array = None
+        self._text = None
+        self._buffer = ""
+        self._position = 0
+        self._eof = False
+
+    def __iter__(self) -> Iterator:
+        self._text = TextIOWrapper(self.stream, encoding=self.encoding)
+        try:
+            yield from self._read_records()
+        finally:
+            self._text.detach()  # leave closing the stream to the caller
+
+    def _read_records(self) -> Iterator:
+        """Yields each element of the array, or the single value."""
+
+        first = self._skip_whitespace()
+        self.is_array = first == "["
+        if first == "":
+            return
+        if not self.is_array:
+            yield self._decode()
+            if self._skip_whitespace():
+                self._error("Extra data")
+            return
+
+        self._position += 1
+        if self._skip_whitespace() == "]":
+            return
+        while True:
+            yield self._decode()
+            separator = self._skip_whitespace()
+            self._position += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                self._error("Expecting ',' delimiter")
+            self._skip_whitespace()
+
+    def _fill(self, size: int = None) -> bool:
+        """Reads more of the stream into the buffer, dropping parsed text.
+
+        Args: size (int): characters to read, defaults to chunk_size.
+
+        Returns: False if the end of the stream has been reached."""
+
+        chunk = self._text.read(size or self.chunk_size)
+        self._buffer = self._buffer[self._position:] + chunk
+        self._position = 0
+        self._eof = not chunk
+        return not self._eof
+
+    def _skip_whitespace(self) -> str:
+        """Skips whitespace, returning the next character or '' at the end.
+        """
+
+        while True:
+            buffer = self._buffer
+            position = self._position
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            self._position = position
+            if position < len(buffer) or not self._fill():
+                return self._buffer[self._position:self._position + 1]
+
+    def _decode(self) -> Any:
+        """Decodes the next complete value, reading more when needed."""
+
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # double the buffer so large records are not re-parsed often
+                if not self._fill(max(self.chunk_size, len(self._buffer))):
+                    raise
+                continue
+            # a number at the end of the buffer may continue in next chunk
+            if end < len(self._buffer) or self._eof or not self._fill():
+                self._position = end
+                return value
+
+    def _error(self, message: str) -> None:
+        raise json.JSONDecodeError(message, self._buffer, self._position)
+
+
+def split_field_paths(fields: list[str]) -> list[tuple[str]]:
+    """Splits dotted field names into paths of keys into nested objects.
+
+    Args: fields (list[str]): fields eg. ["name", "contact.email"]
+
+    Returns: list of key tuples eg. [("name",), ("contact", "email")]"""
+
+    return [tuple(field.split(".")) for field in fields]
+
+
+def mask_record(
+    record: Any,
+    path: tuple[str],
+    mask: str = MASK,
+    pseudonymiser: Pseudonymiser = None,
+) -> bool:
+    """Replaces the value at the given path in a record with the mask.
+
+    Lists along the path are followed into every element, so the path
+    ("addresses", "postcode") masks the postcode of every address.
+
+    Args:
+        record (Any): parsed json record, modified in place.
+        path (tuple[str]): keys leading to the value to mask.
+        mask (str): value to replace the masked value with.
+        pseudonymiser (Pseudonymiser): optional, replace the value with its
+            token instead of mask. Null values are left as null.
+
+    Returns: True if any value was masked."""
+
+    if isinstance(record, list):
+        results = [
+            mask_record(item, path, mask, pseudonymiser) for item in record
+        ]
+        return any(results)
+    if not isinstance(record, dict) or path[0] not in record:
+        return False
+    if len(path) == 1:
+        if pseudonymiser is None:
+            record[path[0]] = mask
+        elif record[path[0]] is not None:
+            record[path[0]] = pseudonymiser.tokenise_value(record[path[0]])
+        return True
+    return mask_record(record[path[0]], path[1:], mask, pseudonymiser)
+
+
+def redact_record(record: Any, path: tuple[str], redactor: Redactor) -> None:
+    """Redacts spans of PII in the text at the given path in a record.
+
+    Lists are followed as in mask_record, and if the value is itself a list
+    each text item of it is redacted. Values other than text are left as
+    they are.
+
+    Args:
+        record (Any): parsed json record, modified in place.
+        path (tuple[str]): keys leading to the value to redact.
+        redactor (Redactor): redactor to replace spans of PII with."""
+
+    if isinstance(record, list):
+        for item in record:
+            redact_record(item, path, redactor)
+        return
+    if not isinstance(record, dict) or path[0] not in record:
+        return
+    if len(path) > 1:
+        redact_record(record[path[0]], path[1:], redactor)
+    elif isinstance(record[path[0]], list):
+        record[path[0]] = redactor.redact_values(record[path[0]])
+    else:
+        record[path[0]] = redactor.redact(record[path[0]])
+
+
+def obfuscate_records(
+    records: Iterable,
+    fields: list[str],
+    mask: str = MASK,
+    pseudonymiser: Pseudonymiser = None,
+) -> Iterator:
+    """Obfuscates given fields in records one at a time as they are consumed.
+
+    Args:
+        records (Iterable): parsed json records.
+        fields (list[str]): fields to obfuscate, with dots separating keys
+            of nested objects eg. "contact.email".
+        mask (str): value to replace obfuscated values with.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of mask.
+
+    Yields: each record with the values on the given fields masked."""
+
+    paths = split_field_paths(fields)
+    found = set()
+    for record in records:
+        for field, path in zip(fields, paths):
+            if mask_record(record, path, mask, pseudonymiser):
+                found.add(field)
+        yield record
+
+    not_found = [field for field in fields if field not in found]
+    if not_found:
+        logger.warning(', '.join(not_found) + ' fields not found in data.')
+    if found:
+        logger.info(
+            ', '.join(field for field in fields if field in found) +
+            ' fields have been successfully obfuscated'
+        )
+
+
+def records_to_json_chunks(
+    records: Iterable,
+    json_lines: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    encoding: str = "utf-8",
+) -> Iterator[bytes]:
+    """Serialises records as json and yields encoded chunks as they fill up.
+
+    Args:
+        records (Iterable): records to serialise.
+        json_lines (bool): write one record per line instead of an array.
+        chunk_size (int): minimum size in characters of each yielded chunk,
+            the final chunk may be smaller.
+        encoding (str): encoding of the yielded bytes, defaults to utf-8.
+
+    Yields: json data as bytes in chunks of roughly chunk_size."""
+
+    parts = [] if json_lines else ["["]
+    size = 0
+    separator = "\n" if json_lines else ","
+    first = True
+    for record in records:
+        if not json_lines and not first:
+            parts.append(separator)
+        text = json.dumps(record, ensure_ascii=False)
+        parts.append(text)
+        if json_lines:
+            parts.append(separator)
+        first = False
+        size += len(text) + 1
+        if size >= chunk_size:
+            yield "".join(parts).encode(encoding)
+            parts = []
+            size = 0
+
+    if not json_lines:
+        parts.append("]")
+    if parts:
+        yield "".join(parts).encode(encoding)
+
+
+def obfuscate_json_stream(
+    stream: BinaryIO,
+    fields: list[str],
+    json_lines: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    pseudonymiser: Pseudonymiser = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> Iterator[bytes]:
+    """Obfuscates given fields in a json or json lines stream.
+
+    Args:
+        stream (BinaryIO): readable binary stream eg. S3 StreamingBody.
+        fields (list[str]): fields to obfuscate, dotted for nested keys.
+        json_lines (bool): True if stream has one json record per line.
+        chunk_size (int): approximate size of each read and yielded chunk.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        detector (PIIDetector): optional, also obfuscate fields it detects
+            as PII. The first detector.max_rows records are held in memory
+            while a sample of them is checked.
+        redactor (Redactor): optional, replace only the spans of PII within
+            values of its fields which are not in fields.
+        select (SelectQuery): optional, keep only some fields or records.
+
+    Yields: obfuscated json data as bytes."""
+
+    if json_lines:
+        records = iter_json_lines(stream)
+        if select is not None:
+            records = select.filter_records(records)
+        if detector is not None:
+            fields, records = _detect_fields(records, fields, detector)
+        if redactor is not None:
+            records = _redact_records(records, fields, redactor)
+        obfuscated = obfuscate_records(records, fields, MASK, pseudonymiser)
+        yield from records_to_json_chunks(obfuscated, True, chunk_size)
+        return
+
+    reader = JsonArrayReader(stream, chunk_size)
+    records = iter(reader)
+    if select is not None:
+        records = select.filter_records(records)
+    if detector is not None:
+        fields, records = _detect_fields(records, fields, detector)
+    if redactor is not None:
+        records = _redact_records(records, fields, redactor)
+    obfuscated = obfuscate_records(records, fields, MASK, pseudonymiser)
+    first = next(obfuscated, _END)
+
+    # log warning and return if given no data to obfuscate
+    if first is _END and not reader.is_array:
+        logger.warning('No data found to obfuscate.')
+        return
+
+    # a single value which is not an array is written back on its own
+    if not reader.is_array:
+        yield json.dumps(first, ensure_ascii=False).encode("utf-8")
+        for _ in obfuscated:
+            pass  # finish so that obfuscated fields are logged
+        return
+
+    records = obfuscated if first is _END else chain([first], obfuscated)
+    yield from records_to_json_chunks(records, False, chunk_size)
+
+
+def _detect_fields(
+    records: Iterator, fields: list[str], detector: PIIDetector
+) -> tuple[list[str], Iterator]:
+    """Adds fields detected in the first records to fields.
+
+    Returns: the fields and an iterator over all of the records."""
+
+    head = list(islice(records, detector.max_rows))
+    fields = merge_fields(fields, detector.detect_records(head))
+    return fields, chain(head, records)
+
+
+def _redact_records(
+    records: Iterable, fields: list[str], redactor: Redactor
+) -> Iterator:
+    """Yields records, redacting the redactor's fields not in fields."""
+
+    paths = split_field_paths(
+        [name for name in redactor.fields if name not in fields]
+    )
+    for record in records:
+        for path in paths:
+            redact_record(record, path, redactor)
+        yield record
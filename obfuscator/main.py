@@ -1,14 +1,57 @@
 """obfuscator function and helper functions that can be used for any file type.
 """
 
-import boto3
+from __future__ import annotations
+
 import json
 import logging
+from concurrent.futures import Executor
 from io import StringIO, BytesIO
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterator, Union
+from .clients import get_s3_client
+from .cache import (
+    CACHE_METADATA_KEY,
+    ResultCache,
+    find_current_output,
+    request_cache_key,
+)
+from .compression import (
+    check_codec,
+    codec_from_content_encoding,
+    compress_chunks,
+    open_decompressed,
+    split_compression,
+)
 from .csv_utils import (
+    DEFAULT_CHUNK_SIZE,
     object_body_to_list,
     obfuscate_fields,
     list_to_csv_streaming_object,
+    iter_csv_rows,
+    obfuscate_rows,
+    rows_to_csv_chunks,
+)
+from .detect import PIIDetector
+from .file_utils import (
+    DEFAULT_WRITE_SIZE,
+    BufferFile,
+    UnclosedReader,
+    write_chunks,
+)
+from .metrics import NULL_METRICS, Metrics, StageMetrics
+from .parallel import DEFAULT_MAX_WORKERS, obfuscate_csv_blocks
+from .probe import check_schema
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+from .registry import CSV_ENGINES, FORMATS
+from .s3_select import SelectQuery, select_s3_object
+from .s3_utils import (
+    DEFAULT_PART_SIZE,
+    DEFAULT_RANGE_SIZE,
+    get_s3_object_size,
+    if_match_params,
+    iter_s3_ranges,
+    upload_stream_to_s3,
 )
 from .exceptions import (
     NoFileToObfuscate,
@@ -16,19 +59,66 @@ from .exceptions import (
     NoPIIFields,
 )
 
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+    from botocore.response import StreamingBody
+
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
-def obfuscator(json_str: str) -> BytesIO:
+SUPPORTED_EXTENSIONS = FORMATS.names()
+ENGINES = CSV_ENGINES.names()
+
+
+def obfuscator(
+    json_str: str,
+    client: BaseClient = None,
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    cache: ResultCache = None,
+    schema_policy: str = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> BytesIO:
     """Obfuscates file specified in json_str and returns as a Bytes object.
 
     Args: json_str(json string) with following keys:
         "file_to_obfuscate": s3 path to the file to be obfuscated.
         "pii_fields": fields to be obfuscated
-
-    Accesses file_to_obfuscate and returns obfuscated csv Bytes object.
+    client(BaseClient): optional S3 client, defaults to get_s3_client()
+    metrics(Metrics): optional metrics to record the time and throughput of
+        each stage in, emitted once the file has been obfuscated.
+    pseudonymiser(Pseudonymiser): optional, replace values with consistent
+        tokens instead of *** so obfuscated files can still be joined.
+    compression(str): optional codec to compress the output with, one of
+        "gzip", "bz2" or "zstd".
+    cache(ResultCache): optional cache of output, eg. DiskCache, checked
+        with a HEAD request so an unchanged file is not obfuscated again.
+        The file is then read with the ETag from that request as IfMatch,
+        so a PreconditionFailed ClientError is raised if it changes before
+        it has been read.
+    schema_policy(str): optional, check pii_fields against the header of
+        csv and parquet files before downloading them, and "fail", "warn"
+        or "skip" if they are missing, see obfuscator.probe. Skipped files
+        return None.
+    detector(PIIDetector): optional, also obfuscate fields not in
+        pii_fields which it detects as PII from their names and a sample of
+        their values.
+    redactor(Redactor): optional, replace only the spans of PII such as
+        email addresses or phone numbers within free text fields, instead
+        of the whole value, see obfuscator.redact.
+    select(SelectQuery): optional, keep only some columns or rows, which
+        for csv and json lines files are selected on S3 with S3 Select so
+        the rest are not downloaded, see obfuscator.s3_select.
+
+    Accesses file_to_obfuscate and returns obfuscated csv, parquet or json
+    Bytes object. Files compressed with gzip, bz2 or zstd, detected from an
+    extension such as file1.csv.gz or the Content-Encoding of the object,
+    are decompressed as they are read.
 
     Example:
         when invoked with the following json string:
@@ -47,7 +137,695 @@ def obfuscator(json_str: str) -> BytesIO:
         fields not included will be identical.
     """
 
-    request = json.loads(json_str)
+    metrics = metrics or NULL_METRICS
+    request = parse_request(json_str, metrics)
+    bucket, key, extension = get_bucket_and_key_from_string(
+        request["file_to_obfuscate"]
+    )
+    etag = None
+    if cache is not None:
+        cache_key, etag = request_cache_key(
+            bucket, key, request["pii_fields"], pseudonymiser, compression,
+            client, detector, redactor, select,
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logger.info(f'Using cached output for s3://{bucket}/{key}')
+            metrics.emit()
+            return BytesIO(cached)
+
+    encoding = "utf-8"
+    if schema_policy:
+        with metrics.stage("probe"):
+            probe = check_schema(
+                bucket, key, request["pii_fields"], schema_policy, client
+            )
+        if probe is None:
+            metrics.emit()
+            return None
+        encoding = probe.encoding
+
+    if extension != 'csv' or select is not None:
+        chunks = obfuscate_s3_object(
+            bucket, key, request["pii_fields"], client=client,
+            metrics=metrics, pseudonymiser=pseudonymiser,
+            compression=compression, encoding=encoding, detector=detector,
+            redactor=redactor, select=select, if_match=etag,
+        )
+        bytes_obj = BytesIO(b"".join(chunks))
+    else:
+        bytes_obj = _obfuscate_csv_in_memory(
+            bucket, key, request["pii_fields"], client, metrics,
+            pseudonymiser, compression, encoding, detector, redactor, etag,
+        )
+    if cache is not None:
+        cache.put(cache_key, bytes_obj.getvalue())
+    metrics.emit()
+    return bytes_obj
+
+
+def obfuscator_streaming(
+    json_str: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    client: BaseClient = None,
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    schema_policy: str = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> Iterator[bytes]:
+    """Obfuscates file specified in json_str, yielding output in chunks.
+
+    Takes the same json string as obfuscator. Unlike obfuscator the S3 object
+    is decoded, obfuscated and serialised one row at a time so peak memory
+    stays constant regardless of the size of the file.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        chunk_size(int): approximate size of each yielded chunk of bytes.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        metrics(Metrics): optional metrics to record each stage in, emitted
+            once the last chunk has been yielded.
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        compression(str): optional codec to compress the output with.
+        schema_policy(str): optional, check pii_fields against the header
+            before downloading the file, see obfuscator. Skipped files
+            yield nothing.
+        detector(PIIDetector): optional, also obfuscate fields it detects
+            as PII, see obfuscator.
+        redactor(Redactor): optional, replace only the spans of PII within
+            free text fields, see obfuscator.
+        select(SelectQuery): optional, keep only some columns or rows,
+            see obfuscator.
+
+    Returns: iterator of bytes which together make up the obfuscated csv.
+
+    Example:
+        with open("obfuscated.csv", "wb") as f:
+            for chunk in obfuscator_streaming(json_str):
+                f.write(chunk)
+    """
+
+    metrics = metrics or NULL_METRICS
+    request = parse_request(json_str, metrics)
+    bucket, key, _ = get_bucket_and_key_from_string(
+        request["file_to_obfuscate"]
+    )
+    encoding = "utf-8"
+    if schema_policy:
+        with metrics.stage("probe"):
+            probe = check_schema(
+                bucket, key, request["pii_fields"], schema_policy, client
+            )
+        if probe is None:
+            metrics.emit()
+            return iter(())
+        encoding = probe.encoding
+    chunks = obfuscate_s3_object(
+        bucket, key, request["pii_fields"], chunk_size, client,
+        metrics=metrics, pseudonymiser=pseudonymiser, compression=compression,
+        encoding=encoding, detector=detector, redactor=redactor,
+        select=select,
+    )
+    if not metrics.enabled:
+        return chunks
+    return _emit_when_finished(chunks, metrics)
+
+
+def obfuscate_s3_object(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    client: BaseClient = None,
+    engine: str = "csv",
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    encoding: str = "utf-8",
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+    if_match: str = None,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[bytes]:
+    """Obfuscates given S3 object, yielding output in chunks.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        fields(list[str]): list of fields that should be obfuscated.
+        chunk_size(int): approximate size of each yielded chunk of bytes.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        engine(str): "csv" to parse & re-serialise every row, or "bytes" to
+            rewrite only the obfuscated fields and copy all other bytes.
+        metrics(Metrics): optional metrics to record each stage in. They are
+            not emitted, that is left to the caller.
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***. Not supported by the bytes engine.
+        compression(str): optional codec to compress the output with, one of
+            "gzip", "bz2" or "zstd".
+        encoding(str): text encoding of csv files eg. "utf-8-sig" to drop a
+            byte order mark, as found by obfuscator.probe.
+        detector(PIIDetector): optional, also obfuscate fields it detects
+            as PII. Not supported by the bytes engine.
+        redactor(Redactor): optional, replace only the spans of PII within
+            free text fields. Not supported by the bytes engine.
+        select(SelectQuery): optional, keep only some columns or rows. For
+            csv and json lines files S3 Select is used if it is available,
+            otherwise the query is applied as the object is read. Not
+            supported by the bytes engine or for parquet files.
+        if_match(str): optional ETag the object must still have when it is
+            read, eg. the one a cache key was made from, otherwise a
+            PreconditionFailed ClientError is raised. S3 Select requests
+            cannot be made conditional, so select is applied as the object
+            is read instead.
+        field_indices(Callable): optional, resolves the header of csv files
+            to the indices of fields, eg. ObfuscationPlan.field_indices
+            which keeps those of recently seen headers.
+
+    Returns: iterator of bytes which together make up the obfuscated file.
+    The file format is detected from the extension of the key, engine only
+    applies to csv files. Objects compressed with gzip, bz2 or zstd, either
+    with a compound extension eg. file1.csv.gz or a Content-Encoding, are
+    decompressed as they are read. For json files dotted fields eg.
+    "contact.email" obfuscate keys of nested objects.
+    """
+
+    metrics = metrics or NULL_METRICS
+    extension = split_compression(key)[0].rpartition('.')[2].lower()
+    if compression:
+        check_codec(compression)
+    if extension == 'parquet':
+        if select is not None:
+            raise ValueError('select is not supported for parquet files')
+        chunks = FORMATS.load('parquet').obfuscate_s3_parquet(
+            bucket, key, fields, client, pseudonymiser, detector, redactor,
+            if_match,
+        )
+        chunks = metrics.track("obfuscate", chunks)
+    else:
+        check_engine(engine, pseudonymiser, detector, redactor, select)
+        stream = None
+        if select is not None and if_match is None:
+            with metrics.stage("s3_select"):
+                stream = select_s3_object(bucket, key, select, client)
+
+        if stream is not None:
+            # the query has already been run, and the results are utf-8
+            chunks = _stream_obfuscated_body(
+                stream, fields, chunk_size, extension, engine, metrics,
+                pseudonymiser, None, "utf-8", detector, redactor,
+                field_indices=field_indices,
+            )
+        else:
+            # object is opened before the first chunk is asked for so
+            # errors are raised straight away
+            with metrics.stage("s3_get"):
+                body, codec = open_s3_object(bucket, key, client, if_match)
+            chunks = _stream_obfuscated_body(
+                body, fields, chunk_size, extension, engine, metrics,
+                pseudonymiser, codec, encoding, detector, redactor, select,
+                field_indices,
+            )
+
+    if compression:
+        chunks = metrics.track(
+            "compress", compress_chunks(chunks, compression)
+        )
+    return chunks
+
+
+def obfuscate_stream(
+    stream: BinaryIO,
+    fields: list[str],
+    extension: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine: str = "csv",
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    codec: str = None,
+    compression: str = None,
+    encoding: str = "utf-8",
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[bytes]:
+    """Obfuscates a local file or stream, yielding output in chunks.
+
+    The counterpart of obfuscate_s3_object for data which is not in S3, eg.
+    a MappedFile of a local file or sys.stdin.buffer.
+
+    Args:
+        stream(BinaryIO): readable binary stream, closed once the last
+            chunk has been yielded. Parquet files are read with seeks, so
+            streams which are not seekable are read into memory first.
+        fields(list[str]): list of fields that should be obfuscated.
+        extension(str): file format, one of SUPPORTED_EXTENSIONS.
+        codec(str): optional codec stream is compressed with, one of
+            "gzip", "bz2" or "zstd".
+        compression(str): optional codec to compress the output with.
+        chunk_size, engine, metrics, pseudonymiser, encoding, detector,
+            redactor, select and field_indices are as for
+            obfuscate_s3_object, the query of select being applied as the
+            stream is read.
+
+    Returns: iterator of bytes which together make up the obfuscated file.
+    """
+
+    metrics = metrics or NULL_METRICS
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise ValueError(
+            f'extension must be one of {", ".join(SUPPORTED_EXTENSIONS)}'
+        )
+    for name in (codec, compression):
+        if name:
+            check_codec(name)
+    if extension == 'parquet':
+        if select is not None:
+            raise ValueError('select is not supported for parquet files')
+        if codec:
+            stream = BytesIO(open_decompressed(stream, codec).read())
+        elif not stream.seekable():
+            stream = BytesIO(stream.read())
+        chunks = metrics.track("obfuscate", _close_when_finished(
+            FORMATS.load('parquet').obfuscate_parquet(
+                stream, fields, pseudonymiser=pseudonymiser,
+                detector=detector, redactor=redactor,
+            ), stream,
+        ))
+    else:
+        check_engine(engine, pseudonymiser, detector, redactor, select)
+        chunks = _stream_obfuscated_body(
+            stream, fields, chunk_size, extension, engine, metrics,
+            pseudonymiser, codec, encoding, detector, redactor, select,
+            field_indices,
+        )
+
+    if compression:
+        chunks = metrics.track(
+            "compress", compress_chunks(chunks, compression)
+        )
+    return chunks
+
+
+def obfuscate_into(
+    source: Union[bytes, bytearray, memoryview, BinaryIO],
+    out: BinaryIO,
+    fields: list[str],
+    extension: str = "csv",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    engine: str = "csv",
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    codec: str = None,
+    compression: str = None,
+    encoding: str = "utf-8",
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+    write_size: int = DEFAULT_WRITE_SIZE,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> int:
+    """Obfuscates data already in memory or in a stream, without S3.
+
+    For services which already hold the data, eg. a Kafka consumer or an
+    HTTP upload. Bytes and memoryviews are read in place without copying,
+    and output is written to out as it is produced, so it is never held in
+    full unless out does so.
+
+    Args:
+        source (bytes | bytearray | memoryview | BinaryIO): the file, or a
+            readable binary stream of it, which is left open.
+        out (BinaryIO): writable binary file the obfuscated file is written
+            to, eg. a BytesIO or socket.makefile("wb").
+        fields(list[str]): list of fields that should be obfuscated.
+        extension(str): file format, one of SUPPORTED_EXTENSIONS.
+        metrics(Metrics): optional metrics to record each stage in, emitted
+            once the output has been written.
+        write_size(int): minimum size in bytes of each write to out.
+        chunk_size, engine, pseudonymiser, codec, compression, encoding,
+            detector, redactor, select and field_indices are as for
+            obfuscate_stream.
+
+    Returns: number of bytes written to out.
+
+    Example:
+        out = BytesIO()
+        obfuscate_into(message.value, out, ["name", "email_address"])
+    """
+
+    metrics = metrics or NULL_METRICS
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = BufferFile(source)
+    else:
+        stream = UnclosedReader(source)
+    chunks = obfuscate_stream(
+        stream, fields, extension, chunk_size, engine, metrics,
+        pseudonymiser, codec, compression, encoding, detector, redactor,
+        select, field_indices,
+    )
+    with metrics.stage("write") as stage:
+        if metrics.enabled:
+            chunks = _count_bytes_in(chunks, stage)
+        written = write_chunks(chunks, out, write_size)
+    metrics.emit()
+    return written
+
+
+def check_engine(
+    engine: str,
+    pseudonymiser: Pseudonymiser,
+    detector: PIIDetector,
+    redactor: Redactor,
+    select: SelectQuery = None,
+) -> None:
+    """Raises ValueError if engine is unknown or lacks a requested option.
+    """
+
+    if engine not in ENGINES:
+        raise ValueError(f'engine must be one of {", ".join(ENGINES)}')
+    if engine == "bytes" and pseudonymiser is not None:
+        raise ValueError('pseudonymiser is not supported by the bytes engine')
+    if engine == "bytes" and detector is not None:
+        raise ValueError('detector is not supported by the bytes engine')
+    if engine == "bytes" and redactor is not None:
+        raise ValueError('redactor is not supported by the bytes engine')
+    if engine == "bytes" and select is not None:
+        raise ValueError('select is not supported by the bytes engine')
+
+
+def obfuscator_parallel(
+    json_str: str,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    executor: Executor = None,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+    processes: int = None,
+    schema_policy: str = None,
+) -> Iterator[bytes]:
+    """Obfuscates file specified in json_str using concurrent ranged GETs.
+
+    Takes the same json string as obfuscator. The object is split into byte
+    ranges which are downloaded concurrently, re-aligned to csv record
+    boundaries and obfuscated in a pool of workers. The output is yielded in
+    the original order.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        range_size(int): number of bytes fetched by each ranged GET.
+        max_workers(int): number of concurrent downloads and workers.
+        executor(Executor): optional pool to obfuscate ranges in, eg. a
+            ProcessPoolExecutor to use all cores. Defaults to threads.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        processes(int): optional number of worker processes to obfuscate
+            ranges in instead of threads, to use more than one core.
+            max_workers is still used for downloads.
+        schema_policy(str): optional, check pii_fields against the header
+            before downloading the file, see obfuscator. The probe also
+            finds the size of the file. Skipped files yield nothing.
+
+    Returns: iterator of bytes which together make up the obfuscated csv."""
+
+    request = parse_request(json_str)
+    bucket, key, extension = get_bucket_and_key_from_string(
+        request["file_to_obfuscate"]
+    )
+    if extension != 'csv' or split_compression(key)[1]:
+        logger.error(
+            'Unable to process. Only uncompressed csv files can be split.'
+        )
+        raise InvalidFileToObfuscate
+
+    if schema_policy:
+        probe = check_schema(
+            bucket, key, request["pii_fields"], schema_policy, client
+        )
+        if probe is None:
+            return iter(())
+        size = probe.size
+    else:
+        size = get_s3_object_size(bucket, key, client)
+    ranges = iter_s3_ranges(
+        bucket, key, size, range_size, max_workers, client
+    )
+    return obfuscate_csv_blocks(
+        ranges, request["pii_fields"], max_workers, executor, pseudonymiser,
+        processes,
+    )
+
+
+def obfuscator_to_s3(
+    json_str: str,
+    bucket: str,
+    key: str,
+    part_size: int = DEFAULT_PART_SIZE,
+    client: BaseClient = None,
+    metrics: Metrics = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+    skip_unchanged: bool = False,
+    schema_policy: str = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+) -> dict:
+    """Obfuscates file specified in json_str and saves the output to S3.
+
+    Obfuscated data is uploaded in parts with a multipart upload while the
+    file is still being read, so the output is never held in memory in full
+    and is not limited to the 5 GB put_object maximum.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        bucket (str): name of bucket to save obfuscated file to.
+        key (str): key to save obfuscated file to.
+        part_size (int): size in bytes of each uploaded part.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        metrics (Metrics): optional metrics to record each stage in, emitted
+            once the upload has completed.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        compression (str): optional codec to compress the output with,
+            defaults to the codec of key's extension eg. gzip for .csv.gz
+        skip_unchanged (bool): record the request the output was made from
+            in its metadata, and if the output already exists and was made
+            from the same version of the file with the same pii_fields do
+            not obfuscate it again, costing only two HEAD requests.
+        schema_policy (str): optional, check pii_fields against the header
+            before downloading the file, see obfuscator. Nothing is saved
+            for skipped files.
+        detector (PIIDetector): optional, also obfuscate fields it detects
+            as PII, see obfuscator.
+        redactor (Redactor): optional, replace only the spans of PII within
+            free text fields, see obfuscator.
+        select (SelectQuery): optional, keep only some columns or rows, see
+            obfuscator.
+
+    Returns: response from S3 for the completed upload, from the HEAD
+    request for the existing output if it was unchanged, or None if the
+    file was skipped by schema_policy."""
+
+    metrics = metrics or NULL_METRICS
+    request = parse_request(json_str, metrics)
+    source_bucket, source_key, _ = get_bucket_and_key_from_string(
+        request["file_to_obfuscate"]
+    )
+    compression = compression or split_compression(key)[1]
+    metadata = None
+    etag = None
+    if skip_unchanged:
+        cache_key, etag = request_cache_key(
+            source_bucket, source_key, request["pii_fields"], pseudonymiser,
+            compression, client, detector, redactor, select,
+        )
+        current = find_current_output(bucket, key, cache_key, client)
+        if current is not None:
+            logger.info(f'Skipping unchanged output s3://{bucket}/{key}')
+            metrics.emit()
+            return current
+        metadata = {CACHE_METADATA_KEY: cache_key}
+
+    encoding = "utf-8"
+    if schema_policy:
+        with metrics.stage("probe"):
+            probe = check_schema(
+                source_bucket, source_key, request["pii_fields"],
+                schema_policy, client,
+            )
+        if probe is None:
+            metrics.emit()
+            return None
+        encoding = probe.encoding
+
+    chunks = obfuscate_s3_object(
+        source_bucket, source_key, request["pii_fields"], client=client,
+        metrics=metrics, pseudonymiser=pseudonymiser,
+        compression=compression, encoding=encoding, detector=detector,
+        redactor=redactor, select=select, if_match=etag,
+    )
+    with metrics.stage("upload") as stage:
+        if metrics.enabled:
+            chunks = _count_bytes_in(chunks, stage)
+        response = upload_stream_to_s3(
+            chunks, bucket, key, part_size=part_size, client=client,
+            metadata=metadata,
+        )
+    metrics.emit()
+    return response
+
+
+def _obfuscate_csv_in_memory(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    client: BaseClient,
+    metrics: Metrics,
+    pseudonymiser: Pseudonymiser,
+    compression: str,
+    encoding: str = "utf-8",
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    if_match: str = None,
+) -> BytesIO:
+    """Reads, obfuscates and writes a whole csv object at once."""
+
+    with metrics.stage("s3_get") as stage:
+        body, codec = open_s3_object(bucket, key, client, if_match)
+        if codec:
+            raw_body = open_decompressed(body, codec).read()
+        else:
+            raw_body = body.read()
+        stage.bytes_out += len(raw_body)
+    with metrics.stage("decode") as stage:
+        obj_body = raw_body.decode(encoding)
+        stage.bytes_in += len(raw_body)
+    del raw_body
+    with metrics.stage("parse") as stage:
+        data = object_body_to_list(obj_body)
+        stage.rows += len(data)
+    with metrics.stage("obfuscate") as stage:
+        obfuscated_data = obfuscate_fields(
+            data, fields, pseudonymiser, detector, redactor
+        )
+        stage.rows += len(obfuscated_data)
+    with metrics.stage("serialise") as stage:
+        obj = list_to_csv_streaming_object(obfuscated_data)
+        stage.rows += len(obfuscated_data)
+    with metrics.stage("encode") as stage:
+        bytes_obj = BytesIO(obj.getvalue().encode("utf-8"))  # to Byte obj
+        stage.bytes_out += bytes_obj.getbuffer().nbytes
+    if compression:
+        with metrics.stage("compress"):
+            chunks = compress_chunks([bytes_obj.getvalue()], compression)
+            bytes_obj = BytesIO(b"".join(chunks))
+    return bytes_obj
+
+
+def _stream_obfuscated_body(
+    body: StreamingBody,
+    fields: list[str],
+    chunk_size: int,
+    extension: str,
+    engine: str,
+    metrics: Metrics = NULL_METRICS,
+    pseudonymiser: Pseudonymiser = None,
+    codec: str = None,
+    encoding: str = "utf-8",
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    select: SelectQuery = None,
+    field_indices: Callable[[list[str]], list[int]] = None,
+) -> Iterator[bytes]:
+    """Yields obfuscated chunks from S3 body, closing it when finished.
+
+    Reads from the body are recorded as the s3_get stage, and if codec is
+    given the body is decompressed as it is read in the decompress stage.
+    For csv files parse includes decoding and serialise includes encoding,
+    as these are done incrementally together. Other formats and the bytes
+    engine are recorded as a single obfuscate stage."""
+
+    stream = metrics.track_reader("s3_get", body)
+    if codec:
+        stream = metrics.track_reader(
+            "decompress", open_decompressed(stream, codec)
+        )
+    try:
+        if extension != "csv":
+            json_lines = extension != "json"
+            chunks = FORMATS.load(extension).obfuscate_json_stream(
+                stream, fields, json_lines, chunk_size, pseudonymiser,
+                detector, redactor, select,
+            )
+            yield from metrics.track("obfuscate", chunks, source="s3_get")
+        elif engine == "bytes":
+            chunks = CSV_ENGINES.load(engine).rewrite_csv_stream(
+                stream, fields, chunk_size, field_indices=field_indices
+            )
+            yield from metrics.track("obfuscate", chunks, source="s3_get")
+        else:
+            rows = iter_csv_rows(stream, encoding)
+            rows = metrics.track("parse", rows, True)
+            if select is not None:
+                rows = select.filter_rows(rows)
+            rows = obfuscate_rows(
+                rows, fields, pseudonymiser, detector, redactor,
+                field_indices,
+            )
+            rows = metrics.track("obfuscate", rows, True)
+            chunks = rows_to_csv_chunks(rows, chunk_size)
+            yield from metrics.track("serialise", chunks)
+    finally:
+        body.close()
+
+
+def _close_when_finished(chunks: Iterator[bytes], stream: BinaryIO):
+    """Yields chunks, closing stream once they have all been yielded."""
+
+    try:
+        yield from chunks
+    finally:
+        stream.close()
+
+
+def _emit_when_finished(chunks: Iterator[bytes], metrics: Metrics):
+    """Yields chunks, emitting metrics once they have all been yielded."""
+
+    yield from chunks
+    metrics.emit()
+
+
+def _count_bytes_in(chunks: Iterator[bytes], stage: StageMetrics):
+    """Yields chunks, adding their size to the bytes in of stage."""
+
+    for chunk in chunks:
+        stage.bytes_in += len(chunk)
+        yield chunk
+
+
+def parse_request(json_str: str, metrics: Metrics = NULL_METRICS) -> dict:
+    """Parses and validates json string passed to the obfuscator.
+
+    Args:
+        json_str(json string) with file_to_obfuscate and pii_fields keys.
+        metrics(Metrics): optional metrics to record as the json_parse stage.
+
+    Returns: request as a dictionary.
+
+    Raises:
+        NoFileToObfuscate: if file_to_obfuscate is not provided.
+        NoPIIFields: if pii_fields is not provided."""
+
+    with metrics.stage("json_parse") as stage:
+        request = json.loads(json_str)
+        stage.bytes_in += len(json_str)
 
     if 'file_to_obfuscate' not in request:
         logger.error('Unable to process. Please provide file_to_obfuscate')
@@ -57,15 +835,7 @@ def obfuscator(json_str: str) -> BytesIO:
         logger.error('Unable to process. Please provide pii_fields')
         raise NoPIIFields
 
-    bucket, key, _ = get_bucket_and_key_from_string(
-        request["file_to_obfuscate"]
-    )
-    obj_body = get_s3_object(bucket, key)
-    data = object_body_to_list(obj_body)
-    obfuscated_data = obfuscate_fields(data, request["pii_fields"])
-    obj = list_to_csv_streaming_object(obfuscated_data)
-    bytes_obj = BytesIO(obj.getvalue().encode("utf-8"))  # convert to Byte obj
-    return bytes_obj
+    return request
 
 
 def get_bucket_and_key_from_string(filename: str) -> tuple[str]:
@@ -75,8 +845,10 @@ def get_bucket_and_key_from_string(filename: str) -> tuple[str]:
         filename (str): address of file in S3 bucket
         eg. 's3://my_ingestion_bucket/new_data/file1.csv'
 
-    Returns: bucket name, key name and extension as a tuple.
-        eg. ('my_ingestion_bucket', 'new_data/file1.csv', 'csv')"""
+    Returns: bucket name, key name and extension as a tuple. For compressed
+    files the extension is that of the file format.
+        eg. ('my_ingestion_bucket', 'new_data/file1.csv', 'csv')
+        eg. ('my_ingestion_bucket', 'new_data/file1.csv.gz', 'csv')"""
 
     # raise error if not s3 location
     if filename[:5] != 's3://':
@@ -85,30 +857,24 @@ def get_bucket_and_key_from_string(filename: str) -> tuple[str]:
         )
         raise InvalidFileToObfuscate
 
-    # find where the keyname starts
-    for key_start in range(5, len(filename)):
-        if filename[key_start] == '/':
-            break
-
-    # raise error if '/' not found so no keyname
-    if key_start == len(filename) - 1:
+    # bucket name ends at the first '/', raise error if there is no key
+    bucket, _, key = filename[5:].partition('/')
+    if not key:
         logging.error('Unable to process. Invalid file_to_obfuscate.')
         raise InvalidFileToObfuscate
 
-    # assign bucket & key variables
-    bucket = filename[5:key_start]
-    key = filename[key_start + 1:]
-
-    # find where the file extension starts
-    ext_start = len(filename) - 1
-    while ext_start > key_start:
-        ext_start -= 1
-        if filename[ext_start] == '.':
-            break
+    # find the file extension, skipping a compression extension
+    # eg. the format of file1.csv.gz is csv
+    name, codec = split_compression(key)
+    extension = name.rpartition('.')[2].lower()
 
-    extension = filename[ext_start + 1:].lower()
+    if codec and extension == 'parquet':
+        logging.error(
+            'Unable to process. Compressed parquet files are not supported.'
+        )
+        raise InvalidFileToObfuscate
 
-    if extension not in ['csv']:
+    if extension not in SUPPORTED_EXTENSIONS:
         logging.error(
             f'Unable to process. Files with the extension {extension}' +
             ' are currently not supported.'
@@ -118,16 +884,17 @@ def get_bucket_and_key_from_string(filename: str) -> tuple[str]:
     return bucket, key, extension
 
 
-def get_s3_object(bucket: str, key: str) -> str:
+def get_s3_object(bucket: str, key: str, client: BaseClient = None) -> str:
     """Gets body of given S3 object.
 
     Args:
         bucket(str): bucket name
         key(str): key name
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
 
     Returns: Body of the given file in string format."""
 
-    client = boto3.client("s3")
+    client = client or get_s3_client()
     s3_object = client.get_object(
         Bucket=bucket,
         Key=key,
@@ -136,16 +903,68 @@ def get_s3_object(bucket: str, key: str) -> str:
     return body.decode("utf-8")
 
 
-def save_streaming_obj_to_s3(obj: StringIO, bucket: str, key: str) -> None:
+def get_s3_object_stream(
+    bucket: str, key: str, client: BaseClient = None
+) -> StreamingBody:
+    """Opens body of given S3 object without reading it into memory.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: Body of the given file as a StreamingBody to be read lazily."""
+
+    client = client or get_s3_client()
+    s3_object = client.get_object(
+        Bucket=bucket,
+        Key=key,
+    )
+    return s3_object["Body"]
+
+
+def open_s3_object(
+    bucket: str, key: str, client: BaseClient = None, if_match: str = None
+) -> tuple[StreamingBody, str]:
+    """Opens body of given S3 object and detects how it is compressed.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        if_match(str): optional ETag the object must still have, otherwise
+            a PreconditionFailed ClientError is raised.
+
+    Returns: Body of the given file as a StreamingBody and the codec it is
+    compressed with, from the extension of key or the Content-Encoding of
+    the object, or None if it is not compressed."""
+
+    client = client or get_s3_client()
+    s3_object = client.get_object(
+        Bucket=bucket,
+        Key=key,
+        **if_match_params(if_match),
+    )
+    codec = split_compression(key)[1] or codec_from_content_encoding(
+        s3_object.get("ContentEncoding")
+    )
+    return s3_object["Body"], codec
+
+
+def save_streaming_obj_to_s3(
+    obj: StringIO, bucket: str, key: str, client: BaseClient = None
+) -> None:
     """Saves streaming object as a file in S3 bucket.
 
     Args:
         obj (StringIO): Streaming object with data to be written to S3.
         bucket (str): name of bucket to be written to
-        key (str): name of the key to save the file to."""
+        key (str): name of the key to save the file to.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+    """
 
     bytes_obj = BytesIO(obj.getvalue().encode("utf-8"))  # convert to Byte obj
-    client = boto3.client("s3")
+    client = client or get_s3_client()
     client.put_object(
         Bucket=bucket,
         Body=bytes_obj,
@@ -0,0 +1,347 @@
+"""Per-stage timing and throughput instrumentation for the obfuscator.
+
+A Metrics object records the duration, bytes in and out, rows processed and
+peak buffer size of each stage of a run (json parse, S3 GET, decode, parse,
+obfuscate, serialise, encode, upload) and passes them to an emitter when the
+run finishes. Functions take an optional metrics argument which defaults to
+NULL_METRICS, whose methods do nothing, so instrumentation costs almost
+nothing when it is not used.
+
+Example:
+    metrics = Metrics(EMFEmitter(namespace="obfuscator"))
+    obfuscator(json_str, metrics=metrics)
+"""
+
+import io
+import json
+import logging
+import socket
+import sys
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, asdict
+from typing import BinaryIO, Callable, Iterable, Iterator, TextIO
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+@dataclass
+class StageMetrics:
+    """Measurements of one stage of an obfuscator run.
+
+    Attributes:
+        stage (str): name of the stage eg. "s3_get".
+        seconds (float): time spent in the stage, excluding upstream stages.
+        bytes_in (int): bytes consumed by the stage.
+        bytes_out (int): bytes produced by the stage.
+        rows (int): number of rows or records processed.
+        peak_buffer_bytes (int): largest single chunk held by the stage."""
+
+    stage: str
+    seconds: float = 0.0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    rows: int = 0
+    peak_buffer_bytes: int = 0
+
+
+class MetricsEmitter(ABC):
+    """Interface for sending stage metrics somewhere once a run finishes."""
+
+    @abstractmethod
+    def emit(self, stages: list[StageMetrics], dimensions: dict) -> None:
+        """Sends metrics of every stage of a finished run.
+
+        Args:
+            stages (list[StageMetrics]): metrics of each stage, in order.
+            dimensions (dict): details of the run eg. {"file": "s3://..."}
+        """
+
+
+class CallbackEmitter(MetricsEmitter):
+    """Calls a function with the stages and dimensions of each run.
+
+    Args: callback (Callable): called as callback(stages, dimensions)."""
+
+    def __init__(self, callback: Callable[[list[StageMetrics], dict], None]):
+        self.callback = callback
+
+    def emit(self, stages: list[StageMetrics], dimensions: dict) -> None:
+        self.callback(stages, dimensions)
+
+
+class LoggingEmitter(MetricsEmitter):
+    """Logs a line summarising each stage at INFO level."""
+
+    def emit(self, stages: list[StageMetrics], dimensions: dict) -> None:
+        for stage in stages:
+            logger.info(
+                f'{stage.stage}: {stage.seconds:.4f}s, '
+                f'{stage.bytes_in} bytes in, {stage.bytes_out} bytes out, '
+                f'{stage.rows} rows, peak buffer {stage.peak_buffer_bytes} '
+                f'bytes {dimensions}'
+            )
+
+
+class EMFEmitter(MetricsEmitter):
+    """Writes CloudWatch Embedded Metric Format json, one line per stage.
+
+    In Lambda, lines printed to stdout are turned into CloudWatch metrics.
+
+    Args:
+        namespace (str): CloudWatch namespace of the metrics.
+        stream (TextIO): where to write, defaults to sys.stdout."""
+
+    UNITS = {
+        "seconds": "Seconds",
+        "bytes_in": "Bytes",
+        "bytes_out": "Bytes",
+        "rows": "Count",
+        "peak_buffer_bytes": "Bytes",
+    }
+
+    def __init__(self, namespace: str = "obfuscator", stream: TextIO = None):
+        self.namespace = namespace
+        self.stream = stream
+
+    def emit(self, stages: list[StageMetrics], dimensions: dict) -> None:
+        stream = self.stream or sys.stdout
+        timestamp = int(time.time() * 1000)
+        for stage in stages:
+            document = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["stage"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, unit in self.UNITS.items()
+                        ],
+                    }],
+                },
+                **dimensions,
+                **asdict(stage),
+            }
+            stream.write(json.dumps(document) + "\n")
+
+
+class StatsDEmitter(MetricsEmitter):
+    """Sends metrics as StatsD timers and counters over UDP.
+
+    Args:
+        host (str): StatsD host.
+        port (int): StatsD port.
+        prefix (str): prefix of every metric name."""
+
+    def __init__(
+        self, host: str = "localhost", port: int = 8125, prefix="obfuscator"
+    ):
+        self.address = (host, port)
+        self.prefix = prefix
+
+    def format(self, stages: list[StageMetrics]) -> list[str]:
+        """Formats stages as StatsD lines eg. obfuscator.parse.seconds:12|ms
+        """
+
+        lines = []
+        for stage in stages:
+            name = f"{self.prefix}.{stage.stage}"
+            lines.append(f"{name}.seconds:{stage.seconds * 1000:.3f}|ms")
+            lines.append(f"{name}.bytes_in:{stage.bytes_in}|c")
+            lines.append(f"{name}.bytes_out:{stage.bytes_out}|c")
+            lines.append(f"{name}.rows:{stage.rows}|c")
+            lines.append(
+                f"{name}.peak_buffer_bytes:{stage.peak_buffer_bytes}|g"
+            )
+        return lines
+
+    def emit(self, stages: list[StageMetrics], dimensions: dict) -> None:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for line in self.format(stages):
+                sock.sendto(line.encode("utf-8"), self.address)
+
+
+class Metrics:
+    """Collects metrics for the stages of one obfuscator run.
+
+    Stages may be nested, eg. pulling a chunk from the serialise stage runs
+    the obfuscate and parse stages feeding it. Each stage is only charged
+    for the time spent in its own code, the time of any stage entered while
+    it is running is charged to that stage instead. A Metrics object should
+    only be used by one run at a time.
+
+    Args:
+        emitter (MetricsEmitter): where metrics are sent by emit(), defaults
+            to LoggingEmitter.
+        **dimensions: details added to every emitted stage eg. file name."""
+
+    enabled = True
+
+    def __init__(self, emitter: MetricsEmitter = None, **dimensions):
+        self.emitter = emitter or LoggingEmitter()
+        self.dimensions = dimensions
+        self.stages: dict[str, StageMetrics] = {}
+        self._sources: dict[str, str] = {}
+        self._active: list[StageMetrics] = []
+        self._since = 0.0
+
+    def get(self, name: str) -> StageMetrics:
+        """Returns metrics for stage name, creating them on first use."""
+
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name)
+        return self.stages[name]
+
+    def _enter(self, stage: StageMetrics) -> None:
+        """Pauses the running stage, if any, and starts timing stage."""
+
+        now = time.perf_counter()
+        if self._active:
+            self._active[-1].seconds += now - self._since
+        self._active.append(stage)
+        self._since = now
+
+    def _exit(self) -> None:
+        """Stops timing the running stage and resumes the one it paused."""
+
+        now = time.perf_counter()
+        self._active.pop().seconds += now - self._since
+        self._since = now
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageMetrics]:
+        """Times the body of a with block as stage name.
+
+        Yields: the stage's StageMetrics for counts to be added to."""
+
+        stage = self.get(name)
+        self._enter(stage)
+        try:
+            yield stage
+        finally:
+            self._exit()
+
+    def track(
+        self,
+        name: str,
+        items: Iterable,
+        count_rows: bool = False,
+        source: str = None,
+    ) -> Iterator:
+        """Wraps a lazy pipeline step so time spent producing items is timed.
+
+        Args:
+            name (str): name of the stage.
+            items (Iterable): items produced by the stage.
+            count_rows (bool): count items as rows, otherwise items are
+                treated as chunks of bytes and counted as bytes out.
+            source (str): name of the stage feeding this one, whose bytes
+                out are reported as this stage's bytes in.
+
+        Yields: the same items."""
+
+        stage = self.get(name)
+        if source:
+            self._sources[name] = source
+        iterator = iter(items)
+        while True:
+            self._enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            if count_rows:
+                stage.rows += 1
+            else:
+                size = len(item)
+                stage.bytes_out += size
+                if size > stage.peak_buffer_bytes:
+                    stage.peak_buffer_bytes = size
+            yield item
+
+    def track_reader(self, name: str, stream: BinaryIO) -> BinaryIO:
+        """Wraps a binary stream so time and bytes of each read are recorded.
+
+        Args:
+            name (str): name of the stage eg. "s3_get".
+            stream (BinaryIO): stream to wrap eg. S3 StreamingBody.
+
+        Returns: readable binary stream with the same data."""
+
+        return _TrackedReader(self, self.get(name), stream)
+
+    def results(self) -> list[StageMetrics]:
+        """Returns metrics of each stage in the order they were first used.
+        """
+
+        for name, source in self._sources.items():
+            if source in self.stages:
+                self.stages[name].bytes_in = self.stages[source].bytes_out
+        return list(self.stages.values())
+
+    def emit(self) -> None:
+        """Sends the metrics of every stage to the emitter."""
+
+        self.emitter.emit(self.results(), self.dimensions)
+
+
+class _NullMetrics(Metrics):
+    """Metrics which record nothing, used when metrics are not wanted."""
+
+    enabled = False
+
+    def __init__(self):
+        self.stages = {}
+        self.dimensions = {}
+        self._null_stage = StageMetrics("null")
+
+    def stage(self, name: str):
+        return nullcontext(self._null_stage)
+
+    def track(self, name, items, count_rows=False, source=None):
+        return items
+
+    def track_reader(self, name: str, stream: BinaryIO) -> BinaryIO:
+        return stream
+
+    def emit(self) -> None:
+        pass
+
+
+NULL_METRICS = _NullMetrics()
+
+
+class _TrackedReader(io.RawIOBase):
+    """Readable stream recording time & bytes of reads from another stream.
+    """
+
+    def __init__(self, metrics: Metrics, stage: StageMetrics, stream):
+        self._metrics = metrics
+        self._stage = stage
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        self._metrics._enter(self._stage)
+        try:
+            data = self._stream.read(len(buffer))
+        finally:
+            self._metrics._exit()
+        size = len(data)
+        buffer[:size] = data
+        self._stage.bytes_out += size
+        if size > self._stage.peak_buffer_bytes:
+            self._stage.peak_buffer_bytes = size
+        return size
+
+    def close(self) -> None:
+        self._stream.close()
+        super().close()
@@ -0,0 +1,289 @@
+"""Helper functions used by obfuscator for processing csv data in parallel.
+
+Data arrives as arbitrary blocks of bytes (eg. byte ranges of an S3 object)
+which are re-aligned to record boundaries so that each block can be parsed
+and obfuscated independently by a pool of workers."""
+
+import logging
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextlib import nullcontext
+from csv import reader
+from io import StringIO
+from itertools import chain
+from typing import BinaryIO, Callable, Iterable, Iterator
+from .csv_utils import (
+    MASK,
+    find_fields,
+    get_field_indices,
+    obfuscate_csv_block,
+    rows_to_csv_chunks,
+)
+from .pseudonymise import Pseudonymiser
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+DEFAULT_MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# parsing is CPU bound so there is no benefit to more processes than cores
+DEFAULT_PROCESSES = os.cpu_count() or 1
+
+# size in bytes of the blocks of a local file sent to each worker process
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+# pseudonymiser of this worker process, installed once when it starts
+_worker_pseudonymiser: Pseudonymiser = None
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable,
+    items: Iterable,
+    *args,
+    window: int = DEFAULT_MAX_WORKERS,
+) -> Iterator:
+    """Maps fn over items using executor, yielding results in order.
+
+    Unlike Executor.map, items are consumed lazily with at most window tasks
+    pending at once, so memory stays bounded for very large inputs.
+
+    Args:
+        executor (Executor): thread or process pool to run fn in.
+        fn (Callable): function called as fn(item, *args).
+        items (Iterable): items to process.
+        window (int): maximum number of tasks submitted but not yet yielded.
+
+    Yields: result of fn for each item, in the order of items."""
+
+    pending: deque[Future] = deque()
+    try:
+        for item in items:
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            pending.append(executor.submit(fn, item, *args))
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def find_first_record_end(data: bytes, start: int = 0) -> int:
+    """Finds the end of the first csv record in data.
+
+    Args:
+        data (bytes): csv data.
+        start (int): position in data of the start of a record.
+
+    Returns: index just after the first newline not inside quotes, or -1 if
+    data does not contain a complete record."""
+
+    quotes = 0
+    while True:
+        end = data.find(b"\n", start)
+        if end == -1:
+            return -1
+        quotes += data.count(b'"', start, end)
+        if quotes % 2 == 0:
+            return end + 1
+        start = end + 1
+
+
+def find_last_record_end(data: bytes) -> int:
+    """Finds the end of the last complete csv record in data.
+
+    Quoted fields may contain newlines, so a newline is only a record
+    boundary if an even number of quotes precede it. Escaped quotes ("")
+    come in pairs so do not affect the count.
+
+    Args: data (bytes): csv data starting on a record boundary.
+
+    Returns: index just after the last newline not inside quotes, or -1 if
+    data does not contain a complete record."""
+
+    quotes_before = data.count(b'"')
+    end = len(data)
+    while True:
+        newline = data.rfind(b"\n", 0, end)
+        if newline == -1:
+            return -1
+        quotes_before -= data.count(b'"', newline, end)
+        if quotes_before % 2 == 0:
+            return newline + 1
+        end = newline
+
+
+def iter_record_blocks(blocks: Iterable[bytes]) -> Iterator[bytes]:
+    """Re-aligns arbitrary blocks of csv bytes to record boundaries.
+
+    Any partial record at the end of a block is carried over and prefixed to
+    the next, so every yielded block holds only complete records.
+
+    Args: blocks (Iterable[bytes]): consecutive pieces of a csv file.
+
+    Yields: non-empty blocks of bytes each made up of whole records."""
+
+    carry = b""
+    for block in blocks:
+        data = carry + block if carry else block
+        end = find_last_record_end(data)
+        if end == -1:
+            carry = data
+            continue
+        carry = data[end:]
+        if end:
+            yield data[:end]
+
+    if carry:
+        yield carry
+
+
+def read_header(block: bytes, encoding: str = "utf-8") -> tuple[list, int]:
+    """Parses the header from the first block of a csv file.
+
+    Args:
+        block (bytes): first block of the file, starting on the header.
+        encoding (str): encoding of the header eg. "utf-8-sig" to drop a BOM.
+
+    Returns: the header as a list of field names and the index in block
+    just after the header."""
+
+    header_end = find_first_record_end(block)
+    if header_end == -1:
+        header_end = len(block)
+    header_text = bytes(block[:header_end]).decode(encoding)
+    header = next(reader(StringIO(header_text, newline="")), [])
+    return header, header_end
+
+
+def obfuscate_csv_blocks(
+    blocks: Iterable[bytes],
+    fields: list[str],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    executor: Executor = None,
+    pseudonymiser: Pseudonymiser = None,
+    processes: int = None,
+) -> Iterator[bytes]:
+    """Obfuscates csv data arriving in blocks using a pool of workers.
+
+    Blocks are re-aligned to record boundaries, the header is read from the
+    first record and the remaining blocks are obfuscated concurrently. The
+    output is yielded in the same order as the input.
+
+    Args:
+        blocks (Iterable[bytes]): consecutive pieces of a csv file.
+        fields (list[str]): list of fields that should be obfuscated.
+        max_workers (int): number of workers if no executor is given.
+        executor (Executor): optional pool to run obfuscation in, eg. a
+            ProcessPoolExecutor. Left open for the caller to shut down.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***. With processes it is sent to each worker process
+            once, when the worker starts, and each worker keeps its own
+            token cache for every block it obfuscates. With a given process
+            pool it is instead sent with every block, so nothing is cached
+            between blocks.
+        processes (int): if given and no executor is given, obfuscate blocks
+            in this many worker processes rather than max_workers threads, so
+            parsing is not limited to one core by the GIL. Blocks are sent to
+            workers as bytes.
+
+    Yields: obfuscated csv data as bytes, starting with the header."""
+
+    records = iter_record_blocks(blocks)
+    first = next(records, None)
+
+    # log warning and return if given no data to obfuscate
+    if first is None:
+        logger.warning('No data found to obfuscate.')
+        return
+
+    # a utf-8 BOM is not part of the first field name
+    header, header_end = read_header(first, "utf-8-sig")
+    found = find_fields(header, fields)
+    indices = get_field_indices(header, found)
+    yield from rows_to_csv_chunks([header])
+
+    remaining = chain([first[header_end:]], records)
+    remaining = (block for block in remaining if block)
+    task, args = obfuscate_csv_block, (indices, "utf-8", MASK, pseudonymiser)
+    if executor is not None:
+        pool = nullcontext(executor)
+    elif processes:
+        # spawn rather than fork as the caller may be running other threads,
+        # eg. downloads, which could hold locks when forked
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_install_pseudonymiser,
+            initargs=(pseudonymiser,),
+        )
+        max_workers = processes
+        task, args = _obfuscate_block_in_worker, (indices,)
+    else:
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    with pool as pool:
+        yield from bounded_map(
+            pool, task, remaining, *args, window=max_workers * 2
+        )
+
+    if found:
+        logger.info(
+            ', '.join(found) + ' fields have been successfully obfuscated'
+        )
+
+
+def _install_pseudonymiser(pseudonymiser: Pseudonymiser) -> None:
+    """Keeps the pseudonymiser of a worker process for all of its blocks."""
+
+    global _worker_pseudonymiser
+    _worker_pseudonymiser = pseudonymiser
+
+
+def _obfuscate_block_in_worker(block: bytes, indices: list[int]) -> bytes:
+    """Obfuscates a block with the pseudonymiser installed in this worker.
+    """
+
+    return obfuscate_csv_block(
+        block, indices, "utf-8", MASK, _worker_pseudonymiser
+    )
+
+
+def obfuscate_csv_file(
+    source: BinaryIO,
+    fields: list[str],
+    processes: int = DEFAULT_PROCESSES,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    pseudonymiser: Pseudonymiser = None,
+) -> Iterator[bytes]:
+    """Obfuscates a local csv file using a pool of worker processes.
+
+    Args:
+        source (BinaryIO): csv file opened in binary mode.
+        fields (list[str]): list of fields that should be obfuscated.
+        processes (int): number of worker processes.
+        block_size (int): number of bytes read and sent to a worker at a time.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+
+    Yields: obfuscated csv data as bytes in the original order.
+
+    Example:
+        with open("big.csv", "rb") as src, open("out.csv", "wb") as out:
+            out.writelines(obfuscate_csv_file(src, ["name"], processes=16))
+    """
+
+    blocks = iter(lambda: source.read(block_size), b"")
+    yield from obfuscate_csv_blocks(
+        blocks, fields, pseudonymiser=pseudonymiser, processes=processes
+    )
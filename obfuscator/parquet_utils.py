@@ -0,0 +1,264 @@
+"""Helper functions used by obfuscator for parsing parquet files.
+
+Requires pyarrow, which can be installed with: pip install obfuscator[parquet]
+
+Parquet files are processed one row group at a time. Obfuscated columns are
+never read, they are replaced with a dictionary encoded column holding only
+the mask, so reading a file from S3 only fetches the footer and the column
+chunks of the fields which are kept."""
+
+from __future__ import annotations
+
+import io
+import logging
+from typing import TYPE_CHECKING, BinaryIO, Iterator
+from .csv_utils import MASK, find_fields
+from .detect import PIIDetector, merge_fields
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+from .s3_utils import S3RangeFile
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def _import_pyarrow():
+    """Imports pyarrow when first needed so it is not required for csv."""
+
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            'pyarrow is required for parquet files, install it with: '
+            'pip install obfuscator[parquet]'
+        ) from err
+    return pyarrow, pyarrow.parquet
+
+
+class _ChunkSink(io.RawIOBase):
+    """Writable file-like which collects written bytes until drained."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """Returns bytes written since the last drain."""
+
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def obfuscate_parquet(
+    source: BinaryIO,
+    fields: list[str],
+    mask: str = MASK,
+    pseudonymiser: Pseudonymiser = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+) -> Iterator[bytes]:
+    """Obfuscates given fields in a parquet file one row group at a time.
+
+    Args:
+        source (BinaryIO): seekable binary file-like holding the parquet file
+            eg. an open local file or S3RangeFile.
+        fields (list[str]): list of fields that should be obfuscated.
+        mask (str): value to replace obfuscated values with.
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of mask. Obfuscated columns then have to be read, and
+            each distinct value in a row group is only tokenised once.
+        detector (PIIDetector): optional, also obfuscate fields it detects
+            as PII. Values are sampled from the start of the string columns
+            whose names are not detected, so those columns are read.
+        redactor (Redactor): optional, replace only the spans of PII within
+            string columns of its fields which are not in fields. Each
+            distinct value in a row group is only redacted once.
+
+    Yields: the obfuscated parquet file as bytes, roughly one chunk for each
+    row group. Obfuscated columns have string type in the output."""
+
+    pa, pq = _import_pyarrow()
+    parquet_file = pq.ParquetFile(source)
+    schema = parquet_file.schema_arrow
+    if detector is not None:
+        fields = merge_fields(
+            fields, _detect_parquet_fields(pa, parquet_file, detector)
+        )
+    found = set(find_fields(schema.names, fields))
+    redacted = {
+        field.name for field in schema
+        if redactor is not None and field.name in redactor.fields
+        and field.name not in found
+        and (pa.types.is_string(field.type)
+             or pa.types.is_large_string(field.type))
+    }
+    if pseudonymiser is None:
+        kept = [name for name in schema.names if name not in found]
+    else:
+        kept = schema.names
+
+    mask_type = pa.dictionary(pa.int32(), pa.string())
+    out_schema = pa.schema([
+        pa.field(name, mask_type) if name in found else schema.field(name)
+        for name in schema.names
+    ], metadata=schema.metadata)
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, out_schema)
+    try:
+        for i in range(parquet_file.num_row_groups):
+            table = parquet_file.read_row_group(i, columns=kept)
+            num_rows = parquet_file.metadata.row_group(i).num_rows
+            masked = pa.DictionaryArray.from_arrays(
+                pa.repeat(pa.scalar(0, pa.int32()), num_rows),
+                pa.array([mask]),
+            )
+            columns = []
+            for name in schema.names:
+                if name in redacted:
+                    columns.append(_redact_column(
+                        pa, table.column(name), redactor
+                    ))
+                elif name not in found:
+                    columns.append(table.column(name))
+                elif pseudonymiser is None:
+                    columns.append(masked)
+                else:
+                    columns.append(_pseudonymise_column(
+                        pa, table.column(name), pseudonymiser
+                    ))
+            table = pa.Table.from_arrays(columns, schema=out_schema)
+            writer.write_table(table, row_group_size=max(num_rows, 1))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+    if found:
+        logger.info(
+            ', '.join(sorted(found)) +
+            ' fields have been successfully obfuscated'
+        )
+    if redacted:
+        logger.info(
+            ', '.join(sorted(redacted)) +
+            ' fields have been successfully redacted'
+        )
+
+
+def get_parquet_fields(source: BinaryIO) -> list[str]:
+    """Reads the field names of a parquet file from its footer.
+
+    Args: source (BinaryIO): seekable binary file-like holding the parquet
+        file eg. S3RangeFile, only the footer is read.
+
+    Returns: names of the top level fields of the file."""
+
+    _, pq = _import_pyarrow()
+    return pq.ParquetFile(source).schema_arrow.names
+
+
+def _detect_parquet_fields(pa, parquet_file, detector: PIIDetector):
+    """Detects PII fields from names and the first rows of string columns.
+    """
+
+    schema = parquet_file.schema_arrow
+    candidates = [
+        field.name for field in schema
+        if (pa.types.is_string(field.type)
+            or pa.types.is_large_string(field.type))
+        and not detector.matches_name(field.name)
+    ]
+    columns = {}
+    if candidates and parquet_file.num_row_groups:
+        batches = parquet_file.iter_batches(
+            batch_size=detector.max_rows, columns=candidates
+        )
+        batch = next(batches, None)
+        if batch is not None:
+            columns = {
+                name: batch.column(name).to_pylist() for name in candidates
+            }
+    num_rows = len(next(iter(columns.values()), []))
+    rows = (
+        [columns[name][i] if name in columns else None
+         for name in schema.names]
+        for i in range(num_rows)
+    )
+    return detector.detect_columns(schema.names, rows)
+
+
+def _pseudonymise_column(pa, column, pseudonymiser: Pseudonymiser):
+    """Replaces values of a column with tokens, tokenising distinct values.
+
+    Returns: dictionary array of tokens, null where the column was null."""
+
+    encoded = column.combine_chunks().cast(pa.string()).dictionary_encode()
+    tokens = pseudonymiser.tokenise(encoded.dictionary.to_pylist())
+    return pa.DictionaryArray.from_arrays(
+        encoded.indices.cast(pa.int32()), pa.array(tokens, pa.string())
+    )
+
+
+def _redact_column(pa, column, redactor: Redactor):
+    """Redacts values of a string column, redacting distinct values once.
+
+    Returns: array of the same type as column, null where it was null."""
+
+    encoded = column.combine_chunks().dictionary_encode()
+    values = redactor.redact_values(encoded.dictionary.to_pylist())
+    return pa.array(values, column.type).take(encoded.indices)
+
+
+def obfuscate_s3_parquet(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+    detector: PIIDetector = None,
+    redactor: Redactor = None,
+    if_match: str = None,
+) -> Iterator[bytes]:
+    """Obfuscates given fields in a parquet S3 object.
+
+    Only the footer and the column chunks of fields which are not obfuscated
+    are downloaded, using ranged GETs, unless values are pseudonymised.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        fields(list[str]): list of fields that should be obfuscated.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser(Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        detector(PIIDetector): optional, also obfuscate fields it detects
+            as PII.
+        redactor(Redactor): optional, replace only the spans of PII within
+            its fields which are not in fields.
+        if_match(str): optional ETag the object must still have, see
+            S3RangeFile.
+
+    Returns: iterator of bytes which together make up the obfuscated file."""
+
+    source = S3RangeFile(bucket, key, client, if_match=if_match)
+    return obfuscate_parquet(
+        source, fields, MASK, pseudonymiser, detector, redactor
+    )
@@ -0,0 +1,291 @@
+"""Reusable obfuscation settings for workers obfuscating many objects.
+
+obfuscator parses a json string, validates its options and resolves an S3
+client on every call. A long-running worker processing thousands of objects
+a minute with the same settings can build an ObfuscationPlan once instead.
+The plan validates its options and de-duplicates the fields when it is
+built rather than for every object. It keeps the column indices of recently
+seen csv headers, so csv objects, streams and blocks of records which share
+a header only resolve it once. Output is masked with the same constant mask
+and written with the csv module's default dialect for every object, so there
+are no writer settings left to work out per call.
+
+Example:
+    plan = ObfuscationPlan(["name", "email_address"], compression="gzip")
+    for source in sources:
+        plan.to_s3(source, "my_bucket", "obfuscated/" + source[5:] + ".gz")
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import TYPE_CHECKING, BinaryIO, Iterable, Iterator, Union
+from .compression import check_codec, split_compression
+from .csv_utils import (
+    DEFAULT_CHUNK_SIZE,
+    MASK,
+    get_field_indices,
+    obfuscate_csv_block,
+)
+from .detect import PIIDetector
+from .main import (
+    check_engine,
+    get_bucket_and_key_from_string,
+    obfuscate_into,
+    obfuscate_s3_object,
+    obfuscate_stream,
+)
+from .metrics import NULL_METRICS, Metrics
+from .probe import check_schema, check_schema_policy
+from .pseudonymise import Pseudonymiser
+from .redact import Redactor
+from .s3_select import SelectQuery
+from .s3_utils import DEFAULT_PART_SIZE, upload_stream_to_s3
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# number of distinct csv headers whose column indices a plan keeps
+DEFAULT_HEADER_CACHE_SIZE = 256
+
+
+class ObfuscationPlan:
+    """Settings for obfuscating many objects, checked and resolved once.
+
+    Args:
+        fields (Iterable[str]): fields to obfuscate in every object.
+        engine (str): "csv" or "bytes", see obfuscate_s3_object.
+        chunk_size (int): approximate size of each chunk of output.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***
+        compression (str): optional codec to compress output with. to_s3
+            defaults to the codec of the output key's extension.
+        detector (PIIDetector): optional, also obfuscate fields it detects
+            as PII, see obfuscator.
+        redactor (Redactor): optional, replace only the spans of PII within
+            free text fields, see obfuscator.
+        select (SelectQuery): optional, keep only some columns or rows, see
+            obfuscator.
+        schema_policy (str): optional, check fields against the header of
+            each object before downloading it, see obfuscator.
+
+    Raises:
+        ValueError: if an option is invalid, eg. an unknown codec or an
+            option the engine does not support."""
+
+    def __init__(
+        self,
+        fields: Iterable[str],
+        engine: str = "csv",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        client: BaseClient = None,
+        pseudonymiser: Pseudonymiser = None,
+        compression: str = None,
+        detector: PIIDetector = None,
+        redactor: Redactor = None,
+        select: SelectQuery = None,
+        schema_policy: str = None,
+    ):
+        check_engine(engine, pseudonymiser, detector, redactor, select)
+        if compression:
+            check_codec(compression)
+        if schema_policy:
+            check_schema_policy(schema_policy)
+        self.fields = list(dict.fromkeys(fields))
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.client = client
+        self.pseudonymiser = pseudonymiser
+        self.compression = compression
+        self.detector = detector
+        self.redactor = redactor
+        self.select = select
+        self.schema_policy = schema_policy
+        self._indices: OrderedDict[tuple, list[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def stream(self, source: str, metrics: Metrics = None) -> Iterator[bytes]:
+        """Obfuscates an S3 object, yielding output in chunks.
+
+        Args:
+            source (str): S3 address eg. 's3://my_bucket/new_data/file1.csv'
+            metrics (Metrics): optional metrics to record each stage in. They
+                are not emitted, that is left to the caller.
+
+        Returns: iterator of bytes which together make up the obfuscated
+        file, or nothing if the object was skipped by schema_policy."""
+
+        bucket, key, _ = get_bucket_and_key_from_string(source)
+        chunks = self._stream(bucket, key, self.compression, metrics)
+        return iter(()) if chunks is None else chunks
+
+    def obfuscate(self, source: str, metrics: Metrics = None) -> BytesIO:
+        """Obfuscates an S3 object, returning the output as a Bytes object.
+
+        Takes the same arguments as stream. Returns None if the object was
+        skipped by schema_policy."""
+
+        bucket, key, _ = get_bucket_and_key_from_string(source)
+        chunks = self._stream(bucket, key, self.compression, metrics)
+        if chunks is None:
+            return None
+        return BytesIO(b"".join(chunks))
+
+    def to_s3(
+        self,
+        source: str,
+        bucket: str,
+        key: str,
+        part_size: int = DEFAULT_PART_SIZE,
+        metrics: Metrics = None,
+    ) -> dict:
+        """Obfuscates an S3 object and saves the output to S3.
+
+        Args:
+            source (str): S3 address of the object to obfuscate.
+            bucket (str): name of bucket to save obfuscated file to.
+            key (str): key to save obfuscated file to.
+            part_size (int): size in bytes of each uploaded part.
+            metrics (Metrics): optional metrics to record each stage in.
+
+        Returns: response from S3 for the completed upload, or None if the
+        object was skipped by schema_policy."""
+
+        source_bucket, source_key, _ = get_bucket_and_key_from_string(source)
+        compression = self.compression or split_compression(key)[1]
+        chunks = self._stream(source_bucket, source_key, compression, metrics)
+        if chunks is None:
+            return None
+        return upload_stream_to_s3(
+            chunks, bucket, key, part_size=part_size, client=self.client
+        )
+
+    def stream_file(
+        self,
+        stream: BinaryIO,
+        extension: str,
+        codec: str = None,
+        metrics: Metrics = None,
+    ) -> Iterator[bytes]:
+        """Obfuscates a local file or stream, see obfuscate_stream.
+
+        Args:
+            stream (BinaryIO): readable binary stream, closed once the last
+                chunk has been yielded.
+            extension (str): file format eg. "csv".
+            codec (str): optional codec stream is compressed with.
+            metrics (Metrics): optional metrics to record each stage in.
+
+        Returns: iterator of bytes which together make up the obfuscated
+        file."""
+
+        return obfuscate_stream(
+            stream, self.fields, extension, self.chunk_size, self.engine,
+            metrics, self.pseudonymiser, codec, self.compression,
+            detector=self.detector, redactor=self.redactor,
+            select=self.select, field_indices=self.field_indices,
+        )
+
+    def obfuscate_into(
+        self,
+        source: Union[bytes, bytearray, memoryview, BinaryIO],
+        out: BinaryIO,
+        extension: str = "csv",
+        codec: str = None,
+        metrics: Metrics = None,
+    ) -> int:
+        """Obfuscates data in memory or a stream to out, see obfuscate_into.
+
+        Args:
+            source (bytes | bytearray | memoryview | BinaryIO): the file, or
+                a readable binary stream of it, which is left open.
+            out (BinaryIO): writable binary file to write the output to.
+            extension (str): file format eg. "csv".
+            codec (str): optional codec source is compressed with.
+            metrics (Metrics): optional metrics to record each stage in.
+
+        Returns: number of bytes written to out."""
+
+        return obfuscate_into(
+            source, out, self.fields, extension, self.chunk_size,
+            self.engine, metrics, self.pseudonymiser, codec,
+            self.compression, detector=self.detector, redactor=self.redactor,
+            select=self.select, field_indices=self.field_indices,
+        )
+
+    def field_indices(self, header: list[str]) -> list[int]:
+        """Finds the positions of the plan's fields in a csv header.
+
+        The indices of recently seen headers are kept, so csv objects and
+        blocks which share a header only resolve it once. A detector finds
+        the fields of each object itself, so its plans resolve every
+        header.
+
+        Args: header (list[str]): field names from the first row of the csv.
+
+        Returns: sorted list of column indices of the fields."""
+
+        header = tuple(header)
+        with self._lock:
+            indices = self._indices.get(header)
+            if indices is None:
+                indices = get_field_indices(header, self.fields)
+                self._indices[header] = indices
+                if len(self._indices) > DEFAULT_HEADER_CACHE_SIZE:
+                    self._indices.popitem(last=False)
+            else:
+                self._indices.move_to_end(header)
+        return indices
+
+    def obfuscate_csv_block(
+        self, block: bytes, header: list[str], encoding: str = "utf-8"
+    ) -> bytes:
+        """Obfuscates a block of csv records which share a known header.
+
+        For records arriving in batches without their header, eg. messages
+        from a queue. detector, redactor and select are not applied.
+
+        Args:
+            block (bytes): complete csv records without the header.
+            header (list[str]): field names of the records.
+            encoding (str): encoding of the block, defaults to utf-8.
+
+        Returns: the obfuscated records serialised as csv bytes."""
+
+        return obfuscate_csv_block(
+            block, self.field_indices(header), encoding, MASK,
+            self.pseudonymiser,
+        )
+
+    def _stream(
+        self, bucket: str, key: str, compression: str, metrics: Metrics
+    ) -> Iterator[bytes]:
+        """Obfuscates s3://bucket/key with the plan's settings.
+
+        Returns: iterator of chunks, or None if skipped by schema_policy."""
+
+        metrics = metrics or NULL_METRICS
+        encoding = "utf-8"
+        if self.schema_policy:
+            with metrics.stage("probe"):
+                probe = check_schema(
+                    bucket, key, self.fields, self.schema_policy, self.client
+                )
+            if probe is None:
+                return None
+            encoding = probe.encoding
+        return obfuscate_s3_object(
+            bucket, key, self.fields, self.chunk_size, self.client,
+            self.engine, metrics, self.pseudonymiser, compression, encoding,
+            self.detector, self.redactor, self.select,
+            field_indices=self.field_indices,
+        )
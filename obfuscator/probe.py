@@ -0,0 +1,246 @@
+"""Checking pii_fields against a file's header before it is downloaded.
+
+Without a probe, missing pii_fields are only noticed once the whole object
+has been downloaded and parsed, when a warning is logged and the data is
+returned unchanged. A probe fetches the first few KB of a csv object with a
+ranged GET (or the footer of a parquet object), reads the encoding from any
+byte order mark and parses the header, so a policy can be applied before
+any more is downloaded:
+
+    fail: raise PIIFieldsNotFound if any of pii_fields are missing.
+    warn: log a warning for missing fields and obfuscate anyway.
+    skip: log a warning, and skip the file if none of pii_fields are present.
+
+The fields of json records are not fixed by a header so json files are not
+checked. The SchemaProbe also records the size and encoding of the object
+so they do not need to be found again for the full run."""
+
+from __future__ import annotations
+
+import codecs
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+from .clients import get_s3_client
+from .compression import (
+    codec_from_content_encoding,
+    decompress_prefix,
+    split_compression,
+)
+from .exceptions import InvalidFileToObfuscate, PIIFieldsNotFound
+from .parallel import find_first_record_end, read_header
+from .registry import FORMATS
+from .s3_utils import S3RangeFile
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+SCHEMA_POLICIES = ['fail', 'warn', 'skip']
+
+# number of bytes fetched by the first ranged GET, doubled until the whole
+# header has been fetched, up to DEFAULT_MAX_PROBE_SIZE
+DEFAULT_PROBE_SIZE = 16 * 1024
+DEFAULT_MAX_PROBE_SIZE = 1024 * 1024
+
+# byte order marks and the encoding they imply, utf-32 before utf-16 as the
+# utf-32 little endian mark starts with the utf-16 one
+_BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+@dataclass
+class SchemaProbe:
+    """What a probe found out about an S3 object.
+
+    Attributes:
+        bucket (str): bucket name
+        key (str): key name
+        extension (str): file format eg. 'csv'.
+        header (list[str]): field names, or None if the format has no fixed
+            header eg. json.
+        found (list[str]): requested fields present in header.
+        missing (list[str]): requested fields not present in header.
+        encoding (str): text encoding, 'utf-8-sig' if the file has a BOM.
+        size (int): size of the object in bytes.
+        codec (str): codec the object is compressed with, or None.
+        header_end (int): position in the uncompressed file just after the
+            header of a csv file."""
+
+    bucket: str
+    key: str
+    extension: str
+    header: list[str] = None
+    found: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    encoding: str = 'utf-8'
+    size: int = None
+    codec: str = None
+    header_end: int = 0
+
+
+def probe_s3_object(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    probe_size: int = DEFAULT_PROBE_SIZE,
+    client: BaseClient = None,
+) -> SchemaProbe:
+    """Reads the header of an S3 object without downloading all of it.
+
+    Args:
+        bucket (str): bucket name
+        key (str): key name
+        fields (list[str]): fields that should be obfuscated.
+        probe_size (int): number of bytes fetched by the first ranged GET.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: SchemaProbe with the header and which fields are missing.
+
+    Raises:
+        InvalidFileToObfuscate: if the header is not utf-8 or is longer than
+            DEFAULT_MAX_PROBE_SIZE."""
+
+    client = client or get_s3_client()
+    name, codec = split_compression(key)
+    extension = name.rpartition('.')[2].lower()
+    probe = SchemaProbe(bucket, key, extension, codec=codec)
+
+    if extension == 'parquet':
+        source = S3RangeFile(bucket, key, client)
+        probe.header = FORMATS.load('parquet').get_parquet_fields(source)
+        probe.size = source.size
+    elif extension == 'csv':
+        _probe_csv(probe, probe_size, client)
+    else:
+        return probe
+
+    probe.found = [name for name in fields if name in probe.header]
+    probe.missing = [name for name in fields if name not in probe.header]
+    return probe
+
+
+def _probe_csv(probe: SchemaProbe, probe_size: int, client) -> None:
+    """Fetches the start of a csv object until it holds the whole header.
+    """
+
+    from botocore.exceptions import ClientError
+
+    raw = b""
+    while True:
+        try:
+            response = client.get_object(
+                Bucket=probe.bucket, Key=probe.key,
+                Range=f"bytes={len(raw)}-{len(raw) + probe_size - 1}",
+            )
+        except ClientError as err:
+            # ranges of empty objects are not satisfiable
+            if err.response.get("Error", {}).get("Code") != "InvalidRange":
+                raise
+            probe.header, probe.size = [], 0
+            return
+        raw += response["Body"].read()
+        content_range = response.get("ContentRange")
+        probe.size = int(content_range.rpartition('/')[2]) if (
+            content_range
+        ) else len(raw)
+        probe.codec = probe.codec or codec_from_content_encoding(
+            response.get("ContentEncoding")
+        )
+
+        data = decompress_prefix(raw, probe.codec) if probe.codec else raw
+        for bom, encoding in _BOMS:
+            if data.startswith(bom):
+                probe.encoding = encoding
+                break
+        if probe.encoding not in ('utf-8', 'utf-8-sig'):
+            logger.error(
+                f'Unable to process. {probe.encoding} encoded files are '
+                'not supported.'
+            )
+            raise InvalidFileToObfuscate
+
+        end = find_first_record_end(data)
+        if end != -1 or len(raw) >= probe.size:
+            break
+        if len(raw) >= DEFAULT_MAX_PROBE_SIZE:
+            logger.error('Unable to process. csv header is too long.')
+            raise InvalidFileToObfuscate
+        probe_size *= 2
+
+    try:
+        probe.header, probe.header_end = read_header(data, 'utf-8-sig')
+    except UnicodeDecodeError as err:
+        logger.error('Unable to process. csv header is not utf-8.')
+        raise InvalidFileToObfuscate from err
+
+
+def apply_schema_policy(probe: SchemaProbe, policy: str) -> bool:
+    """Decides whether to obfuscate a file from the result of a probe.
+
+    Args:
+        probe (SchemaProbe): result of probe_s3_object.
+        policy (str): one of SCHEMA_POLICIES.
+
+    Returns: True if the file should be obfuscated, False to skip it.
+
+    Raises:
+        PIIFieldsNotFound: if policy is fail and any fields are missing."""
+
+    check_schema_policy(policy)
+    if probe.header is None or not probe.missing:
+        return True
+
+    message = (
+        ', '.join(probe.missing) +
+        f' fields not found in s3://{probe.bucket}/{probe.key}'
+    )
+    if policy == 'fail':
+        logger.error('Unable to process. ' + message)
+        raise PIIFieldsNotFound(message)
+    if policy == 'skip' and not probe.found:
+        logger.warning(message + ', skipping as there is nothing to obfuscate')
+        return False
+    logger.warning(message)
+    return True
+
+
+def check_schema(
+    bucket: str,
+    key: str,
+    fields: list[str],
+    policy: str,
+    client: BaseClient = None,
+) -> SchemaProbe:
+    """Probes an S3 object and applies policy to the result.
+
+    Args:
+        bucket (str): bucket name
+        key (str): key name
+        fields (list[str]): fields that should be obfuscated.
+        policy (str): one of SCHEMA_POLICIES.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: the SchemaProbe, or None if the file should be skipped."""
+
+    check_schema_policy(policy)
+    probe = probe_s3_object(bucket, key, fields, client=client)
+    return probe if apply_schema_policy(probe, policy) else None
+
+
+def check_schema_policy(policy: str) -> None:
+    """Raises ValueError if policy is not one of SCHEMA_POLICIES."""
+
+    if policy not in SCHEMA_POLICIES:
+        raise ValueError(
+            f'schema_policy must be one of {", ".join(SCHEMA_POLICIES)}'
+        )
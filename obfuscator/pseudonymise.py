@@ -0,0 +1,140 @@
+"""Deterministic pseudonymisation of PII values with a keyed hash.
+
+Instead of replacing every PII value with the same mask, each value can be
+replaced with a token derived from it with HMAC-SHA256 and a secret key. The
+same value always gives the same token for a given key, so obfuscated
+datasets can still be joined on a pseudonymised column, but values cannot
+be recovered from tokens without the key.
+
+PII columns are often highly repetitive (countries, employers, repeated
+emails) so tokens are kept in a bounded LRU cache, and whole columns of a
+batch of rows are tokenised at once with tokenise()."""
+
+import hmac
+import json
+import string
+from functools import lru_cache
+from typing import Any, Iterable
+
+
+DEFAULT_TOKEN_LENGTH = 16
+DEFAULT_CACHE_SIZE = 64 * 1024
+
+
+class Pseudonymiser:
+    """Replaces values with deterministic tokens derived using a secret key.
+
+    Args:
+        key (bytes | str): secret key for HMAC-SHA256. Keep it secret, anyone
+            holding the key can check guesses of the original values.
+        length (int): number of hex characters in each token, up to 64.
+        preserve_format (bool): keep the length, character classes and
+            punctuation of each value instead of using a hex token, so
+            "jo@ex.com" becomes eg. "qx@bd.xme" and "07700 900123" becomes
+            eg. "51902 448170". Tokens are not reversible.
+        prefix (str): text put in front of every hex token eg. "tok_".
+        cache_size (int): maximum number of tokens kept in the LRU cache.
+
+    Example:
+        pseudonymiser = Pseudonymiser(os.environ["PII_KEY"])
+        obfuscator(json_str, pseudonymiser=pseudonymiser)
+    """
+
+    def __init__(
+        self,
+        key,
+        length: int = DEFAULT_TOKEN_LENGTH,
+        preserve_format: bool = False,
+        prefix: str = "",
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ):
+        if not key:
+            raise ValueError("a key is required for pseudonymisation")
+        if not 0 < length <= 64:
+            raise ValueError("length must be between 1 and 64")
+        self.key = key.encode("utf-8") if isinstance(key, str) else key
+        self.length = length
+        self.preserve_format = preserve_format
+        self.prefix = prefix
+        self.cache_size = cache_size
+        self._build_cache()
+
+    def _build_cache(self) -> None:
+        """Creates the LRU cached token function for this key."""
+
+        make_token = self._format_token if self.preserve_format else (
+            self._hex_token
+        )
+        self.token = lru_cache(maxsize=self.cache_size)(make_token)
+
+    def __getstate__(self) -> dict:
+        # the cache is not picklable, it is rebuilt in worker processes
+        state = self.__dict__.copy()
+        del state["token"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._build_cache()
+
+    def _hex_token(self, value: str) -> str:
+        digest = hmac.digest(self.key, value.encode("utf-8"), "sha256")
+        return self.prefix + digest.hex()[:self.length]
+
+    def _format_token(self, value: str) -> str:
+        stream = bytearray()
+        block = value.encode("utf-8")
+        while len(stream) < len(value):
+            block = hmac.digest(self.key, block, "sha512")
+            stream += block
+        chars = []
+        for char, byte in zip(value, stream):
+            if char in string.digits:
+                chars.append(string.digits[byte % 10])
+            elif char in string.ascii_lowercase:
+                chars.append(string.ascii_lowercase[byte % 26])
+            elif char in string.ascii_uppercase:
+                chars.append(string.ascii_uppercase[byte % 26])
+            elif char.isalnum():
+                # other letters eg. accented ones become ascii letters
+                chars.append(string.ascii_lowercase[byte % 26])
+            else:
+                chars.append(char)
+        return "".join(chars)
+
+    def tokenise(self, values: Iterable[str]) -> list[str]:
+        """Replaces a batch of values, eg. a column of rows, with tokens.
+
+        Each distinct value in the batch is looked up in the cache once, so
+        a repeated value is only hashed again if it has left the cache.
+
+        Args: values (Iterable[str]): values to replace.
+
+        Returns: list of tokens in the same order as values."""
+
+        values = list(values)
+        tokens = {value: self.token(value) for value in dict.fromkeys(values)}
+        return [tokens[value] for value in values]
+
+    def tokenise_value(self, value: Any) -> str:
+        """Replaces any json value with a token, encoding non-strings first.
+        """
+
+        if not isinstance(value, str):
+            value = json.dumps(value, sort_keys=True)
+        return self.token(value)
+
+    def fingerprint(self) -> str:
+        """Identifies the key and settings without revealing the key.
+
+        Two pseudonymisers with the same fingerprint give the same tokens,
+        eg. for deciding whether cached output can be reused."""
+
+        digest = hmac.digest(self.key, b"obfuscator-fingerprint", "sha256")
+        settings = (self.length, self.preserve_format, self.prefix)
+        return f"{digest.hex()[:16]}:{json.dumps(settings)}"
+
+    def cache_info(self):
+        """Returns hits, misses and size of the LRU cache of tokens."""
+
+        return self.token.cache_info()
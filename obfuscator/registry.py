@@ -0,0 +1,169 @@
+"""Registries of file formats, csv engines, codecs and storage backends.
+
+Each entry names the module which handles it, and the module is imported
+the first time a matching file is seen, not when obfuscator is imported.
+A Lambda obfuscating csv files never imports the json or parquet code, and
+optional libraries such as zstandard are only needed for files which use
+them. boto3 and botocore are only imported when the first S3 client is
+created, so importing the package or any of its functions does not load
+them, and obfuscate_into never does for data already in memory.
+
+measure_import_time reports how long importing a module takes in a fresh
+interpreter, to check changes do not slow down cold starts.
+
+Example:
+    json_utils = FORMATS.load("jsonl")
+    FORMATS.register("tsv", "my_package.tsv_utils")
+"""
+
+import importlib
+import subprocess
+import sys
+import threading
+
+
+class Registry:
+    """Names, each mapped to a module or attribute imported when first used.
+
+    Args:
+        kind (str): what is registered eg. "format", used in error messages.
+
+    Example:
+        codecs = Registry("codec")
+        codecs.register("zstd", "zstandard", extra="zstd")
+        zstandard = codecs.load("zstd")
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._targets: dict[str, tuple[str, str]] = {}
+        self._loaded: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, target: str, extra: str = None) -> None:
+        """Registers name, replacing any earlier registration.
+
+        Args:
+            name (str): name looked up eg. a file extension.
+            target (str): module to import eg. "obfuscator.json_utils", or
+                "module:attribute" for an object within a module.
+            extra (str): optional extra of the obfuscator package which
+                installs the module, named in the error if it is missing.
+        """
+
+        with self._lock:
+            self._targets[name] = (target, extra)
+            self._loaded.pop(name, None)
+
+    def names(self) -> list[str]:
+        """Returns the registered names in the order they were registered."""
+
+        return list(self._targets)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._targets
+
+    def is_loaded(self, name: str) -> bool:
+        """Checks whether name has been imported yet."""
+
+        return name in self._loaded
+
+    def load(self, name: str):
+        """Imports the module or attribute registered as name.
+
+        Args: name (str): a registered name.
+
+        Returns: the module, or attribute of the module, registered.
+
+        Raises:
+            ValueError: if name is not registered.
+            ImportError: if the module is not installed."""
+
+        if name in self._loaded:
+            return self._loaded[name]
+        if name not in self._targets:
+            raise ValueError(
+                f'{self.kind} must be one of {", ".join(self._targets)}'
+            )
+        target, extra = self._targets[name]
+        module_name, _, attribute = target.partition(":")
+        try:
+            loaded = importlib.import_module(module_name)
+        except ImportError as err:
+            if extra is None:
+                raise
+            raise ImportError(
+                f'{module_name} is required for {self.kind} {name}, install '
+                f'it with: pip install obfuscator[{extra}]'
+            ) from err
+        if attribute:
+            loaded = getattr(loaded, attribute)
+        with self._lock:
+            self._loaded[name] = loaded
+        return loaded
+
+
+# file extensions and the module with the functions obfuscating them
+FORMATS = Registry("format")
+FORMATS.register("csv", "obfuscator.csv_utils")
+FORMATS.register("parquet", "obfuscator.parquet_utils")
+FORMATS.register("json", "obfuscator.json_utils")
+FORMATS.register("jsonl", "obfuscator.json_utils")
+FORMATS.register("ndjson", "obfuscator.json_utils")
+
+# engines of csv files and the module doing the obfuscation
+CSV_ENGINES = Registry("engine")
+CSV_ENGINES.register("csv", "obfuscator.csv_utils")
+CSV_ENGINES.register("bytes", "obfuscator.csv_bytes")
+
+# compression codecs and the library implementing them
+CODEC_LIBRARIES = Registry("codec")
+CODEC_LIBRARIES.register("gzip", "gzip")
+CODEC_LIBRARIES.register("bz2", "bz2")
+CODEC_LIBRARIES.register("zstd", "zstandard", extra="zstd")
+
+# url schemes of input and output and the module reading & writing them
+STORAGE = Registry("storage")
+STORAGE.register("s3", "obfuscator.s3_utils")
+STORAGE.register("file", "obfuscator.file_utils")
+
+
+def storage_scheme(path: str) -> str:
+    """Finds the STORAGE backend of a path, "s3" for s3:// URIs and
+    otherwise "file"."""
+
+    scheme, separator, _ = path.partition("://")
+    return scheme if separator and scheme in STORAGE else "file"
+
+
+def measure_import_time(module: str = "obfuscator") -> dict[str, int]:
+    """Measures the time taken to import a module in a fresh interpreter.
+
+    Uses python -X importtime, so modules already imported by the current
+    process are measured too, but not those imported by the interpreter
+    before module, such as site.
+
+    Args: module (str): name of the module to import.
+
+    Returns: dictionary of module and every module it imports, with their
+    cumulative import times in microseconds, including the modules they
+    import in turn. The total is the time of module itself."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    times = {}
+    # each module is reported after the modules it imports, indented less
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        times[name.strip()] = int(cumulative)
+        if not name.startswith("  "):
+            if name.strip() == module:
+                break
+            times = {}
+    return times
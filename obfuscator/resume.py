@@ -0,0 +1,474 @@
+"""Resumable obfuscation of very large csv objects.
+
+If a run dies part way through a large file, eg. when a Lambda times out,
+obfuscator_to_s3 has to start again from the first byte. In resumable mode
+the output is uploaded as a multipart upload whose parts each hold the
+obfuscated records from a known range of the input. After every completed
+part a small Checkpoint recording the multipart upload id, the ETags of the
+completed parts and the input byte offset they cover is saved to a
+CheckpointStore, locally or in S3. Running the same request again continues
+from the last completed part rather than from the start of the file.
+
+A checkpoint is only used for the same version of the input, found from its
+ETag with a HEAD request, and the same settings: pii_fields, pseudonymiser
+and compression. Otherwise parts made with different settings would be
+joined into one file, leaving fields added on the rerun in clear text in
+the earlier parts. If the input or settings have changed, or the multipart
+upload has been aborted, the old upload is discarded and the file is
+obfuscated from the start. Checkpoints are deleted once the upload is
+complete. Uploads of runs which are never resumed are left incomplete, so
+expire them with an AbortIncompleteMultipartUpload lifecycle rule on the
+output bucket.
+
+Example:
+    store = S3CheckpointStore("my_bucket")
+    obfuscator_resumable(json_str, "my_bucket", "obfuscated/big.csv", store)
+"""
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Iterator
+from botocore.client import BaseClient
+from botocore.exceptions import ClientError
+from .clients import get_s3_client
+from .compression import check_codec, make_compressor, split_compression
+from .csv_utils import (
+    MASK,
+    find_fields,
+    get_field_indices,
+    obfuscate_csv_block,
+    rows_to_csv_chunks,
+)
+from .main import get_bucket_and_key_from_string, parse_request
+from .parallel import iter_record_blocks
+from .probe import probe_s3_object
+from .pseudonymise import Pseudonymiser
+from .s3_utils import DEFAULT_PART_SIZE, MIN_PART_SIZE
+from .exceptions import InvalidFileToObfuscate
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+DEFAULT_CHECKPOINT_PREFIX = "obfuscator-checkpoints/"
+
+# number of bytes read from the input at a time
+DEFAULT_READ_SIZE = 1024 * 1024
+
+
+@dataclass
+class Checkpoint:
+    """Progress of a resumable run, saved after each completed part.
+
+    Attributes:
+        source (str): S3 address of the input.
+        etag (str): ETag of the input when the run started.
+        bucket (str): bucket of the output.
+        key (str): key of the output.
+        upload_id (str): id of the multipart upload of the output.
+        offset (int): position in the input up to which records have been
+            obfuscated and uploaded.
+        parts (list[dict]): ETag and PartNumber of each completed part.
+        settings (str): fingerprint of the settings of the run, from
+            settings_fingerprint."""
+
+    source: str
+    etag: str
+    bucket: str
+    key: str
+    upload_id: str
+    offset: int
+    parts: list[dict] = field(default_factory=list)
+    settings: str = None
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "Checkpoint":
+        return cls(**json.loads(data))
+
+
+class CheckpointStore(ABC):
+    """Base class of stores of checkpoints, keyed by name."""
+
+    @abstractmethod
+    def load(self, name: str) -> Checkpoint:
+        """Returns the checkpoint saved as name, or None if there is none."""
+
+    @abstractmethod
+    def save(self, name: str, checkpoint: Checkpoint) -> None:
+        """Saves checkpoint as name, replacing any earlier checkpoint."""
+
+    @abstractmethod
+    def delete(self, name: str) -> None:
+        """Deletes the checkpoint saved as name, if there is one."""
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """Keeps checkpoints as json files in a local directory.
+
+    Files are written atomically so a checkpoint is never left half written
+    if the process dies while saving it.
+
+    Args:
+        directory (str): directory to keep checkpoints in, created if needed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".json")
+
+    def load(self, name: str) -> Checkpoint:
+        try:
+            with open(self._path(name)) as f:
+                return Checkpoint.from_json(f.read())
+        except FileNotFoundError:
+            return None
+
+    def save(self, name: str, checkpoint: Checkpoint) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(checkpoint.to_json())
+            os.replace(temp_path, self._path(name))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, name: str) -> None:
+        try:
+            os.unlink(self._path(name))
+        except FileNotFoundError:
+            pass
+
+
+class S3CheckpointStore(CheckpointStore):
+    """Keeps checkpoints as json objects under a prefix in S3.
+
+    Args:
+        bucket (str): bucket to keep checkpoints in.
+        prefix (str): prefix of the key of every checkpoint.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = DEFAULT_CHECKPOINT_PREFIX,
+        client: BaseClient = None,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name + ".json"
+
+    def load(self, name: str) -> Checkpoint:
+        client = self.client or get_s3_client()
+        try:
+            response = client.get_object(
+                Bucket=self.bucket, Key=self._key(name)
+            )
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") == "NoSuchKey":
+                return None
+            raise
+        return Checkpoint.from_json(response["Body"].read().decode())
+
+    def save(self, name: str, checkpoint: Checkpoint) -> None:
+        client = self.client or get_s3_client()
+        client.put_object(
+            Bucket=self.bucket, Key=self._key(name),
+            Body=checkpoint.to_json().encode(),
+        )
+
+    def delete(self, name: str) -> None:
+        client = self.client or get_s3_client()
+        client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+
+def checkpoint_name(source: str, bucket: str, key: str) -> str:
+    """Names the checkpoint of obfuscating source to s3://bucket/key."""
+
+    identity = json.dumps([source, bucket, key])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def settings_fingerprint(
+    fields: list[str], pseudonymiser: Pseudonymiser, compression: str
+) -> str:
+    """Identifies the settings which decide the content of every part.
+
+    Args:
+        fields (list[str]): fields obfuscated, in any order.
+        pseudonymiser (Pseudonymiser): pseudonymiser used instead of the
+            mask, identified by its fingerprint and not its key, or None.
+        compression (str): codec the output is compressed with, or None.
+
+    Returns: sha256 hex digest."""
+
+    mode = pseudonymiser.fingerprint() if pseudonymiser else "mask"
+    identity = json.dumps([sorted(set(fields)), mode, compression])
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+def obfuscator_resumable(
+    json_str: str,
+    bucket: str,
+    key: str,
+    store: CheckpointStore,
+    part_size: int = DEFAULT_PART_SIZE,
+    client: BaseClient = None,
+    pseudonymiser: Pseudonymiser = None,
+    compression: str = None,
+) -> dict:
+    """Obfuscates a csv file to S3, continuing from any earlier checkpoint.
+
+    Takes the same json string as obfuscator. Only uncompressed csv input is
+    supported, as compressed input cannot be read from an offset.
+
+    Args:
+        json_str(json string) with file_to_obfuscate & pii_fields keys.
+        bucket (str): name of bucket to save obfuscated file to.
+        key (str): key to save obfuscated file to.
+        store (CheckpointStore): where to keep checkpoints between runs.
+        part_size (int): minimum size in bytes of each uploaded part, and so
+            roughly the most work lost if a run dies.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        pseudonymiser (Pseudonymiser): optional, replace values with tokens
+            instead of ***. Use the same key when resuming.
+        compression (str): optional codec to compress the output with,
+            defaults to the codec of key's extension eg. gzip for .csv.gz.
+            Each part is compressed separately, as concatenated gzip
+            members, bz2 streams or zstd frames are still one valid file.
+
+    Returns: response from S3 for the completed upload.
+
+    Raises:
+        InvalidFileToObfuscate: if the file is not an uncompressed csv."""
+
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes')
+    client = client or get_s3_client()
+    request = parse_request(json_str)
+    source = request["file_to_obfuscate"]
+    source_bucket, source_key, extension = get_bucket_and_key_from_string(
+        source
+    )
+    compression = compression or split_compression(key)[1]
+    if compression:
+        check_codec(compression)
+
+    probe = probe_s3_object(source_bucket, source_key, [], client=client)
+    if extension != 'csv' or probe.codec:
+        logger.error(
+            'Unable to process. Only uncompressed csv files can be resumed.'
+        )
+        raise InvalidFileToObfuscate
+    etag = client.head_object(Bucket=source_bucket, Key=source_key)["ETag"]
+
+    settings = settings_fingerprint(
+        request["pii_fields"], pseudonymiser, compression
+    )
+    name = checkpoint_name(source, bucket, key)
+    checkpoint = _resume(store.load(name), etag, settings, client)
+    header_chunk = b"".join(rows_to_csv_chunks([probe.header]))
+    if checkpoint is None:
+        upload_id = client.create_multipart_upload(
+            Bucket=bucket, Key=key
+        )["UploadId"]
+        checkpoint = Checkpoint(
+            source, etag, bucket, key, upload_id, probe.header_end,
+            settings=settings,
+        )
+        store.save(name, checkpoint)
+    else:
+        logger.info(
+            f'Resuming s3://{bucket}/{key} from byte {checkpoint.offset} '
+            f'after {len(checkpoint.parts)} parts'
+        )
+
+    found = find_fields(probe.header, request["pii_fields"])
+    indices = get_field_indices(probe.header, found)
+    blocks = _read_blocks(
+        source_bucket, source_key, etag, checkpoint.offset, probe.size,
+        client,
+    )
+    chunks = _obfuscate_blocks(
+        blocks, checkpoint.offset, indices, pseudonymiser
+    )
+    if not checkpoint.parts:
+        chunks = itertools.chain([(header_chunk, checkpoint.offset)], chunks)
+
+    def upload(part_number: int, body: bytes) -> dict:
+        response = client.upload_part(
+            Bucket=bucket, Key=key, UploadId=checkpoint.upload_id,
+            PartNumber=part_number, Body=body,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    # each part is uploaded while the next is obfuscated, and the checkpoint
+    # is saved once it has completed
+    in_flight: tuple[Future, int] = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+
+        def submit(body: bytes, offset: int) -> None:
+            nonlocal in_flight
+            wait()
+            part_number = len(checkpoint.parts) + 1
+            in_flight = executor.submit(upload, part_number, body), offset
+
+        def wait() -> None:
+            nonlocal in_flight
+            if in_flight is not None:
+                future, offset = in_flight
+                in_flight = None
+                checkpoint.parts.append(future.result())
+                checkpoint.offset = offset
+                store.save(name, checkpoint)
+
+        for body, offset in _iter_parts(chunks, part_size, compression):
+            submit(body, offset)
+        wait()
+
+    response = client.complete_multipart_upload(
+        Bucket=bucket, Key=key, UploadId=checkpoint.upload_id,
+        MultipartUpload={"Parts": checkpoint.parts},
+    )
+    store.delete(name)
+    logger.info(
+        f'Uploaded {len(checkpoint.parts)} parts to s3://{bucket}/{key}'
+    )
+    if found:
+        logger.info(
+            ', '.join(found) + ' fields have been successfully obfuscated'
+        )
+    return response
+
+
+def _resume(
+    checkpoint: Checkpoint, etag: str, settings: str, client
+) -> Checkpoint:
+    """Checks whether a checkpoint can be resumed from.
+
+    Returns: the checkpoint, or None if the input or settings have changed
+    or its upload no longer exists. If the input or settings have changed
+    the upload is aborted."""
+
+    if checkpoint is None:
+        return None
+    if checkpoint.etag == etag and checkpoint.settings == settings:
+        try:
+            client.list_parts(
+                Bucket=checkpoint.bucket, Key=checkpoint.key,
+                UploadId=checkpoint.upload_id, MaxParts=1,
+            )
+            return checkpoint
+        except ClientError as err:
+            if err.response.get("Error", {}).get("Code") != "NoSuchUpload":
+                raise
+        logger.warning('Checkpointed upload no longer exists, restarting.')
+        return None
+
+    if checkpoint.etag != etag:
+        logger.warning(f'{checkpoint.source} has changed since the '
+                       'checkpoint, restarting.')
+    else:
+        logger.warning('Settings have changed since the checkpoint, '
+                       'restarting.')
+    try:
+        client.abort_multipart_upload(
+            Bucket=checkpoint.bucket, Key=checkpoint.key,
+            UploadId=checkpoint.upload_id,
+        )
+    except ClientError as err:
+        if err.response.get("Error", {}).get("Code") != "NoSuchUpload":
+            raise
+    return None
+
+
+def _obfuscate_blocks(
+    blocks: Iterable[bytes],
+    offset: int,
+    indices: list[int],
+    pseudonymiser: Pseudonymiser,
+) -> Iterator[tuple[bytes, int]]:
+    """Obfuscates blocks of records read from offset.
+
+    Yields: each obfuscated block and the offset in the input just after it.
+    """
+
+    for block in blocks:
+        offset += len(block)
+        yield obfuscate_csv_block(
+            block, indices, "utf-8", MASK, pseudonymiser
+        ), offset
+
+
+def _iter_parts(
+    chunks: Iterable[tuple[bytes, int]], part_size: int, compression: str
+) -> Iterator[tuple[bytes, int]]:
+    """Gathers chunks into parts of at least part_size bytes.
+
+    With compression each part is compressed as a complete stream, and its
+    compressed size is what must reach part_size.
+
+    Args:
+        chunks (Iterable[tuple[bytes, int]]): data and the input offset
+            just after it.
+        part_size (int): minimum size of every part but the last.
+        compression (str): codec to compress each part with, or None.
+
+    Yields: the body of each part and the input offset just after it."""
+
+    pending, size, compressor, offset = [], 0, None, None
+    for chunk, offset in chunks:
+        if compression:
+            compressor = compressor or make_compressor(compression)
+            chunk = compressor.compress(chunk)
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= part_size:
+            if compressor is not None:
+                pending.append(compressor.flush())
+                compressor = None
+            yield b"".join(pending), offset
+            pending, size = [], 0
+
+    if compressor is not None:
+        pending.append(compressor.flush())
+    if pending:
+        yield b"".join(pending), offset
+
+
+def _read_blocks(
+    bucket: str, key: str, etag: str, offset: int, size: int, client
+) -> Iterator[bytes]:
+    """Reads the object from offset, yielding blocks of whole records.
+
+    The read fails if the object no longer has the given ETag, so records
+    from different versions are never mixed."""
+
+    if offset >= size:
+        return
+    body = client.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes={offset}-", IfMatch=etag
+    )["Body"]
+    try:
+        reads = iter(lambda: body.read(DEFAULT_READ_SIZE), b"")
+        yield from iter_record_blocks(reads)
+    finally:
+        body.close()
@@ -0,0 +1,368 @@
+"""Pushing column and row filters down to S3 with S3 Select.
+
+When only some columns are wanted, or only rows matching a filter, the
+whole object does not need to be downloaded. A SelectQuery describes the
+columns to keep and the conditions rows must meet. With S3 Select the query
+runs on S3 and only the matching columns and rows are sent back, so for a
+wide export where a third of the columns are kept about a third of the
+bytes are transferred.
+
+Results arrive as an event stream which is read incrementally, so records
+are obfuscated while later ones are still being selected. S3 Select is used
+for csv and json lines files, uncompressed or compressed with gzip or bz2.
+For other files, or if S3 Select is not available for the bucket, the object
+is downloaded with a normal GET and the query is applied as it is read.
+
+Values are compared as text, so both paths give the same rows.
+
+Example:
+    query = SelectQuery(
+        columns=["student_id", "name", "course"],
+        where=[("course", "=", "Software")],
+    )
+    obfuscator_streaming(json_str, select=query)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import logging
+import operator
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterable, Iterator
+from .clients import get_s3_client
+from .compression import split_compression
+from .csv_utils import rows_to_csv_chunks
+from .exceptions import IncompleteSelectResults
+from .probe import probe_s3_object
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# comparison operators of where conditions and the SQL they are written as
+OPERATORS = {
+    '=': ('=', operator.eq),
+    '!=': ('<>', operator.ne),
+    '<': ('<', operator.lt),
+    '<=': ('<=', operator.le),
+    '>': ('>', operator.gt),
+    '>=': ('>=', operator.ge),
+}
+
+# codecs S3 Select can read and their CompressionType
+SELECT_COMPRESSION = {None: 'NONE', 'gzip': 'GZIP', 'bz2': 'BZIP2'}
+
+SELECT_EXTENSIONS = ['csv', 'jsonl', 'ndjson']
+
+# errors which mean the object cannot be read at all, rather than that S3
+# Select cannot be used for it
+_FATAL_ERRORS = {'NoSuchKey', 'NoSuchBucket', 'AccessDenied'}
+
+
+class SelectQuery:
+    """Columns to keep and conditions rows must meet.
+
+    Args:
+        columns (list[str]): names of the columns to keep, in the order they
+            should be output, or None to keep every column. For json lines
+            files only top level fields can be kept.
+        where (list[tuple[str, str, str]]): conditions every kept row must
+            meet, each a column name, an operator from OPERATORS and a value
+            the column is compared to as text. Dotted names eg.
+            "contact.country" compare fields of nested json objects.
+    """
+
+    def __init__(
+        self,
+        columns: list[str] = None,
+        where: list[tuple[str, str, str]] = (),
+    ):
+        for condition in where:
+            if len(condition) != 3 or condition[1] not in OPERATORS:
+                raise ValueError(
+                    f'where conditions must be (column, operator, value) '
+                    f'with an operator in {", ".join(OPERATORS)}'
+                )
+        if columns is not None and not columns:
+            raise ValueError('columns must not be empty')
+        self.columns = list(columns) if columns is not None else None
+        self.where = [
+            (name, op, str(value)) for name, op, value in where
+        ]
+
+    def fingerprint(self) -> str:
+        """Identifies the query, eg. for cache keys."""
+
+        query = json.dumps([self.columns, self.where])
+        return hashlib.sha256(query.encode()).hexdigest()
+
+    def expression(self, json_lines: bool = False) -> str:
+        """Writes the query as an S3 Select SQL expression.
+
+        Args: json_lines (bool): True for json lines files, where values are
+            cast to text before they are compared.
+
+        Returns: SQL expression eg.
+            SELECT s."name" FROM S3Object s WHERE s."course" = 'Software'"""
+
+        if self.columns is None:
+            projection = 's.*' if json_lines else '*'
+        else:
+            projection = ', '.join(
+                f's.{_identifier(name)}' for name in self.columns
+            )
+        expression = f'SELECT {projection} FROM S3Object s'
+        conditions = []
+        for name, op, value in self.where:
+            column = 's.' + '.'.join(
+                _identifier(part) for part in name.split('.')
+            )
+            if json_lines:
+                column = f'CAST({column} AS STRING)'
+            literal = value.replace("'", "''")
+            conditions.append(f"{column} {OPERATORS[op][0]} '{literal}'")
+        if conditions:
+            expression += ' WHERE ' + ' AND '.join(conditions)
+        return expression
+
+    def filter_rows(self, rows: Iterable[list]) -> Iterator[list]:
+        """Applies the query to csv rows, eg. when S3 Select is unavailable.
+
+        Args: rows (Iterable[list]): csv rows, the first being the header.
+
+        Yields: the header and rows which meet the conditions, with only
+        the kept columns."""
+
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = {}
+        for i, name in enumerate(header):
+            positions.setdefault(name, i)
+        columns = self._available(header)
+        keep = [positions[name] for name in columns]
+        conditions = [
+            (positions.get(name), OPERATORS[op][1], value)
+            for name, op, value in self.where
+        ]
+
+        yield [header[i] for i in keep]
+        for row in rows:
+            if all(
+                i is not None and i < len(row) and compare(row[i], value)
+                for i, compare, value in conditions
+            ):
+                yield [row[i] if i < len(row) else '' for i in keep]
+
+    def filter_records(self, records: Iterable) -> Iterator:
+        """Applies the query to json records.
+
+        Args: records (Iterable): parsed json records.
+
+        Yields: records which meet the conditions, with only the kept
+        fields."""
+
+        conditions = [
+            (name.split('.'), OPERATORS[op][1], value)
+            for name, op, value in self.where
+        ]
+        for record in records:
+            values = [
+                (_text(_lookup(record, path)), compare, value)
+                for path, compare, value in conditions
+            ]
+            if not all(
+                text is not None and compare(text, value)
+                for text, compare, value in values
+            ):
+                continue
+            if self.columns is not None and isinstance(record, dict):
+                record = {
+                    name: record[name] for name in self.columns
+                    if name in record
+                }
+            yield record
+
+    def _available(self, header: list[str]) -> list[str]:
+        """Finds the kept columns in header, warning about missing ones."""
+
+        if self.columns is None:
+            return list(header)
+        missing = [name for name in self.columns if name not in header]
+        if missing:
+            logger.warning(
+                ', '.join(missing) + ' columns not found in data.'
+            )
+        return [name for name in self.columns if name in header]
+
+
+class SelectEventStream(io.RawIOBase):
+    """Readable binary stream of the records in an S3 Select event stream.
+
+    Events are read from the stream only as the records are read, so the
+    first records can be obfuscated while S3 is still selecting the rest.
+
+    Args:
+        events (Iterable[dict]): events from the Payload of a
+            select_object_content response, or a stub of them in tests eg.
+            [{"Records": {"Payload": b"1,a\\n"}}, {"End": {}}].
+        prefix (bytes): data read before the records, eg. a csv header.
+
+    Attributes:
+        stats (dict): Details of the last Stats event, eg. BytesScanned and
+            BytesReturned."""
+
+    def __init__(self, events: Iterable[dict], prefix: bytes = b""):
+        self._events = events
+        self._iterator = iter(events)
+        # payload being read and position in it, so reads are not copied
+        self._buffer = memoryview(prefix)
+        self._offset = 0
+        self._ended = False
+        self.stats = {}
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._offset >= len(self._buffer) and self._next_event():
+            pass
+        size = min(len(buffer), len(self._buffer) - self._offset)
+        buffer[:size] = self._buffer[self._offset:self._offset + size]
+        self._offset += size
+        return size
+
+    def _next_event(self) -> bool:
+        """Reads the next event, returning False at the end of the stream.
+
+        Raises:
+            IncompleteSelectResults: if the stream ended without an End
+                event, so some records may be missing."""
+
+        if self._ended:
+            return False
+        event = next(self._iterator, None)
+        if event is None:
+            logger.error(
+                'Unable to process. S3 Select results ended early.'
+            )
+            raise IncompleteSelectResults
+        if "Records" in event:
+            self._buffer = memoryview(event["Records"]["Payload"])
+            self._offset = 0
+        elif "Stats" in event:
+            self.stats = event["Stats"]["Details"]
+        elif "End" in event:
+            self._ended = True
+            if self.stats:
+                logger.info(
+                    f'S3 Select returned {self.stats.get("BytesReturned")} '
+                    f'of {self.stats.get("BytesScanned")} bytes scanned.'
+                )
+        return True
+
+    def close(self) -> None:
+        if not self.closed and hasattr(self._events, "close"):
+            self._events.close()
+        super().close()
+
+
+def select_s3_object(
+    bucket: str,
+    key: str,
+    query: SelectQuery,
+    client: BaseClient = None,
+) -> BinaryIO:
+    """Runs a query on an S3 object with S3 Select.
+
+    Args:
+        bucket (str): bucket name
+        key (str): key name
+        query (SelectQuery): columns and conditions to select.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: SelectEventStream of the selected data, in the format of the
+    object and uncompressed, including the header of csv files. None if S3
+    Select cannot be used, when the object should be read with a GET."""
+
+    client = client or get_s3_client()
+    name, codec = split_compression(key)
+    extension = name.rpartition('.')[2].lower()
+    if extension not in SELECT_EXTENSIONS:
+        logger.info(f'S3 Select is not used for {extension} files.')
+        return None
+
+    prefix = b""
+    if extension == 'csv':
+        # S3 Select does not send back the header, so it is read first
+        probe = probe_s3_object(bucket, key, [], client=client)
+        if not probe.header:
+            return None
+        codec = probe.codec
+        header = query._available(probe.header)
+        prefix = b"".join(rows_to_csv_chunks([header]))
+        serialization = {'CSV': {
+            'FileHeaderInfo': 'USE', 'AllowQuotedRecordDelimiter': True,
+        }}
+        output = {'CSV': {'RecordDelimiter': '\n'}}
+        expression = SelectQuery(header, query.where).expression()
+    else:
+        serialization = {'JSON': {'Type': 'LINES'}}
+        output = {'JSON': {'RecordDelimiter': '\n'}}
+        expression = query.expression(json_lines=True)
+
+    if codec not in SELECT_COMPRESSION:
+        logger.info(f'S3 Select is not used for {codec} compressed files.')
+        return None
+    serialization['CompressionType'] = SELECT_COMPRESSION[codec]
+
+    from botocore.exceptions import ClientError
+    try:
+        response = client.select_object_content(
+            Bucket=bucket, Key=key, Expression=expression,
+            ExpressionType='SQL', InputSerialization=serialization,
+            OutputSerialization=output,
+        )
+    except ClientError as err:
+        code = err.response.get("Error", {}).get("Code")
+        if code in _FATAL_ERRORS:
+            raise
+        logger.warning(
+            f'S3 Select is not available for s3://{bucket}/{key} ({code}), '
+            'downloading the whole object instead.'
+        )
+        return None
+    return SelectEventStream(response["Payload"], prefix)
+
+
+def _identifier(name: str) -> str:
+    """Quotes a column name for an SQL expression."""
+
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lookup(record: Any, path: list[str]) -> Any:
+    """Finds the value at a path of keys into nested objects, or None."""
+
+    for key in path:
+        if not isinstance(record, dict):
+            return None
+        record = record.get(key)
+    return record
+
+
+def _text(value: Any) -> str:
+    """Converts a json value to text as S3 Select's CAST AS STRING does."""
+
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return json.dumps(value)
@@ -0,0 +1,326 @@
+"""Helper functions used by obfuscator for streaming data to and from S3."""
+
+from __future__ import annotations
+
+import io
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Iterator
+from .clients import get_s3_client
+from .parallel import DEFAULT_MAX_WORKERS, bounded_map
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+# S3 rejects multipart uploads where any part but the last is under 5 MiB
+MIN_PART_SIZE = 5 * 1024 * 1024
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RANGE_SIZE = 8 * 1024 * 1024
+
+
+def upload_stream_to_s3(
+    chunks: Iterable[bytes],
+    bucket: str,
+    key: str,
+    part_size: int = DEFAULT_PART_SIZE,
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    client: BaseClient = None,
+    metadata: dict = None,
+) -> dict:
+    """Uploads chunks of bytes to S3 as they are produced.
+
+    Chunks are buffered until a part of part_size has filled, which is then
+    uploaded in a background thread as part of a multipart upload while the
+    next part is being produced. The upload is completed once chunks are
+    exhausted and aborted if anything fails. If the data never fills the
+    first part it is sent with a single put_object instead.
+
+    Args:
+        chunks (Iterable[bytes]): data to upload eg. from obfuscator_streaming
+        bucket (str): name of bucket to be written to
+        key (str): name of the key to save the file to.
+        part_size (int): size in bytes of each part, at least 5 MiB.
+        max_concurrency (int): maximum number of parts held in memory and
+            uploading at the same time.
+        client (BaseClient): optional S3 client, defaults to get_s3_client()
+        metadata (dict): optional user metadata to save with the object.
+
+    Returns: response from complete_multipart_upload or put_object."""
+
+    if part_size < MIN_PART_SIZE:
+        raise ValueError(f'part_size must be at least {MIN_PART_SIZE} bytes')
+
+    client = client or get_s3_client()
+    extra_args = {"Metadata": metadata} if metadata else {}
+    chunks = iter(chunks)
+    buffer = bytearray()
+
+    # fill the first part before deciding whether multipart is needed
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= part_size:
+            break
+    else:
+        return client.put_object(
+            Bucket=bucket, Key=key, Body=bytes(buffer), **extra_args
+        )
+
+    upload_id = client.create_multipart_upload(
+        Bucket=bucket, Key=key, **extra_args
+    )["UploadId"]
+
+    try:
+        parts = _upload_parts(
+            client, chunks, buffer, bucket, key, upload_id, part_size,
+            max_concurrency,
+        )
+        response = client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": parts},
+        )
+    except BaseException:
+        logger.error(f'Upload to s3://{bucket}/{key} failed, aborting.')
+        client.abort_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=upload_id
+        )
+        raise
+
+    logger.info(f'Uploaded {len(parts)} parts to s3://{bucket}/{key}')
+    return response
+
+
+def _upload_parts(
+    client,
+    chunks: Iterable[bytes],
+    buffer: bytearray,
+    bucket: str,
+    key: str,
+    upload_id: str,
+    part_size: int,
+    max_concurrency: int,
+) -> list[dict]:
+    """Uploads parts from buffer & chunks, returning list of completed parts.
+
+    At most max_concurrency parts are in flight so memory use is bounded."""
+
+    def upload(part_number: int, body: bytes) -> dict:
+        response = client.upload_part(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            PartNumber=part_number,
+            Body=body,
+        )
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
+    parts = []
+    pending: list[Future] = []
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+
+        def submit(body: bytes) -> None:
+            if len(pending) >= max_concurrency:
+                parts.append(pending.pop(0).result())
+            part_number = len(parts) + len(pending) + 1
+            pending.append(executor.submit(upload, part_number, body))
+
+        try:
+            while True:
+                while len(buffer) >= part_size:
+                    submit(bytes(buffer[:part_size]))
+                    del buffer[:part_size]
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                buffer += chunk
+
+            if buffer:
+                submit(bytes(buffer))
+            parts.extend(future.result() for future in pending)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    return parts
+
+
+def get_s3_object_size(
+    bucket: str, key: str, client: BaseClient = None
+) -> int:
+    """Gets size in bytes of given S3 object without downloading it.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+
+    Returns: ContentLength of the object."""
+
+    client = client or get_s3_client()
+    return client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+
+
+def if_match_params(if_match: str) -> dict:
+    """Makes the parameters of a GET which only succeeds while the object
+    still has ETag if_match, or no parameters if if_match is None."""
+
+    return {"IfMatch": if_match} if if_match else {}
+
+
+def get_s3_object_range(
+    bucket: str,
+    key: str,
+    start: int,
+    end: int,
+    client: BaseClient = None,
+    if_match: str = None,
+) -> bytes:
+    """Gets a range of bytes from given S3 object with a ranged GET.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        start(int): index of first byte to fetch
+        end(int): index of last byte to fetch, inclusive.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        if_match(str): optional ETag the object must still have, otherwise
+            a PreconditionFailed ClientError is raised.
+
+    Returns: requested bytes of the object."""
+
+    client = client or get_s3_client()
+    s3_object = client.get_object(
+        Bucket=bucket,
+        Key=key,
+        Range=f"bytes={start}-{end}",
+        **if_match_params(if_match),
+    )
+    return s3_object["Body"].read()
+
+
+def iter_s3_ranges(
+    bucket: str,
+    key: str,
+    size: int,
+    range_size: int = DEFAULT_RANGE_SIZE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    client: BaseClient = None,
+) -> Iterator[bytes]:
+    """Fetches S3 object in byte ranges concurrently, yielding them in order.
+
+    At most max_workers ranges are downloading or waiting to be consumed at
+    once, so memory is bounded by max_workers * range_size.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        size(int): size of the object in bytes, see get_s3_object_size.
+        range_size(int): number of bytes fetched by each ranged GET.
+        max_workers(int): number of concurrent ranged GETs.
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+            with a connection pool of max_workers.
+
+    Yields: consecutive ranges of the object as bytes."""
+
+    client = client or get_s3_client(max_pool_connections=max_workers)
+
+    def fetch(start: int) -> bytes:
+        end = min(start + range_size, size) - 1
+        return get_s3_object_range(bucket, key, start, end, client)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from bounded_map(
+            executor, fetch, range(0, size, range_size), window=max_workers
+        )
+
+
+class S3RangeFile(io.RawIOBase):
+    """Read-only, seekable file-like view of an S3 object.
+
+    Every read is served by a ranged GET for exactly the bytes requested, so
+    libraries which seek around a file (eg. reading a Parquet footer and
+    then selected column chunks) only download the parts they need.
+
+    Args:
+        bucket(str): bucket name
+        key(str): key name
+        client(BaseClient): optional S3 client, defaults to get_s3_client()
+        size(int): size of the object if already known, saves a HEAD.
+        if_match(str): optional ETag the object must still have for every
+            read, see get_s3_object_range.
+
+    Attributes:
+        size(int): size of the object in bytes.
+        bytes_fetched(int): total bytes downloaded so far."""
+
+    def __init__(
+        self,
+        bucket: str,
+        key: str,
+        client: BaseClient = None,
+        size=None,
+        if_match: str = None,
+    ):
+        self.bucket = bucket
+        self.key = key
+        self.client = client or get_s3_client()
+        self.if_match = if_match
+        if size is None:
+            size = get_s3_object_size(bucket, key, self.client)
+        self.size = size
+        self.bytes_fetched = 0
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise ValueError("negative seek position")
+        self._position = offset
+        return offset
+
+    def readinto(self, buffer) -> int:
+        data = self._fetch(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def read(self, size: int = -1) -> bytes:
+        return self._fetch(size)
+
+    def readall(self) -> bytes:
+        return self._fetch(-1)
+
+    def _fetch(self, size: int) -> bytes:
+        """Fetches up to size bytes from the current position in one GET."""
+
+        remaining = self.size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size <= 0:
+            return b""
+        data = get_s3_object_range(
+            self.bucket, self.key, self._position, self._position + size - 1,
+            self.client, self.if_match,
+        )
+        self._position += len(data)
+        self.bytes_fetched += len(data)
+        return data
@@ -12,5 +12,12 @@ setup(
         's3transfer==0.11.2',
         'six==1.17.0',
         'urllib3==2.3.0',
-    ]
+    ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+    },
+    entry_points={
+        'console_scripts': ['obfuscator=obfuscator.cli:main'],
+    },
 )
\ No newline at end of file
@@ -4,6 +4,16 @@ import pytest
 from moto import mock_aws
 import boto3
 import os
+from obfuscator.clients import clear_s3_clients
+
+
+@pytest.fixture(autouse=True)
+def reset_s3_clients():
+    """Clears cached S3 clients so each test starts with fresh clients."""
+
+    clear_s3_clients()
+    yield
+    clear_s3_clients()
 
 
 @pytest.fixture
@@ -34,6 +44,14 @@ def mock_s3_bucket(aws_credentials):
         yield client
 
 
+@pytest.fixture
+def students_csv():
+    """Contents of test/test_data/students.csv as bytes."""
+
+    with open("test/test_data/students.csv", "rb") as f:
+        return f.read()
+
+
 @pytest.fixture
 def s3_bucket_1MB(aws_credentials):
     """Creates mock S3 bucket test-bucket & larger csv file movie.csv
@@ -70,3 +88,38 @@ def s3_optional_csv(aws_credentials):
             Key="optional.csv",
         )
         yield client
+
+
+@pytest.fixture
+def s3_parquet(aws_credentials):
+    """Creates a mock S3 bucket test-bucket & uploads parquet file
+    students.parquet with 3 row groups, created from students.csv with an
+    extra large notes column."""
+
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    from pyarrow import csv as pa_csv
+    from io import BytesIO
+
+    table = pa_csv.read_csv("test/test_data/students.csv")
+    table = pa.concat_tables([table] * 1000)
+    notes = pa.array([f"note {i} " * 200 for i in range(table.num_rows)])
+    table = table.append_column("notes", notes)
+    buffer = BytesIO()
+    pq.write_table(
+        table, buffer, row_group_size=1000, compression="none",
+        use_dictionary=False,
+    )
+
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(
+            Bucket="test-bucket",
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+        client.put_object(
+            Bucket="test-bucket",
+            Key="students.parquet",
+            Body=buffer.getvalue(),
+        )
+        yield client
@@ -0,0 +1,159 @@
+"""Testing functions in obfuscator/aio.py"""
+
+import pytest
+import asyncio
+import codecs
+import json
+from obfuscator.main import obfuscator, obfuscator_streaming
+from obfuscator.aio import (
+    obfuscator_async,
+    obfuscator_streaming_async,
+    obfuscator_to_s3_async,
+    obfuscate_many_async,
+    upload_stream_to_s3_async,
+)
+from obfuscator.exceptions import InvalidFileToObfuscate
+from obfuscator.s3_utils import MIN_PART_SIZE
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+async def collect(chunks) -> bytes:
+    """Joins the chunks of an async iterator."""
+
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TestObfuscatorAsync:
+    """Tests obfuscator_async function in obfuscator/aio.py"""
+
+    @pytest.mark.it("Returns the same output as obfuscator")
+    def test_matches_obfuscator(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["name", "email_address"])
+        result = asyncio.run(obfuscator_async(json_str))
+        assert result.getvalue() == obfuscator(json_str).getvalue()
+
+    @pytest.mark.it("Drops a BOM and blank lines as obfuscator does")
+    @pytest.mark.parametrize("body", [
+        codecs.BOM_UTF8 + b"name,x\nAlice,1\n",
+        b"name,x\n\nAlice,1\r\n\r\n\n",
+    ])
+    def test_bom_and_blank_lines(self, mock_s3_bucket, body):
+        """Uses mock_s3_bucket fixture."""
+
+        mock_s3_bucket.put_object(Bucket="test-bucket", Key="a.csv", Body=body)
+        json_str = request("a.csv", ["name"])
+        result = asyncio.run(obfuscator_async(json_str))
+        assert result.getvalue() == b"name,x\r\n***,1\r\n"
+        assert result.getvalue() == obfuscator(
+            json_str, schema_policy="fail"
+        ).getvalue()
+
+    @pytest.mark.it("Streams large csv files in blocks of records")
+    def test_streaming(self, s3_bucket_1MB):
+        """Testing output matches obfuscator_streaming when records are
+        split across reads.
+
+        Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        json_str = request("movies.csv", ["Title", "Director"])
+        result = asyncio.run(collect(
+            obfuscator_streaming_async(json_str, chunk_size=1000)
+        ))
+        assert result == b"".join(obfuscator_streaming(json_str))
+
+    @pytest.mark.it("Yields to the event loop while obfuscating")
+    def test_does_not_block(self, s3_bucket_1MB):
+        """Testing another task keeps running while a file is obfuscated.
+
+        Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        json_str = request("movies.csv", ["Title"])
+
+        async def run() -> int:
+            ticks = 0
+            done = asyncio.Event()
+
+            async def ticker():
+                nonlocal ticks
+                while not done.is_set():
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            task = asyncio.create_task(ticker())
+            await collect(obfuscator_streaming_async(json_str, 4096))
+            done.set()
+            await task
+            return ticks
+
+        assert asyncio.run(run()) > 100
+
+    @pytest.mark.it("Obfuscates json files")
+    def test_json(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        records = [{"name": "a", "id": 1}]
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="a.json", Body=json.dumps(records)
+        )
+        result = asyncio.run(obfuscator_async(request("a.json", ["name"])))
+        assert json.loads(result.getvalue()) == [{"name": "***", "id": 1}]
+
+
+class TestObfuscateManyAsync:
+    """Tests obfuscate_many_async function in obfuscator/aio.py"""
+
+    @pytest.mark.it("Obfuscates files concurrently, returning errors")
+    def test_many(self, mock_s3_bucket):
+        """Testing results are in order with at most max_concurrency files
+        in progress at once.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["name"])
+        json_strs = [json_str] * 20 + [request("students.txt", ["name"])]
+        results = asyncio.run(
+            obfuscate_many_async(json_strs, max_concurrency=5)
+        )
+        expected = obfuscator(json_str).getvalue()
+        assert [r.getvalue() for r in results[:20]] == [expected] * 20
+        assert isinstance(results[20], InvalidFileToObfuscate)
+
+
+class TestUploadStreamAsync:
+    """Tests upload_stream_to_s3_async function in obfuscator/aio.py"""
+
+    @pytest.mark.it("Uploads small output with put_object")
+    def test_to_s3(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["name"])
+        asyncio.run(obfuscator_to_s3_async(json_str, "test-bucket", "o.csv"))
+        body = mock_s3_bucket.get_object(Bucket="test-bucket", Key="o.csv")
+        assert body["Body"].read() == obfuscator(json_str).getvalue()
+
+    @pytest.mark.it("Uploads large output in parts")
+    def test_multipart(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        async def chunks():
+            for i in range(12):
+                yield bytes([i]) * (1024 * 1024)
+
+        response = asyncio.run(upload_stream_to_s3_async(
+            chunks(), "test-bucket", "big", part_size=MIN_PART_SIZE
+        ))
+        assert response["ETag"].endswith('-3"')
+        body = mock_s3_bucket.get_object(Bucket="test-bucket", Key="big")
+        assert body["Body"].read() == b"".join(
+            bytes([i]) * (1024 * 1024) for i in range(12)
+        )
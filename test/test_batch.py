@@ -0,0 +1,113 @@
+"""Testing functions in obfuscator/batch.py"""
+
+import pytest
+from csv import DictReader
+from io import StringIO
+from obfuscator.batch import (
+    obfuscate_batch,
+    get_bucket_and_prefix_from_string,
+    list_s3_keys,
+)
+from obfuscator.exceptions import InvalidFileToObfuscate
+
+
+@pytest.fixture
+def s3_batch_bucket(mock_s3_bucket):
+    """Adds copies of students.csv and a text file under new_data/ prefix"""
+
+    for i in range(5):
+        mock_s3_bucket.upload_file(
+            Filename="test/test_data/students.csv",
+            Bucket="test-bucket",
+            Key=f"new_data/file{i}.csv",
+        )
+    mock_s3_bucket.put_object(
+        Bucket="test-bucket", Key="new_data/notes.txt", Body=b"notes"
+    )
+    yield mock_s3_bucket
+
+
+def read_csv(client, key: str) -> list[dict]:
+    """Reads csv object in test-bucket as list of dictionaries."""
+
+    body = client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+    return list(DictReader(StringIO(body.decode("utf-8"))))
+
+
+class TestObfuscateBatch:
+    """Tests obfuscate_batch function in obfuscator/batch.py"""
+
+    @pytest.mark.it("Obfuscates every csv file under given prefix")
+    def test_prefix(self, s3_batch_bucket):
+        """Testing each file is saved under obfuscated/ with fields
+        obfuscated & a success entry is in the manifest."""
+
+        manifest = obfuscate_batch(
+            "s3://test-bucket/new_data/", ["name", "email_address"],
+            max_concurrency=3,
+        )
+        assert len(manifest) == 5
+        for i, entry in enumerate(manifest):
+            assert entry == {
+                "file_to_obfuscate": f"s3://test-bucket/new_data/file{i}.csv",
+                "obfuscated_file":
+                    f"s3://test-bucket/obfuscated/new_data/file{i}.csv",
+                "status": "success",
+            }
+            key = f"obfuscated/new_data/file{i}.csv"
+            rows = read_csv(s3_batch_bucket, key)
+            assert all(row["name"] == "***" for row in rows)
+
+    @pytest.mark.it("Records errors in manifest without stopping batch")
+    def test_list_with_errors(self, s3_batch_bucket):
+        """Testing missing & unsupported files give error entries while
+        the remaining files are still obfuscated."""
+
+        files = [
+            "s3://test-bucket/new_data/file0.csv",
+            "s3://test-bucket/new_data/missing.csv",
+            "s3://test-bucket/new_data/notes.txt",
+        ]
+        manifest = obfuscate_batch(files, ["name"], output_prefix="out/")
+        assert [entry["status"] for entry in manifest] == [
+            "success", "error", "error",
+        ]
+        assert "NoSuchKey" in manifest[1]["error"]
+        assert read_csv(s3_batch_bucket, "out/new_data/file0.csv")
+
+    @pytest.mark.it("Does not obfuscate files already under output prefix")
+    def test_skips_output_prefix(self, s3_batch_bucket):
+        """Testing a second run over the whole bucket ignores outputs."""
+
+        obfuscate_batch("s3://test-bucket/new_data/", ["name"])
+        manifest = obfuscate_batch("s3://test-bucket/", ["name"])
+        assert len(manifest) == 6  # students.csv & 5 files in new_data
+
+
+class TestGetBucketAndPrefixFromString:
+    """Tests get_bucket_and_prefix_from_string in obfuscator/batch.py"""
+
+    @pytest.mark.it("Obtains bucket and prefix from s3 address")
+    def test_bucket_and_prefix(self):
+        """Testing returns expected bucket and prefix."""
+
+        result = get_bucket_and_prefix_from_string("s3://bucket/new_data/")
+        assert result == ("bucket", "new_data/")
+
+    @pytest.mark.it("Throws error if not an s3 address")
+    def test_invalid_prefix(self):
+        """Testing throws error if address does not start with s3://"""
+
+        with pytest.raises(InvalidFileToObfuscate):
+            get_bucket_and_prefix_from_string("bucket/new_data/")
+
+
+class TestListS3Keys:
+    """Tests list_s3_keys function in obfuscator/batch.py"""
+
+    @pytest.mark.it("Lists keys of supported files under prefix")
+    def test_lists_keys(self, s3_batch_bucket):
+        """Testing only csv files under the prefix are listed."""
+
+        result = list(list_s3_keys("test-bucket", "new_data/"))
+        assert result == [f"new_data/file{i}.csv" for i in range(5)]
@@ -0,0 +1,69 @@
+"""Testing benchmark harness in benchmarks/benchmark.py"""
+
+import pytest
+import json
+from csv import reader
+from io import StringIO
+from benchmarks.benchmark import (
+    generate_csv,
+    pii_fields_for,
+    run_benchmarks,
+    compare_results,
+)
+
+
+class TestGenerateCSV:
+    """Tests generate_csv function in benchmarks/benchmark.py"""
+
+    @pytest.mark.it("Generates requested rows, columns & quoting")
+    def test_generate(self):
+        """Testing generated csv parses to the requested shape."""
+
+        data = generate_csv(20, 7, quoted=True, multiline=True)
+        rows = list(reader(StringIO(data.decode("utf-8"), newline="")))
+        assert len(rows) == 21
+        assert all(len(row) == 7 for row in rows)
+        assert b'"' in data
+        assert any("\n" in value for value in rows[1])
+
+    @pytest.mark.it("Chooses PII fields from ratio")
+    def test_pii_fields(self):
+        """Testing ratio of columns are chosen as PII fields."""
+
+        assert pii_fields_for(10, 0.5) == [
+            "col_0", "col_2", "col_4", "col_6", "col_8",
+        ]
+        assert pii_fields_for(10, 0.01) == ["col_0"]
+
+
+class TestRunBenchmarks:
+    """Tests run_benchmarks & compare_results in benchmarks/benchmark.py"""
+
+    @pytest.mark.it("Records every stage of a small scenario")
+    def test_run(self, aws_credentials):
+        """Testing results are json serialisable and contain stats for
+        every stage."""
+
+        results = run_benchmarks(
+            rows=[50], columns=[4], pii_ratios=[0.5], quoting=["multiline"],
+            trace_allocations=True,
+        )
+        json.dumps(results)
+        stages = results["results"][0]["stages"]
+        assert list(stages) == [
+            "fetch", "parse", "obfuscate", "serialise", "upload",
+            "bytes_rewrite", "streaming", "streaming_bytes", "parallel",
+            "parallel_processes",
+        ]
+        for stats in stages.values():
+            assert stats["seconds"] > 0
+            assert stats["peak_allocated_bytes"] > 0
+            assert "rss_growth_bytes" in stats
+        assert results["results"][0]["process_peak_rss_bytes"] > 0
+        assert stages["streaming"]["bytes_out"] == (
+            stages["serialise"]["bytes_out"]
+        )
+        lines = compare_results(results, results)
+        assert lines[0] == (
+            "rows=50 columns=4 pii_ratio=0.5 multiline fetch: 1.00x"
+        )
@@ -0,0 +1,236 @@
+"""Testing functions in obfuscator/cache.py"""
+
+import pytest
+import json
+import os
+from botocore.exceptions import ClientError
+from obfuscator.main import obfuscator, obfuscator_to_s3
+from obfuscator.batch import obfuscate_batch
+from obfuscator.cache import (
+    DiskCache,
+    ResultCache,
+    S3MetadataCache,
+    make_cache_key,
+    source_version,
+)
+from obfuscator.pseudonymise import Pseudonymiser
+from obfuscator.s3_select import SelectQuery
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+def count_calls(client, operation: str) -> list:
+    """Records each call of operation made with client in returned list."""
+
+    calls = []
+    client.meta.events.register(
+        f"before-call.s3.{operation}",
+        lambda **kwargs: calls.append(operation),
+    )
+    return calls
+
+
+class TestCacheKey:
+    """Tests make_cache_key & source_version in obfuscator/cache.py"""
+
+    @pytest.mark.it("Cache key ignores order of fields but not the request")
+    def test_make_cache_key(self):
+        """Testing keys differ by version, fields, mode and compression."""
+
+        key = make_cache_key("bkt", "a.csv", '"etag"', ["name", "email"])
+        assert key == make_cache_key(
+            "bkt", "a.csv", '"etag"', ["email", "name"]
+        )
+        assert len({
+            key,
+            make_cache_key("bkt", "a.csv", '"other"', ["name", "email"]),
+            make_cache_key("bkt", "a.csv", '"etag"', ["name"]),
+            make_cache_key(
+                "bkt", "a.csv", '"etag"', ["name", "email"],
+                Pseudonymiser("secret"),
+            ),
+            make_cache_key(
+                "bkt", "a.csv", '"etag"', ["name", "email"],
+                compression="gzip",
+            ),
+        }) == 5
+
+    @pytest.mark.it("Pseudonymisers are identified without their key")
+    def test_fingerprint(self):
+        """Testing fingerprints match only for the same key & settings."""
+
+        fingerprint = Pseudonymiser("secret").fingerprint()
+        assert "secret" not in fingerprint
+        assert fingerprint == Pseudonymiser("secret").fingerprint()
+        assert fingerprint != Pseudonymiser("other").fingerprint()
+        assert fingerprint != Pseudonymiser("secret", length=8).fingerprint()
+
+    @pytest.mark.it("Version changes when the object is overwritten")
+    def test_source_version(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        version = source_version("test-bucket", "students.csv")
+        assert version == source_version("test-bucket", "students.csv")
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="students.csv", Body=b"name\na\n"
+        )
+        assert version != source_version("test-bucket", "students.csv")
+
+
+class TestDiskCache:
+    """Tests DiskCache class in obfuscator/cache.py"""
+
+    @pytest.mark.it("Returns stored results and None for missing results")
+    def test_get_put(self, tmp_path):
+        """Uses pytest tmp_path fixture."""
+
+        cache = DiskCache(str(tmp_path / "cache"))
+        assert cache.get("a") is None
+        cache.put("a", b"data")
+        assert cache.get("a") == b"data"
+
+    @pytest.mark.it("Evicts least recently used results past max_bytes")
+    def test_eviction(self, tmp_path):
+        """Uses pytest tmp_path fixture."""
+
+        cache = DiskCache(str(tmp_path), max_bytes=25)
+        cache.put("a", b"a" * 10)
+        cache.put("b", b"b" * 10)
+        os.utime(tmp_path / "a", (1, 1))
+        os.utime(tmp_path / "b", (2, 2))
+        cache.get("a")
+        cache.put("c", b"c" * 10)
+        assert cache.get("a") == b"a" * 10
+        assert cache.get("b") is None
+        assert cache.get("c") == b"c" * 10
+        cache.put("d", b"d" * 30)
+        assert cache.get("d") is None
+
+
+class TestObfuscatorCache:
+    """Tests caching of output by obfuscator function"""
+
+    @pytest.mark.it("Repeated requests only make a HEAD request")
+    @pytest.mark.parametrize("backend", ["disk", "s3"])
+    def test_cache_hit(self, mock_s3_bucket, tmp_path, backend):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        if backend == "disk":
+            cache = DiskCache(str(tmp_path))
+        else:
+            cache = S3MetadataCache("test-bucket", client=mock_s3_bucket)
+        json_str = request("students.csv", ["name"])
+        expected = obfuscator(json_str, client=mock_s3_bucket, cache=cache)
+        assert expected.getvalue() == obfuscator(json_str).getvalue()
+
+        gets = count_calls(mock_s3_bucket, "GetObject")
+        puts = count_calls(mock_s3_bucket, "PutObject")
+        result = obfuscator(json_str, client=mock_s3_bucket, cache=cache)
+        assert result.getvalue() == expected.getvalue()
+        assert puts == []
+        assert len(gets) == (0 if backend == "disk" else 1)
+
+    @pytest.mark.it("Obfuscates again when the object or fields change")
+    def test_cache_miss(self, mock_s3_bucket, tmp_path):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        cache = DiskCache(str(tmp_path))
+        obfuscator(request("students.csv", ["name"]), cache=cache)
+        json_str = request("students.csv", ["email_address"])
+        result = obfuscator(json_str, cache=cache)
+        assert result.getvalue() == obfuscator(json_str).getvalue()
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="students.csv", Body=b"name\nbob\n"
+        )
+        result = obfuscator(request("students.csv", ["name"]), cache=cache)
+        assert result.getvalue() == b"name\r\n***\r\n"
+
+    @pytest.mark.it("Does not cache output of an object changed after HEAD")
+    @pytest.mark.parametrize("select", [None, SelectQuery(["name"])])
+    def test_changed_after_head(self, mock_s3_bucket, tmp_path, select):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        cache = DiskCache(str(tmp_path))
+        overwritten = []
+
+        def overwrite(**kwargs):
+            if not overwritten:
+                overwritten.append(True)
+                mock_s3_bucket.put_object(
+                    Bucket="test-bucket", Key="students.csv",
+                    Body=b"name\nbob\n",
+                )
+
+        mock_s3_bucket.meta.events.register(
+            "after-call.s3.HeadObject", overwrite
+        )
+        json_str = request("students.csv", ["name"])
+        with pytest.raises(ClientError) as err:
+            obfuscator(
+                json_str, client=mock_s3_bucket, cache=cache, select=select
+            )
+        assert err.value.response["Error"]["Code"] == "PreconditionFailed"
+        assert os.listdir(tmp_path) == []
+
+        result = obfuscator(json_str, client=mock_s3_bucket, cache=cache)
+        assert result.getvalue() == b"name\r\n***\r\n"
+
+    @pytest.mark.it("Can only use caches which implement every method")
+    def test_abstract_cache(self):
+        """Testing ResultCache is abstract."""
+
+        class PartialCache(ResultCache):
+            def get(self, cache_key):
+                return None
+
+        with pytest.raises(TypeError):
+            PartialCache()
+
+
+class TestSkipUnchanged:
+    """Tests skip_unchanged in obfuscator_to_s3 and obfuscate_batch"""
+
+    @pytest.mark.it("obfuscator_to_s3 skips unchanged output")
+    def test_to_s3(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["name"])
+        obfuscator_to_s3(
+            json_str, "test-bucket", "out.csv", skip_unchanged=True
+        )
+
+        gets = count_calls(mock_s3_bucket, "GetObject")
+        puts = count_calls(mock_s3_bucket, "PutObject")
+        obfuscator_to_s3(
+            json_str, "test-bucket", "out.csv", client=mock_s3_bucket,
+            skip_unchanged=True,
+        )
+        assert gets == [] and puts == []
+
+        obfuscator_to_s3(
+            request("students.csv", ["email_address"]), "test-bucket",
+            "out.csv", client=mock_s3_bucket, skip_unchanged=True,
+        )
+        assert len(gets) == 1 and len(puts) == 1
+
+    @pytest.mark.it("obfuscate_batch records skipped files")
+    def test_batch(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        files = ["s3://test-bucket/students.csv"]
+        manifest = obfuscate_batch(files, ["name"], skip_unchanged=True)
+        assert manifest[0]["status"] == "success"
+        manifest = obfuscate_batch(files, ["name"], skip_unchanged=True)
+        assert manifest[0] == {
+            "file_to_obfuscate": "s3://test-bucket/students.csv",
+            "obfuscated_file": "s3://test-bucket/obfuscated/students.csv",
+            "status": "skipped",
+        }
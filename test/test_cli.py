@@ -0,0 +1,242 @@
+"""Testing functions in obfuscator/cli.py and obfuscator/file_utils.py"""
+
+import pytest
+import codecs
+import csv
+import gzip
+import io
+import json
+from obfuscator.cli import main
+from obfuscator.file_utils import (
+    BufferFile,
+    MappedFile,
+    UnclosedReader,
+    write_chunks,
+)
+from obfuscator.main import obfuscate_s3_object, obfuscator
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+class RecordingWriter(io.BytesIO):
+    """BytesIO recording the size of each write."""
+
+    def __init__(self):
+        super().__init__()
+        self.sizes = []
+
+    def write(self, data) -> int:
+        self.sizes.append(len(data))
+        return super().write(data)
+
+
+class TestMappedFile:
+    """Tests MappedFile class in obfuscator/file_utils.py"""
+
+    @pytest.mark.it("Reads and seeks like a binary file")
+    def test_read(self, tmp_path):
+        """Uses tmp_path fixture."""
+
+        path = tmp_path / "data.bin"
+        path.write_bytes(b"0123456789")
+        with MappedFile(str(path)) as source:
+            assert source.size == 10
+            assert source.read(4) == b"0123"
+            buffer = bytearray(3)
+            assert source.readinto(buffer) == 3 and buffer == b"456"
+            assert source.read() == b"789"
+            assert source.read(1) == b""
+            source.seek(-2, io.SEEK_END)
+            assert source.read() == b"89"
+            assert bytes(source.getbuffer()[:2]) == b"01"
+        assert source.closed
+
+    @pytest.mark.it("Reads empty files")
+    def test_empty(self, tmp_path):
+        """Uses tmp_path fixture."""
+
+        path = tmp_path / "empty.csv"
+        path.write_bytes(b"")
+        with MappedFile(str(path)) as source:
+            assert source.size == 0 and source.read() == b""
+
+
+class TestBufferFile:
+    """Tests BufferFile & UnclosedReader classes in obfuscator/file_utils.py"""
+
+    @pytest.mark.it("Reads a memoryview in place")
+    def test_read(self):
+        """Testing the buffer is not copied, and is released on close."""
+
+        data = bytearray(b"0123456789")
+        source = BufferFile(memoryview(data)[2:])
+        assert source.read(3) == b"234"
+        assert source.getbuffer().obj is data
+        source.close()
+        data.extend(b"!")
+
+    @pytest.mark.it("Leaves the stream it reads open")
+    def test_unclosed(self):
+        """Testing UnclosedReader reads and seeks the wrapped stream."""
+
+        stream = io.BytesIO(b"abcdef")
+        with UnclosedReader(stream) as reader:
+            assert reader.read(2) == b"ab"
+            buffer = bytearray(2)
+            assert reader.readinto(buffer) == 2 and buffer == b"cd"
+            reader.seek(1)
+            assert reader.read() == b"bcdef"
+        assert not stream.closed
+
+
+class TestWriteChunks:
+    """Tests write_chunks function in obfuscator/file_utils.py"""
+
+    @pytest.mark.it("Joins small chunks into large writes")
+    def test_write_size(self):
+        """Testing every write but the last is at least write_size."""
+
+        out = RecordingWriter()
+        chunks = [bytes([i]) * 100 for i in range(25)]
+        assert write_chunks(chunks, out, write_size=1000) == 2500
+        assert out.sizes == [1000, 1000, 500]
+        assert out.getvalue() == b"".join(chunks)
+
+
+class TestCli:
+    """Tests main function in obfuscator/cli.py"""
+
+    @pytest.mark.it("Obfuscates a local csv file to a local file")
+    def test_local(self, tmp_path, mock_s3_bucket, students_csv):
+        """Testing output of each engine matches the same file in S3.
+
+        Uses tmp_path, mock_s3_bucket & students_csv fixtures."""
+
+        source = tmp_path / "students.csv"
+        source.write_bytes(students_csv)
+        output = tmp_path / "out.csv"
+        fields = ["name", "email_address"]
+        for engine in ["csv", "bytes"]:
+            assert main([
+                str(source), "-f", ",".join(fields), "-o", str(output),
+                "--engine", engine,
+            ]) == 0
+            expected = obfuscate_s3_object(
+                "test-bucket", "students.csv", fields, engine=engine
+            )
+            assert output.read_bytes() == b"".join(expected)
+
+    @pytest.mark.it("Reads stdin and writes stdout")
+    def test_stdio(self, monkeypatch, capsysbinary, students_csv):
+        """Uses monkeypatch, capsysbinary & students_csv fixtures."""
+
+        monkeypatch.setattr(
+            "sys.stdin", io.TextIOWrapper(io.BytesIO(students_csv))
+        )
+        assert main(["-", "-f", "name"]) == 0
+        lines = capsysbinary.readouterr().out.splitlines()
+        assert lines[0] == students_csv.splitlines()[0]
+        assert all(line.split(b",")[1] == b"***" for line in lines[1:])
+
+    @pytest.mark.it("Drops a utf-8 BOM from local and stdin csv input")
+    def test_bom(self, tmp_path, monkeypatch, capsysbinary, students_csv):
+        """Uses tmp_path, monkeypatch, capsysbinary & students_csv fixtures."""
+
+        source = tmp_path / "students.csv"
+        source.write_bytes(codecs.BOM_UTF8 + students_csv)
+        output = tmp_path / "out.csv"
+        assert main([str(source), "-f", "student_id", "-o", str(output)]) == 0
+        monkeypatch.setattr(
+            "sys.stdin",
+            io.TextIOWrapper(io.BytesIO(codecs.BOM_UTF8 + students_csv)),
+        )
+        assert main(["-", "-f", "student_id"]) == 0
+        for out in (output.read_bytes(), capsysbinary.readouterr().out):
+            lines = out.splitlines()
+            assert lines[0] == students_csv.splitlines()[0]
+            assert all(line.startswith(b"***,") for line in lines[1:])
+
+    @pytest.mark.it("Reads and writes S3 objects and compressed files")
+    def test_s3(self, tmp_path, mock_s3_bucket, students_csv):
+        """Uses tmp_path, mock_s3_bucket & students_csv fixtures."""
+
+        source = tmp_path / "students.csv.gz"
+        source.write_bytes(gzip.compress(students_csv))
+        assert main([
+            str(source), "-f", "name", "-o", "s3://test-bucket/out.csv"
+        ]) == 0
+        body = mock_s3_bucket.get_object(Bucket="test-bucket", Key="out.csv")
+        expected = obfuscator(request("students.csv", ["name"])).getvalue()
+        assert body["Body"].read() == expected
+
+        output = tmp_path / "out.csv.gz"
+        assert main([
+            "s3://test-bucket/students.csv", "-f", "name", "-o", str(output)
+        ]) == 0
+        assert gzip.decompress(output.read_bytes()) == expected
+
+    @pytest.mark.it("Obfuscates local parquet and json files")
+    def test_formats(self, tmp_path, capsysbinary):
+        """Uses tmp_path & capsysbinary fixtures."""
+
+        pa = pytest.importorskip("pyarrow")
+        pq = pytest.importorskip("pyarrow.parquet")
+        source = tmp_path / "people.parquet"
+        pq.write_table(pa.table({"id": [1, 2], "name": ["A", "B"]}), source)
+        output = tmp_path / "out.parquet"
+        assert main([str(source), "-f", "name", "-o", str(output)]) == 0
+        assert pq.read_table(output).column("name").to_pylist() == [
+            "***", "***"
+        ]
+
+        source = tmp_path / "people.data"
+        source.write_bytes(b'{"id": 1, "name": "A"}\n')
+        assert main([str(source), "-f", "name", "--format", "jsonl"]) == 0
+        assert json.loads(capsysbinary.readouterr().out) == {
+            "id": 1, "name": "***"
+        }
+
+    @pytest.mark.it("Refuses to overwrite its input and keeps failed output")
+    def test_output_is_input(self, tmp_path, students_csv):
+        """Testing the input is left intact and no partial file is written.
+
+        Uses tmp_path & students_csv fixtures."""
+
+        source = tmp_path / "students.csv"
+        source.write_bytes(students_csv)
+        with pytest.raises(SystemExit) as err:
+            main([str(source), "-f", "name", "-o", str(source)])
+        assert err.value.code == 2
+        assert source.read_bytes() == students_csv
+
+        output = tmp_path / "out.csv"
+        output.write_bytes(b"previous")
+        bad = tmp_path / "bad.csv"
+        bad.write_bytes(b"name\n\xff\xfe\n")
+        assert main([str(bad), "-f", "name", "-o", str(output)]) == 1
+        assert output.read_bytes() == b"previous"
+        assert sorted(p.name for p in tmp_path.iterdir()) == [
+            "bad.csv", "out.csv", "students.csv"
+        ]
+
+    @pytest.mark.it("Returns 1 for errors and exits 2 for invalid arguments")
+    def test_errors(self, tmp_path, capsys):
+        """Uses tmp_path & capsys fixtures."""
+
+        assert main([str(tmp_path / "missing.csv"), "-f", "name"]) == 1
+        assert "No such file" in capsys.readouterr().err
+        with pytest.raises(SystemExit) as err:
+            main([str(tmp_path / "data.txt"), "-f", "name"])
+        assert err.value.code == 2
+
+        source = tmp_path / "large.csv"
+        source.write_bytes(b"name,x\n" + b"a" * (csv.field_size_limit() + 1))
+        assert main([str(source), "-f", "name"]) == 1
+        assert "field larger than field limit" in capsys.readouterr().err
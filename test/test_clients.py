@@ -0,0 +1,104 @@
+"""Testing functions in obfuscator/clients.py"""
+
+import pytest
+import boto3
+import gc
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+from obfuscator.clients import (
+    get_s3_client,
+    set_s3_client,
+    clear_s3_clients,
+)
+from obfuscator.main import get_s3_object
+
+
+class TestGetS3Client:
+    """Tests get_s3_client function in obfuscator/clients.py"""
+
+    @pytest.mark.it("Returns the same client on repeated calls")
+    def test_cached(self, aws_credentials):
+        """Testing client is only created once for the same config."""
+
+        assert get_s3_client() is get_s3_client()
+
+    @pytest.mark.it("Returns a different client for a different config")
+    def test_config(self, aws_credentials):
+        """Testing config is applied & cached separately."""
+
+        client = get_s3_client(
+            max_pool_connections=50, retry_mode="adaptive", read_timeout=5
+        )
+        assert client is not get_s3_client()
+        assert client.meta.config.max_pool_connections == 50
+        assert client.meta.config.retries["mode"] == "adaptive"
+        assert client.meta.config.read_timeout == 5
+
+    @pytest.mark.it("Creates one client when called from many threads")
+    def test_thread_safe(self, aws_credentials):
+        """Testing concurrent calls all receive the same client."""
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            clients = list(executor.map(lambda _: get_s3_client(), range(64)))
+        assert all(client is clients[0] for client in clients)
+
+    @pytest.mark.it("Creates client from given session")
+    def test_session(self, aws_credentials):
+        """Testing client uses region of the given session."""
+
+        session = boto3.session.Session(region_name="us-east-1")
+        assert get_s3_client(session=session).meta.region_name == "us-east-1"
+
+    @pytest.mark.it("Caches clients of a session only while it is in use")
+    def test_session_released(self, aws_credentials):
+        """Testing cached clients do not keep discarded sessions alive."""
+
+        session = boto3.session.Session()
+        client = get_s3_client(session=session)
+        assert get_s3_client(session=session) is client
+        assert get_s3_client(session=boto3.session.Session()) is not client
+        session_ref = weakref.ref(session)
+        del session, client
+        gc.collect()
+        assert session_ref() is None
+
+    @pytest.mark.it("Returns injected client until cleared")
+    def test_set_client(self, aws_credentials):
+        """Testing set_s3_client overrides cached clients."""
+
+        mock_client = MagicMock()
+        set_s3_client(mock_client)
+        assert get_s3_client() is mock_client
+        assert get_s3_client(max_pool_connections=1) is mock_client
+        clear_s3_clients()
+        assert get_s3_client() is not mock_client
+
+
+class TestClientInjection:
+    """Tests I/O functions use the given or injected client."""
+
+    @pytest.mark.it("Uses client passed as an argument")
+    def test_client_argument(self):
+        """Testing get_s3_object makes its request with the given client."""
+
+        mock_client = MagicMock()
+        mock_client.get_object.return_value = {
+            "Body": MagicMock(read=MagicMock(return_value=b"name\n"))
+        }
+        assert get_s3_object("bucket", "key", mock_client) == "name\n"
+        mock_client.get_object.assert_called_once_with(
+            Bucket="bucket", Key="key"
+        )
+
+    @pytest.mark.it("Uses client injected with set_s3_client")
+    def test_injected_client(self):
+        """Testing get_s3_object uses injected client by default."""
+
+        mock_client = MagicMock()
+        mock_client.get_object.return_value = {
+            "Body": MagicMock(read=MagicMock(return_value=b"name\n"))
+        }
+        set_s3_client(mock_client)
+        assert get_s3_object("bucket", "key") == "name\n"
+        mock_client.get_object.assert_called_once()
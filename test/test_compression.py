@@ -0,0 +1,198 @@
+"""Testing functions in obfuscator/compression.py"""
+
+import pytest
+import asyncio
+import bz2
+import gzip
+import json
+from io import BytesIO
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_streaming,
+    obfuscator_to_s3,
+    obfuscate_s3_object,
+    get_bucket_and_key_from_string,
+)
+from obfuscator.aio import obfuscator_async
+from obfuscator.compression import (
+    codec_from_content_encoding,
+    compress_chunks,
+    open_decompressed,
+    split_compression,
+)
+from obfuscator.exceptions import InvalidFileToObfuscate
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """Compresses data in small chunks with compress_chunks."""
+
+    chunks = [data[i:i + 100] for i in range(0, len(data), 100)]
+    return b"".join(compress_chunks(chunks, codec))
+
+
+class TestCodecDetection:
+    """Tests detecting codecs in obfuscator/compression.py"""
+
+    @pytest.mark.it("Splits a compression extension from a key")
+    def test_split_compression(self):
+        """Testing compound extensions & keys which are not compressed."""
+
+        assert split_compression("a/b.csv.gz") == ("a/b.csv", "gzip")
+        assert split_compression("a/b.JSON.ZST") == ("a/b.JSON", "zstd")
+        assert split_compression("a/b.ndjson.bz2") == ("a/b.ndjson", "bz2")
+        assert split_compression("a/b.csv") == ("a/b.csv", None)
+        assert split_compression("gz") == ("gz", None)
+
+    @pytest.mark.it("Finds the codec named by Content-Encoding")
+    def test_content_encoding(self):
+        """Testing supported, unsupported and missing headers."""
+
+        assert codec_from_content_encoding("gzip") == "gzip"
+        assert codec_from_content_encoding(" X-GZIP ") == "gzip"
+        assert codec_from_content_encoding("zstd") == "zstd"
+        assert codec_from_content_encoding("gzip,aws-chunked") == "gzip"
+        assert codec_from_content_encoding("aws-chunked") is None
+        assert codec_from_content_encoding("br") is None
+        assert codec_from_content_encoding(None) is None
+
+    @pytest.mark.it("get_bucket_and_key_from_string returns the file format")
+    def test_bucket_and_key(self):
+        """Testing compressed files give the extension of their format."""
+
+        result = get_bucket_and_key_from_string("s3://bkt/new/file1.csv.gz")
+        assert result == ("bkt", "new/file1.csv.gz", "csv")
+        with pytest.raises(InvalidFileToObfuscate):
+            get_bucket_and_key_from_string("s3://bkt/new/file1.txt.gz")
+        with pytest.raises(InvalidFileToObfuscate):
+            get_bucket_and_key_from_string("s3://bkt/new/file1.parquet.gz")
+
+
+class TestCodecs:
+    """Tests compress_chunks & open_decompressed in compression.py"""
+
+    @pytest.mark.it("Round trips data through each codec")
+    @pytest.mark.parametrize("codec", ["gzip", "bz2", "zstd"])
+    def test_round_trip(self, codec, students_csv):
+        """Testing data compressed in chunks is decompressed when read."""
+
+        if codec == "zstd":
+            pytest.importorskip("zstandard")
+        data = students_csv * 100
+        compressed = compress(data, codec)
+        assert len(compressed) < len(data)
+        assert open_decompressed(BytesIO(compressed), codec).read() == data
+
+    @pytest.mark.it("Reads concatenated gzip members and bz2 streams")
+    def test_concatenated(self):
+        """Testing files made by appending compressed files are read."""
+
+        data = gzip.compress(b"a,b\n") + gzip.compress(b"1,2\n")
+        assert open_decompressed(BytesIO(data), "gzip").read() == (
+            b"a,b\n1,2\n"
+        )
+        data = bz2.compress(b"a,b\n") + bz2.compress(b"1,2\n")
+        assert open_decompressed(BytesIO(data), "bz2").read() == (
+            b"a,b\n1,2\n"
+        )
+
+    @pytest.mark.it("Raises ValueError for unsupported codecs")
+    def test_invalid_codec(self):
+        """Testing codecs are validated."""
+
+        with pytest.raises(ValueError):
+            list(compress_chunks([b"a"], "lzma"))
+        with pytest.raises(ValueError):
+            open_decompressed(BytesIO(b""), "lzma")
+
+
+class TestCompressedObjects:
+    """Tests obfuscating compressed S3 objects"""
+
+    @pytest.mark.it("Obfuscates compressed csv with every entry point")
+    @pytest.mark.parametrize("codec, extension", [
+        ("gzip", "gz"), ("bz2", "bz2"), ("zstd", "zst"),
+    ])
+    def test_csv(self, mock_s3_bucket, students_csv, codec, extension):
+        """Testing output matches obfuscating the uncompressed file.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        if codec == "zstd":
+            pytest.importorskip("zstandard")
+        key = f"students.csv.{extension}"
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key=key, Body=compress(students_csv, codec)
+        )
+        fields = ["name", "email_address"]
+        plain = request("students.csv", fields)
+        compressed = request(key, fields)
+        assert obfuscator(compressed).getvalue() == (
+            obfuscator(plain).getvalue()
+        )
+        assert b"".join(obfuscator_streaming(compressed)) == (
+            b"".join(obfuscator_streaming(plain))
+        )
+        assert asyncio.run(obfuscator_async(compressed)).getvalue() == (
+            b"".join(obfuscator_streaming(plain))
+        )
+        bytes_engine = obfuscate_s3_object(
+            "test-bucket", key, fields, engine="bytes"
+        )
+        assert b"".join(bytes_engine) == b"".join(obfuscate_s3_object(
+            "test-bucket", "students.csv", fields, engine="bytes"
+        ))
+
+    @pytest.mark.it("Detects the codec from Content-Encoding")
+    def test_content_encoding(self, mock_s3_bucket, students_csv):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="encoded.csv",
+            Body=gzip.compress(students_csv), ContentEncoding="gzip",
+        )
+        fields = ["name"]
+        result = obfuscator_streaming(request("encoded.csv", fields))
+        assert b"".join(result) == b"".join(
+            obfuscator_streaming(request("students.csv", fields))
+        )
+
+    @pytest.mark.it("Decompresses json lines files")
+    def test_json_lines(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        data = b'{"name": "a"}\n{"name": "b"}\n'
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="a.jsonl.bz2", Body=bz2.compress(data)
+        )
+        result = obfuscator(request("a.jsonl.bz2", ["name"])).getvalue()
+        assert result == b'{"name": "***"}\n{"name": "***"}\n'
+
+    @pytest.mark.it("Compresses output when asked or from the output key")
+    def test_compressed_output(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["name"])
+        expected = obfuscator(json_str).getvalue()
+        result = obfuscator(json_str, compression="gzip").getvalue()
+        assert gzip.decompress(result) == expected
+        result = b"".join(obfuscator_streaming(json_str, compression="bz2"))
+        assert bz2.decompress(result).replace(b"\r\n", b"\n") == (
+            expected.replace(b"\r\n", b"\n")
+        )
+
+        obfuscator_to_s3(json_str, "test-bucket", "out/students.csv.gz")
+        body = mock_s3_bucket.get_object(
+            Bucket="test-bucket", Key="out/students.csv.gz"
+        )["Body"].read()
+        assert gzip.decompress(body).replace(b"\r\n", b"\n") == (
+            expected.replace(b"\r\n", b"\n")
+        )
@@ -0,0 +1,128 @@
+"""Testing functions in obfuscator/csv_bytes.py"""
+
+import pytest
+import logging
+from csv import reader
+from io import BytesIO, StringIO
+from obfuscator.csv_bytes import (
+    rewrite_csv_block,
+    rewrite_csv_bytes,
+    rewrite_csv_stream,
+)
+
+
+def parse(data: bytes) -> list[list[str]]:
+    """Parses csv bytes into a list of rows."""
+
+    return list(reader(StringIO(data.decode("utf-8"), newline="")))
+
+
+class TestRewriteCSVBlock:
+    """Tests rewrite_csv_block function in obfuscator/csv_bytes.py"""
+
+    @pytest.mark.it("Replaces only obfuscated fields in unquoted data")
+    def test_unquoted(self):
+        """Testing all other bytes are passed through unchanged."""
+
+        block = b"1,name 1,hello\r\n2,name 2,world\r\n"
+        expected = b"1,***,hello\r\n2,***,world\r\n"
+        assert rewrite_csv_block(block, [1]) == expected
+
+    @pytest.mark.it("Keeps line endings when last field is obfuscated")
+    def test_last_field(self):
+        """Testing carriage returns are not lost or masked."""
+
+        block = b"1,name 1\r\n2,name 2\n3,name 3"
+        expected = b"1,***\r\n2,***\n3,***"
+        assert rewrite_csv_block(block, [1]) == expected
+
+    @pytest.mark.it("Replaces quoted fields containing delimiters")
+    def test_quoted(self):
+        """Testing quoted fields with commas, newlines & escaped quotes are
+        replaced whole while other quoted fields keep their quoting."""
+
+        block = (
+            b'1,"name, 1","say ""hi""\nthere",x\r\n'
+            b'2,"name\n2",plain,"y, z"\r\n'
+        )
+        expected = (
+            b'1,***,"say ""hi""\nthere",x\r\n'
+            b'2,***,plain,"y, z"\r\n'
+        )
+        assert rewrite_csv_block(block, [1]) == expected
+
+    @pytest.mark.it("Handles short rows & blank lines")
+    def test_short_rows(self):
+        """Testing rows with fewer fields than the obfuscated index."""
+
+        for block in [b"1,a,b\n2\n\n3,c\n", b'1,"a",b\n2\n\n3,c\n']:
+            result = parse(rewrite_csv_block(block, [1, 2]))
+            assert result == [["1", "***", "***"], ["2"], [], ["3", "***"]]
+        for block in [b"a,1\n\nb\r\n\r\n", b'"a",1\n\nb\r\n\r\n']:
+            result = rewrite_csv_block(block, [0])
+            assert result == b"***,1\n\n***\r\n\r\n"
+
+    @pytest.mark.it("Falls back to full parsing for invalid csv")
+    def test_invalid_csv(self, caplog):
+        """Testing stray quotes in unquoted fields are still obfuscated."""
+
+        block = b'1,na"me,x\n2,"a"b,y\n'
+        with caplog.at_level(logging.WARNING):
+            result = rewrite_csv_block(block, [1])
+        assert "falling back to full csv parsing" in caplog.text
+        assert [row[1] for row in parse(result)] == ["***", "***"]
+
+
+class TestRewriteCSVBytes:
+    """Tests rewrite_csv_bytes function in obfuscator/csv_bytes.py"""
+
+    @pytest.mark.it("Keeps header and obfuscates named fields")
+    def test_header(self):
+        """Testing header is passed through & fields resolved from it."""
+
+        data = b"id,name,email\n1,name 1,1@email.com\n"
+        expected = b"id,name,email\n1,***,***\n"
+        assert rewrite_csv_bytes(data, ["email", "name"]) == expected
+
+    @pytest.mark.it("Accepts memoryview")
+    def test_memoryview(self):
+        """Testing a memoryview over csv data can be rewritten."""
+
+        data = memoryview(b"id,name\n1,name 1\n")
+        assert rewrite_csv_bytes(data, ["name"]) == b"id,name\n1,***\n"
+
+    @pytest.mark.it("Gives same rows as parsing larger file")
+    def test_matches_parsed_output(self):
+        """Testing parsed output of movies file matches obfuscating parsed
+        rows, and unobfuscated fields are byte-for-byte identical."""
+
+        with open("test/test_data/IMDB_Movies_Dataset.csv", "rb") as f:
+            data = f.read()
+        result = rewrite_csv_bytes(data, ["Title", "Director", "Writer"])
+        expected = parse(data)
+        for row in expected[1:]:
+            row[1] = row[3] = row[4] = "***"
+        assert parse(result) == expected
+        assert result.endswith(data[data.rindex(b",", 0, -1):])
+
+
+class TestRewriteCSVStream:
+    """Tests rewrite_csv_stream function in obfuscator/csv_bytes.py"""
+
+    @pytest.mark.it("Output does not depend on read size")
+    def test_chunk_sizes(self):
+        """Testing records split between reads are rewritten correctly."""
+
+        data = b'id,name\n1,"a\nb"\n2,"c,d"\n3,e\n'
+        expected = b"id,name\n1,***\n2,***\n3,***\n"
+        for size in range(1, len(data) + 1):
+            result = rewrite_csv_stream(BytesIO(data), ["name"], size)
+            assert b"".join(result) == expected
+
+    @pytest.mark.it("Yields nothing if given no data")
+    def test_empty(self, caplog):
+        """Testing empty stream logs warning."""
+
+        with caplog.at_level(logging.WARNING):
+            assert list(rewrite_csv_stream(BytesIO(b""), ["name"])) == []
+        assert "No data found to obfuscate." in caplog.text
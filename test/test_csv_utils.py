@@ -3,12 +3,18 @@
 import pytest
 import logging
 from csv import DictReader
-from io import StringIO
+from io import StringIO, BytesIO
+from types import GeneratorType
 from obfuscator.main import get_s3_object
 from obfuscator.csv_utils import (
     object_body_to_list,
     obfuscate_fields,
     list_to_csv_streaming_object,
+    iter_csv_rows,
+    obfuscate_rows,
+    rows_to_csv_chunks,
+    get_field_indices,
+    obfuscate_row_lists,
 )
 
 
@@ -87,6 +93,31 @@ class TestObfuscateFields:
         result = obfuscate_fields(test_list, test_fields)
         assert result == expected
 
+    @pytest.mark.it("Keeps key order and does not add missing keys")
+    def test_key_order_and_missing_keys(self):
+        """Testing rows missing an obfuscated key are left without it and
+        keys stay in their original order."""
+
+        test_list = [
+            {"message": "hello", "name": "name 1", "email": "1@email.com"},
+            {"message": "world", "email": "2@email.com"},
+        ]
+        expected = [
+            {"message": "hello", "name": "***", "email": "***"},
+            {"message": "world", "email": "***"},
+        ]
+        result = obfuscate_fields(test_list, ["name", "email"])
+        assert result == expected
+        assert [list(row) for row in result] == [list(row) for row in expected]
+
+    @pytest.mark.it("Does not modify the given data")
+    def test_does_not_mutate(self):
+        """Testing original dictionaries are left unchanged."""
+
+        test_list = [{"name": "name 1", "message": "hello"}]
+        obfuscate_fields(test_list, ["name"])
+        assert test_list == [{"name": "name 1", "message": "hello"}]
+
     @pytest.mark.it("Logs warning if given no data to obfuscate")
     def test_obfuscate_fields_empty_list(self, caplog):
         """Test warning is logged if no data passed as an argument."""
@@ -188,3 +219,157 @@ class TestListToCSVStreamingObject:
         result = list_to_csv_streaming_object([])
         reader = DictReader(result)
         assert list(reader) == []
+
+
+class TestIterCSVRows:
+    """Tests iter_csv_rows function in obfuscator/csv_utils.py"""
+
+    @pytest.mark.it("Returns generator")
+    def test_returns_generator(self):
+        """Testing rows are produced lazily by a generator."""
+
+        result = iter_csv_rows(BytesIO(b"name,email\nname 1,1@email.com\n"))
+        assert isinstance(result, GeneratorType)
+
+    @pytest.mark.it("Yields header followed by each row")
+    def test_yields_rows(self):
+        """Testing all rows are yielded as lists, starting with header."""
+
+        stream = BytesIO(b"name,email\nname 1,1@email.com\n")
+        expected = [["name", "email"], ["name 1", "1@email.com"]]
+        assert list(iter_csv_rows(stream)) == expected
+
+    @pytest.mark.it("Handles quoted fields containing newlines")
+    def test_quoted_newlines(self):
+        """Testing a quoted field spanning multiple lines is one value."""
+
+        stream = BytesIO(b'name,message\nname 1,"hello\nworld"\n')
+        expected = [["name", "message"], ["name 1", "hello\nworld"]]
+        assert list(iter_csv_rows(stream)) == expected
+
+    @pytest.mark.it("Decodes multi-byte characters split across reads")
+    def test_multibyte_characters(self):
+        """Testing non-ascii data from students file is decoded correctly."""
+
+        text = "name\n" + "Yûichirô\n" * 10000
+        stream = BytesIO(text.encode("utf-8"))
+        result = list(iter_csv_rows(stream))
+        assert len(result) == 10001
+        assert all(row == ["Yûichirô"] for row in result[1:])
+
+
+class TestObfuscateRows:
+    """Tests obfuscate_rows function in obfuscator/csv_utils.py"""
+
+    @pytest.mark.it("Yields header unchanged & obfuscates given fields")
+    def test_obfuscates_fields(self):
+        """Testing only the given fields are obfuscated in each row."""
+
+        test_rows = [
+            ["name", "email", "message"],
+            ["name 1", "1@email.com", "hello"],
+            ["name 2", "2@email.com", "world"],
+        ]
+        expected = [
+            ["name", "email", "message"],
+            ["***", "***", "hello"],
+            ["***", "***", "world"],
+        ]
+        result = obfuscate_rows(iter(test_rows), ["name", "email"])
+        assert list(result) == expected
+
+    @pytest.mark.it("Logs warning if given no data to obfuscate")
+    def test_no_data(self, caplog):
+        """Testing nothing yielded & warning logged for empty input."""
+
+        with caplog.at_level(logging.WARNING):
+            result = list(obfuscate_rows(iter([]), ["name"]))
+        assert result == []
+        assert 'No data found to obfuscate.' in caplog.text
+
+    @pytest.mark.it("Returns rows unchanged if no fields found")
+    def test_fields_not_found(self, caplog):
+        """Testing rows are passed through & warnings logged."""
+
+        test_rows = [["name", "email"], ["name 1", "1@email.com"]]
+        with caplog.at_level(logging.WARNING):
+            result = list(obfuscate_rows(iter(test_rows), ["address"]))
+        assert result == test_rows
+        assert 'address fields not found in data.' in caplog.text
+        assert 'No fields found to obfuscate' in caplog.text
+
+
+class TestRowsToCSVChunks:
+    """Tests rows_to_csv_chunks function in obfuscator/csv_utils.py"""
+
+    @pytest.mark.it("Yields bytes which make up the csv data")
+    def test_yields_csv_bytes(self):
+        """Testing joined chunks can be read back as the original rows."""
+
+        test_rows = [["name", "message"], ["***", "hello, world"]]
+        result = b"".join(rows_to_csv_chunks(test_rows))
+        reader = DictReader(StringIO(result.decode("utf-8")))
+        assert list(reader) == [{"name": "***", "message": "hello, world"}]
+
+    @pytest.mark.it("Splits output into chunks of the given size")
+    def test_chunk_size(self):
+        """Testing output is split into multiple chunks no larger than
+        chunk size plus one row."""
+
+        test_rows = [["name"]] + [["name " + str(i)] for i in range(1000)]
+        chunks = list(rows_to_csv_chunks(test_rows, chunk_size=100))
+        assert len(chunks) > 1
+        assert all(len(chunk) < 120 for chunk in chunks)
+
+    @pytest.mark.it("Yields nothing if no rows given")
+    def test_no_rows(self):
+        """Testing function can handle empty data as an input."""
+
+        assert list(rows_to_csv_chunks([])) == []
+
+
+class TestGetFieldIndices:
+    """Tests get_field_indices function in obfuscator/csv_utils.py"""
+
+    @pytest.mark.it("Returns sorted positions of given fields in header")
+    def test_indices(self):
+        """Testing indices follow header order, not field order."""
+
+        header = ["id", "name", "course", "email"]
+        assert get_field_indices(header, ["email", "name"]) == [1, 3]
+
+    @pytest.mark.it("Includes every column with a repeated name")
+    def test_repeated_names(self):
+        """Testing duplicate column names are all obfuscated."""
+
+        assert get_field_indices(["name", "id", "name"], ["name"]) == [0, 2]
+
+
+class TestObfuscateRowLists:
+    """Tests obfuscate_row_lists function in obfuscator/csv_utils.py"""
+
+    @pytest.mark.it("Obfuscates given columns in every row")
+    def test_obfuscates_columns(self):
+        """Testing only cells at the given indices are replaced."""
+
+        test_rows = [["1", "name 1", "hello"], ["2", "name 2", "world"]]
+        expected = [["1", "***", "hello"], ["2", "***", "world"]]
+        assert obfuscate_row_lists(test_rows, [1]) == expected
+
+    @pytest.mark.it("Handles rows shorter than the header")
+    def test_short_rows(self):
+        """Testing short rows are obfuscated without raising IndexError."""
+
+        test_rows = [["1", "name 1", "hello"], ["2"], ["3", "name 3"]]
+        expected = [["1", "***", "***"], ["2"], ["3", "***"]]
+        assert obfuscate_row_lists(test_rows, [1, 2]) == expected
+
+    @pytest.mark.it("Handles wide rows with many obfuscated columns")
+    def test_wide_rows(self):
+        """Testing every other column of 500 column rows is obfuscated."""
+
+        test_rows = [[str(i) for i in range(500)] for _ in range(10)]
+        indices = list(range(0, 500, 2))
+        for row in obfuscate_row_lists(test_rows, indices, mask="#"):
+            assert row[::2] == ["#"] * 250
+            assert row[1::2] == [str(i) for i in range(1, 500, 2)]
@@ -0,0 +1,192 @@
+"""Testing functions in obfuscator/detect.py"""
+
+import pytest
+import json
+import random
+from collections import Counter
+from csv import DictReader
+from io import StringIO
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_streaming,
+    obfuscate_s3_object,
+)
+from obfuscator.detect import PIIDetector, luhn_valid, reservoir_sample
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+@pytest.fixture
+def unlabelled_csv(mock_s3_bucket):
+    """Adds people.csv to test-bucket with PII in unhelpfully named fields.
+    """
+
+    rows = ["id,contact_email2,col_a,col_b,col_c,col_d,course"]
+    for i in range(300):
+        rows.append(
+            f"{i},p{i}@example.com,07700 900{i:03d},AB 12 34 56 C,"
+            f"4111 1111 1111 1111,SW1A {i % 9}AA,Data"
+        )
+    mock_s3_bucket.put_object(
+        Bucket="test-bucket", Key="people.csv",
+        Body=("\n".join(rows) + "\n").encode(),
+    )
+    yield mock_s3_bucket
+
+
+class TestPatterns:
+    """Tests matching names and values in obfuscator/detect.py"""
+
+    @pytest.mark.it("Matches names of PII fields")
+    def test_names(self):
+        """Testing names with separators, prefixes and numbers."""
+
+        detector = PIIDetector()
+        for name in [
+            "email", "contact_email2", "E-Mail", "phone", "MobileNumber",
+            "name", "first_name", "Surname", "home_address", "postCode",
+            "ni_number", "card_number", "date_of_birth", "dob",
+        ]:
+            assert detector.matches_name(name), name
+        for name in ["id", "course", "cohort", "course_name", "telescope"]:
+            assert not detector.matches_name(name), name
+
+    @pytest.mark.it("Classifies values by kind of PII")
+    def test_values(self):
+        """Testing each kind of value and values which are not PII."""
+
+        detector = PIIDetector()
+        assert detector.classify("jo.bloggs+x@mail.co.uk") == "email"
+        assert detector.classify("+44 7700 900123") == "phone"
+        assert detector.classify("07700900123") == "phone"
+        assert detector.classify("AB 12 34 56 C") == "ni_number"
+        assert detector.classify("sw1a 1aa") == "postcode"
+        assert detector.classify("4111-1111-1111-1111") == "card_number"
+        for value in [
+            "4111 1111 1111 1112", "1234", "2024-03-31", "Software",
+            "Person 1", "12.5",
+        ]:
+            assert detector.classify(value) is None, value
+
+    @pytest.mark.it("Checks the Luhn checksum of card numbers")
+    def test_luhn(self):
+        """Testing valid & invalid numbers."""
+
+        assert luhn_valid("79927398713")
+        assert luhn_valid("5555 5555 5555 4444")
+        assert not luhn_valid("79927398710")
+
+
+class TestReservoirSample:
+    """Tests reservoir_sample function in obfuscator/detect.py"""
+
+    @pytest.mark.it("Returns k items, or all items if there are fewer")
+    def test_size(self):
+        """Testing sample size and that items are from the input."""
+
+        sample = reservoir_sample(range(10000), 100, random.Random(1))
+        assert len(sample) == len(set(sample)) == 100
+        assert all(0 <= item < 10000 for item in sample)
+        assert sorted(reservoir_sample(range(5), 10)) == list(range(5))
+        assert reservoir_sample(range(5), 0) == []
+
+    @pytest.mark.it("Chooses every item with equal probability")
+    def test_uniform(self):
+        """Testing items from the start and end of the input are chosen
+        roughly as often as each other."""
+
+        rng = random.Random(2)
+        counts = Counter()
+        for _ in range(2000):
+            counts.update(reservoir_sample(range(20), 5, rng))
+        assert min(counts.values()) > 400 and max(counts.values()) < 600
+
+
+class TestDetection:
+    """Tests detecting fields with PIIDetector"""
+
+    @pytest.mark.it("Detects csv columns from names and sampled values")
+    def test_detect_columns(self):
+        """Testing only columns where most values match are detected."""
+
+        header = ["id", "a", "b", "notes"]
+        rows = [
+            [str(i), f"u{i}@x.com", "SW1A 1AA", "call 07700 900123"]
+            for i in range(20000)
+        ]
+        rows[0][1] = "unknown"
+        detector = PIIDetector(sample_size=50, max_rows=1000)
+        assert detector.detect_columns(header, iter(rows)) == ["a", "b"]
+
+    @pytest.mark.it("Detects nested fields of json records")
+    def test_detect_records(self):
+        """Testing detected fields use dotted names."""
+
+        records = [
+            {"id": i, "contact": {"mail": f"u{i}@x.com"}, "phone": None}
+            for i in range(10)
+        ]
+        assert PIIDetector().detect_records(records) == [
+            "contact.mail", "phone"
+        ]
+
+    @pytest.mark.it("Obfuscates detected csv fields with every csv path")
+    def test_obfuscator(self, unlabelled_csv):
+        """Uses unlabelled_csv fixture and people.csv object."""
+
+        json_str = request("people.csv", ["id"])
+        detector = PIIDetector()
+        result = obfuscator(json_str, detector=detector).getvalue()
+        rows = list(DictReader(StringIO(result.decode())))
+        assert len(rows) == 300
+        for row in rows:
+            assert row["course"] == "Data"
+            assert set(row.values()) == {"***", "Data"}
+        streamed = b"".join(obfuscator_streaming(json_str, detector=detector))
+        assert streamed == result
+
+    @pytest.mark.it("Obfuscates detected json fields")
+    def test_json(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        records = [{"id": i, "contact": f"u{i}@x.com"} for i in range(5)]
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="people.jsonl",
+            Body="\n".join(json.dumps(r) for r in records).encode(),
+        )
+        result = obfuscator(
+            request("people.jsonl", []), detector=PIIDetector()
+        ).getvalue()
+        assert [json.loads(line) for line in result.splitlines()] == [
+            {"id": i, "contact": "***"} for i in range(5)
+        ]
+
+    @pytest.mark.it("Obfuscates detected parquet fields")
+    def test_parquet(self, s3_parquet):
+        """Uses s3_parquet fixture and students.parquet object."""
+
+        pq = pytest.importorskip("pyarrow.parquet")
+        result = obfuscator(
+            request("students.parquet", []), detector=PIIDetector()
+        )
+        table = pq.read_table(result)
+        for name in ["name", "email_address"]:
+            assert set(table.column(name).to_pylist()) == {"***"}
+        assert set(table.column("course").to_pylist()) != {"***"}
+
+    @pytest.mark.it("Raises ValueError with the bytes engine")
+    def test_bytes_engine(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        with pytest.raises(ValueError):
+            obfuscate_s3_object(
+                "test-bucket", "students.csv", ["name"], engine="bytes",
+                detector=PIIDetector(),
+            )
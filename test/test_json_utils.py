@@ -0,0 +1,178 @@
+"""Testing functions in obfuscator/json_utils.py"""
+
+import pytest
+import json
+import logging
+from io import BytesIO
+from obfuscator.main import obfuscator, obfuscate_s3_object
+from obfuscator.json_utils import (
+    iter_json_lines,
+    JsonArrayReader,
+    mask_record,
+    obfuscate_records,
+    records_to_json_chunks,
+    obfuscate_json_stream,
+)
+
+
+TEST_RECORDS = [
+    {"name": "name 1", "contact": {"email": "1@email.com", "phone": "1"}},
+    {"name": "name 2", "contact": {"email": "2@email.com"}, "score": 1.5},
+    {"name": "name 3", "addresses": [{"postcode": "A1"}, {"postcode": "B2"}]},
+]
+
+
+class TestIterJsonLines:
+    """Tests iter_json_lines function in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Yields one record per line, skipping blank lines")
+    def test_json_lines(self):
+        """Testing each line is parsed as a record."""
+
+        data = b"".join(json.dumps(r).encode() + b"\n\n" for r in TEST_RECORDS)
+        assert list(iter_json_lines(BytesIO(data))) == TEST_RECORDS
+
+
+class TestJsonArrayReader:
+    """Tests JsonArrayReader class in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Yields each element of an array for any read size")
+    def test_array(self):
+        """Testing elements split across reads are parsed correctly,
+        including numbers at the end of a read."""
+
+        records = TEST_RECORDS + [12345, "a, b", [1, 2], None]
+        data = json.dumps(records, indent=2).encode()
+        for size in [1, 2, 5, 64, 100000]:
+            reader = JsonArrayReader(BytesIO(data), chunk_size=size)
+            assert list(reader) == records
+            assert reader.is_array
+
+    @pytest.mark.it("Yields a single value which is not an array")
+    def test_single_value(self):
+        """Testing a top-level object is the only record."""
+
+        reader = JsonArrayReader(BytesIO(b' {"name": "a"} \n'), chunk_size=3)
+        assert list(reader) == [{"name": "a"}]
+        assert reader.is_array is False
+
+    @pytest.mark.it("Handles empty arrays & empty streams")
+    def test_empty(self):
+        """Testing no records are yielded."""
+
+        assert list(JsonArrayReader(BytesIO(b" [ ] "))) == []
+        assert list(JsonArrayReader(BytesIO(b""))) == []
+
+    @pytest.mark.it("Raises error for invalid json")
+    def test_invalid(self):
+        """Testing JSONDecodeError is raised for malformed arrays."""
+
+        for data in [b'[{"a": 1} {"b": 2}]', b'[{"a": 1}', b'{"a": 1} 2']:
+            with pytest.raises(json.JSONDecodeError):
+                list(JsonArrayReader(BytesIO(data), chunk_size=4))
+
+
+class TestMaskRecord:
+    """Tests mask_record function in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Masks nested values & values in lists of objects")
+    def test_nested(self):
+        """Testing dotted paths follow nested objects & lists."""
+
+        record = json.loads(json.dumps(TEST_RECORDS[2]))
+        assert mask_record(record, ("addresses", "postcode"))
+        assert record["addresses"] == [{"postcode": "***"}] * 2
+
+    @pytest.mark.it("Returns False if path not in record")
+    def test_missing(self):
+        """Testing record is unchanged if path is not found."""
+
+        record = {"contact": "none"}
+        assert not mask_record(record, ("contact", "email"))
+        assert record == {"contact": "none"}
+
+
+class TestObfuscateRecords:
+    """Tests obfuscate_records function in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Obfuscates top-level & nested fields")
+    def test_obfuscates(self, caplog):
+        """Testing given fields are masked & missing fields logged."""
+
+        records = json.loads(json.dumps(TEST_RECORDS))
+        fields = ["name", "contact.email", "address"]
+        with caplog.at_level(logging.INFO):
+            result = list(obfuscate_records(records, fields))
+        assert [r["name"] for r in result] == ["***"] * 3
+        assert result[0]["contact"] == {"email": "***", "phone": "1"}
+        assert "address fields not found in data." in caplog.text
+        assert "name, contact.email fields have been successfully" in (
+            caplog.text
+        )
+
+
+class TestRecordsToJsonChunks:
+    """Tests records_to_json_chunks function in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Writes array or json lines in chunks")
+    def test_chunks(self):
+        """Testing output parses back to the records in either layout."""
+
+        chunks = list(records_to_json_chunks(TEST_RECORDS, chunk_size=10))
+        assert len(chunks) > 1
+        assert json.loads(b"".join(chunks)) == TEST_RECORDS
+        lines = b"".join(records_to_json_chunks(TEST_RECORDS, True))
+        assert [json.loads(line) for line in lines.splitlines()] == (
+            TEST_RECORDS
+        )
+
+    @pytest.mark.it("Writes empty array for no records")
+    def test_empty(self):
+        """Testing no records gives a valid empty array."""
+
+        assert b"".join(records_to_json_chunks([])) == b"[]"
+
+
+class TestObfuscateJsonStream:
+    """Tests obfuscate_json_stream function in obfuscator/json_utils.py"""
+
+    @pytest.mark.it("Keeps a single top-level object as an object")
+    def test_single_object(self):
+        """Testing output layout matches input layout."""
+
+        data = json.dumps(TEST_RECORDS[0]).encode()
+        result = b"".join(obfuscate_json_stream(BytesIO(data), ["name"]))
+        assert json.loads(result)["name"] == "***"
+
+
+class TestObfuscateS3Json:
+    """Tests json & json lines S3 objects are obfuscated by obfuscator."""
+
+    @pytest.mark.it("Obfuscates json lines & json array S3 objects")
+    def test_s3_json(self, mock_s3_bucket):
+        """Testing obfuscate_s3_object & obfuscator choose json backend
+        from the file extension.
+
+        Uses mock_s3_bucket fixture from conftest.py"""
+
+        lines = b"\n".join(json.dumps(r).encode() for r in TEST_RECORDS)
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="events.jsonl", Body=lines
+        )
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="events.json",
+            Body=json.dumps(TEST_RECORDS).encode(),
+        )
+        result = b"".join(obfuscate_s3_object(
+            "test-bucket", "events.jsonl", ["contact.email"]
+        ))
+        records = [json.loads(line) for line in result.splitlines()]
+        assert [r.get("contact", {}).get("email") for r in records] == [
+            "***", "***", None,
+        ]
+        test_request = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/events.json",
+            "pii_fields": ["name"],
+        })
+        records = json.loads(obfuscator(test_request).read())
+        assert [r["name"] for r in records] == ["***"] * 3
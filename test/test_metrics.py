@@ -0,0 +1,191 @@
+"""Testing functions in obfuscator/metrics.py"""
+
+import pytest
+import json
+import time
+from io import BytesIO, StringIO
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_streaming,
+    obfuscator_to_s3,
+)
+from obfuscator.metrics import (
+    NULL_METRICS,
+    CallbackEmitter,
+    EMFEmitter,
+    Metrics,
+    MetricsEmitter,
+    StageMetrics,
+    StatsDEmitter,
+)
+
+
+TEST_JSON = json.dumps({
+    "file_to_obfuscate": "s3://test-bucket/students.csv",
+    "pii_fields": ["name", "email_address"],
+})
+
+
+def record_stages():
+    """Returns Metrics with a CallbackEmitter & the list it records into."""
+
+    emitted = []
+    metrics = Metrics(CallbackEmitter(
+        lambda stages, dimensions: emitted.append((stages, dimensions))
+    ), file="students.csv")
+    return metrics, emitted
+
+
+class TestMetrics:
+    """Tests Metrics class in obfuscator/metrics.py"""
+
+    @pytest.mark.it("Charges nested stages only for their own time")
+    def test_nested_stages(self):
+        """Testing time spent in an inner stage is not counted in the outer
+        stage which was running when it was entered."""
+
+        metrics = Metrics(CallbackEmitter(lambda *args: None))
+
+        def slow_items():
+            for _ in range(2):
+                with metrics.stage("inner"):
+                    time.sleep(0.02)
+                yield b"ab"
+
+        with metrics.stage("outer"):
+            chunks = list(metrics.track("pipeline", slow_items()))
+
+        stages = {stage.stage: stage for stage in metrics.results()}
+        assert chunks == [b"ab", b"ab"]
+        assert stages["inner"].seconds >= 0.04
+        assert stages["pipeline"].seconds < 0.02
+        assert stages["outer"].seconds < 0.02
+        assert stages["pipeline"].bytes_out == 4
+        assert stages["pipeline"].peak_buffer_bytes == 2
+
+    @pytest.mark.it("Records reads from a stream & bytes in from a source")
+    def test_track_reader(self):
+        """Testing reads through track_reader are recorded & passed to the
+        stage that uses the tracked stage as its source."""
+
+        metrics = Metrics(CallbackEmitter(lambda *args: None))
+        stream = metrics.track_reader("read", BytesIO(b"a" * 10))
+        chunks = iter(lambda: stream.read(4), b"")
+        assert b"".join(metrics.track("copy", chunks, source="read")) == (
+            b"a" * 10
+        )
+        stages = {stage.stage: stage for stage in metrics.results()}
+        assert stages["read"].bytes_out == 10
+        assert stages["read"].peak_buffer_bytes == 4
+        assert stages["copy"].bytes_in == 10
+
+    @pytest.mark.it("NULL_METRICS returns items & streams unchanged")
+    def test_null_metrics(self):
+        """Testing disabled metrics do not wrap anything."""
+
+        items = [1, 2]
+        stream = BytesIO()
+        assert NULL_METRICS.track("stage", items) is items
+        assert NULL_METRICS.track_reader("stage", stream) is stream
+        with NULL_METRICS.stage("stage"):
+            pass
+        assert NULL_METRICS.stages == {}
+
+
+class TestEmitters:
+    """Tests emitters in obfuscator/metrics.py"""
+
+    @pytest.mark.it("EMFEmitter writes a CloudWatch EMF document per stage")
+    def test_emf(self):
+        """Testing each line is json with the metrics & dimensions."""
+
+        stream = StringIO()
+        EMFEmitter("test", stream).emit(
+            [StageMetrics("parse", 0.5, 10, 20, 3, 20)], {"file": "a.csv"}
+        )
+        document = json.loads(stream.getvalue())
+        metrics = document["_aws"]["CloudWatchMetrics"][0]
+        assert metrics["Namespace"] == "test"
+        assert {"Name": "seconds", "Unit": "Seconds"} in metrics["Metrics"]
+        assert document["stage"] == "parse"
+        assert document["file"] == "a.csv"
+        assert document["rows"] == 3
+
+    @pytest.mark.it("StatsDEmitter formats timers and counters")
+    def test_statsd(self):
+        """Testing format of StatsD lines."""
+
+        lines = StatsDEmitter(prefix="ob").format(
+            [StageMetrics("parse", 0.5, 10, 20, 3, 20)]
+        )
+        assert "ob.parse.seconds:500.000|ms" in lines
+        assert "ob.parse.rows:3|c" in lines
+        assert "ob.parse.peak_buffer_bytes:20|g" in lines
+
+    @pytest.mark.it("Emitters must implement emit")
+    def test_abstract_emitter(self):
+        """Testing MetricsEmitter is abstract."""
+
+        class NoEmit(MetricsEmitter):
+            pass
+
+        with pytest.raises(TypeError):
+            NoEmit()
+
+
+class TestObfuscatorMetrics:
+    """Tests metrics recorded by obfuscator functions"""
+
+    @pytest.mark.it("obfuscator emits every stage once finished")
+    def test_obfuscator(self, mock_s3_bucket):
+        """Testing stages of the in-memory csv path are recorded.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        metrics, emitted = record_stages()
+        result = obfuscator(TEST_JSON, metrics=metrics)
+        assert len(emitted) == 1
+        stages, dimensions = emitted[0]
+        assert dimensions == {"file": "students.csv"}
+        assert [stage.stage for stage in stages] == [
+            "json_parse", "s3_get", "decode", "parse", "obfuscate",
+            "serialise", "encode",
+        ]
+        stages = {stage.stage: stage for stage in stages}
+        assert stages["parse"].rows == 3
+        assert stages["encode"].bytes_out == len(result.getvalue())
+
+    @pytest.mark.it("obfuscator_streaming emits after the last chunk")
+    def test_streaming(self, mock_s3_bucket):
+        """Testing stages of the streaming csv path are recorded.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        metrics, emitted = record_stages()
+        chunks = obfuscator_streaming(TEST_JSON, metrics=metrics)
+        assert emitted == []
+        output = b"".join(chunks)
+        stages = {stage.stage: stage for stage in emitted[0][0]}
+        assert set(stages) == {
+            "json_parse", "s3_get", "parse", "obfuscate", "serialise"
+        }
+        assert stages["parse"].rows == 4  # header and 3 rows
+        assert stages["serialise"].bytes_out == len(output)
+        size = mock_s3_bucket.head_object(
+            Bucket="test-bucket", Key="students.csv"
+        )["ContentLength"]
+        assert stages["s3_get"].bytes_out == size
+
+    @pytest.mark.it("obfuscator_to_s3 records the upload stage")
+    def test_to_s3(self, mock_s3_bucket):
+        """Testing bytes passed to the upload are recorded.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        metrics, emitted = record_stages()
+        obfuscator_to_s3(TEST_JSON, "test-bucket", "out.csv", metrics=metrics)
+        stages = {stage.stage: stage for stage in emitted[0][0]}
+        size = mock_s3_bucket.head_object(
+            Bucket="test-bucket", Key="out.csv"
+        )["ContentLength"]
+        assert stages["upload"].bytes_in == size
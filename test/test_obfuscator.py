@@ -13,8 +13,14 @@ from obfuscator.csv_utils import (
 )
 from obfuscator.main import (
     obfuscator,
+    obfuscator_streaming,
+    obfuscator_to_s3,
+    obfuscator_parallel,
+    obfuscate_s3_object,
     get_bucket_and_key_from_string,
+    obfuscate_into,
     get_s3_object,
+    get_s3_object_stream,
     save_streaming_obj_to_s3,
 )
 from obfuscator.exceptions import (
@@ -144,6 +150,157 @@ class TestObfuscator:
         assert expected_log in caplog.text
 
 
+class TestObfuscatorStreaming:
+    """Integration tests for obfuscator_streaming in obfuscator/main.py"""
+
+    @pytest.mark.it("Yields bytes with obfuscated expected fields")
+    def test_fields_obfuscated(self, mock_s3_bucket):
+        """Tests joined chunks contain obfuscated csv data.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        test_request = {
+            "file_to_obfuscate": "s3://test-bucket/students.csv",
+            "pii_fields": ["name", "email_address"],
+        }
+        result = b"".join(obfuscator_streaming(json.dumps(test_request)))
+        reader = DictReader(StringIO(result.decode("utf-8")))
+        rows = list(reader)
+        assert len(rows) == 3
+        for row in rows:
+            assert row["name"] == "***"
+            assert row["email_address"] == "***"
+
+    @pytest.mark.it("Output matches output of obfuscator")
+    def test_matches_obfuscator(self, s3_bucket_1MB):
+        """Tests streamed output of larger file is identical to obfuscator.
+
+        Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        test_request = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/movies.csv",
+            "pii_fields": ["Title", "Director", "Writer"],
+        })
+        chunks = list(obfuscator_streaming(test_request, chunk_size=4096))
+        assert len(chunks) > 1
+        assert b"".join(chunks) == obfuscator(test_request).read()
+
+    @pytest.mark.it("Byte engine obfuscates the same fields")
+    def test_bytes_engine(self, s3_bucket_1MB):
+        """Tests byte rewriting engine gives the same csv rows as default.
+
+        Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        result = b"".join(obfuscate_s3_object(
+            "test-bucket", "movies.csv", ["Title"], engine="bytes"
+        ))
+        expected = b"".join(
+            obfuscate_s3_object("test-bucket", "movies.csv", ["Title"])
+        )
+        parsed = list(DictReader(StringIO(result.decode("utf-8"))))
+        assert parsed == list(DictReader(StringIO(expected.decode("utf-8"))))
+
+    @pytest.mark.it("Byte engine skips blank lines in quoted csv")
+    def test_bytes_engine_blank_lines(self, mock_s3_bucket):
+        """Tests blank lines are not obfuscated into records by the byte
+        engine when the first column is obfuscated.
+
+        Uses mock_s3_bucket fixture."""
+
+        data = b'name,b\n"x",1\n\ny,2\r\n\r\n"z\nw",3\n'
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="blank.csv", Body=data
+        )
+        result = b"".join(obfuscate_s3_object(
+            "test-bucket", "blank.csv", ["name"], engine="bytes"
+        ))
+        expected = b"".join(
+            obfuscate_s3_object("test-bucket", "blank.csv", ["name"])
+        )
+        parsed = list(DictReader(StringIO(result.decode("utf-8"))))
+        assert parsed == list(DictReader(StringIO(expected.decode("utf-8"))))
+        assert result == b"name,b\n***,1\n\n***,2\r\n\r\n***,3\n"
+
+    @pytest.mark.it("Raises errors before any output is requested")
+    def test_validates_eagerly(self):
+        """Tests invalid request raises when called, not when iterated."""
+
+        test_request = {"pii_fields": ["name"]}
+        with pytest.raises(NoFileToObfuscate):
+            obfuscator_streaming(json.dumps(test_request))
+
+
+class TestObfuscatorParallel:
+    """Integration tests for obfuscator_parallel in obfuscator/main.py"""
+
+    @pytest.mark.it("Output matches output of obfuscator")
+    def test_matches_obfuscator(self, s3_bucket_1MB):
+        """Tests output from concurrent ranged GETs is identical to the
+        output of obfuscator.
+
+        Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        test_request = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/movies.csv",
+            "pii_fields": ["Title", "Director", "Writer"],
+        })
+        result = obfuscator_parallel(
+            test_request, range_size=64 * 1024, max_workers=4
+        )
+        assert b"".join(result) == obfuscator(test_request).read()
+
+
+class TestObfuscatorToS3:
+    """Integration tests for obfuscator_to_s3 in obfuscator/main.py"""
+
+    @pytest.mark.it("Saves obfuscated file to given bucket and key")
+    def test_saves_obfuscated_file(self, mock_s3_bucket):
+        """Tests file saved to S3 matches output of obfuscator.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        test_request = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/students.csv",
+            "pii_fields": ["name", "email_address"],
+        })
+        obfuscator_to_s3(test_request, "test-bucket", "obfuscated.csv")
+        result = mock_s3_bucket.get_object(
+            Bucket="test-bucket", Key="obfuscated.csv"
+        )
+        assert result["Body"].read() == obfuscator(test_request).read()
+
+
+class TestObfuscateInto:
+    """Tests obfuscate_into function in obfuscator/main.py"""
+
+    @pytest.mark.it("Obfuscates bytes, memoryviews and streams to out")
+    def test_sources(self, mock_s3_bucket, students_csv):
+        """Testing output matches obfuscator and streams are left open.
+
+        Uses mock_s3_bucket & students_csv fixtures."""
+
+        expected = obfuscator(json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/students.csv",
+            "pii_fields": ["name"],
+        })).getvalue()
+        stream = BytesIO(students_csv)
+        for source in [students_csv, memoryview(students_csv), stream]:
+            out = BytesIO()
+            assert obfuscate_into(source, out, ["name"]) == len(expected)
+            assert out.getvalue() == expected
+        assert not stream.closed
+
+    @pytest.mark.it("Obfuscates json records from a buffer")
+    def test_json(self):
+        """Testing extension selects the file format."""
+
+        out = BytesIO()
+        data = bytearray(b'{"id": 1, "name": "A"}\n{"id": 2, "name": "B"}\n')
+        obfuscate_into(data, out, ["name"], extension="jsonl")
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert records == [{"id": 1, "name": "***"}, {"id": 2, "name": "***"}]
+
+
 class TestGetBucketAndKeyFromString:
     """Testing get_bucket_and_key_from_string function in obfuscator/main.py"""
 
@@ -177,9 +334,9 @@ class TestGetBucketAndKeyFromString:
     def test_throw_error_if_no_keyname(self):
         "Testing throws error if no key name"
 
-        test_file = "s3://my_ingestion_bucket"
-        with pytest.raises(InvalidFileToObfuscate):
-            get_bucket_and_key_from_string(test_file)
+        for test_file in ["s3://my_ingestion_bucket", "s3://bucket/", "s3://"]:
+            with pytest.raises(InvalidFileToObfuscate):
+                get_bucket_and_key_from_string(test_file)
 
     @pytest.mark.it('Throws error if unsupported file format')
     def test_throw_error_if_unsupported_file(self):
@@ -223,6 +380,18 @@ class TestAccessS3Object:
             assert list(reader) == list(expected)
 
 
+class TestGetS3ObjectStream:
+    """Testing get_s3_object_stream function in obfuscator/main.py"""
+
+    @pytest.mark.it("Returns readable stream of file contents")
+    def test_returns_stream(self, mock_s3_bucket):
+        """Testing stream can be read & matches the original csv file."""
+
+        result = get_s3_object_stream("test-bucket", "students.csv")
+        with open("test/test_data/students.csv", "rb") as c:
+            assert result.read() == c.read()
+
+
 class TestSaveStreamingObjToS3:
     """Testing save_streaming_obj_to_s3 function in obfuscator/main.py"""
 
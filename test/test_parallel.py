@@ -0,0 +1,224 @@
+"""Testing functions in obfuscator/parallel.py"""
+
+import pytest
+import codecs
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from itertools import count
+from obfuscator.csv_utils import (
+    iter_csv_rows,
+    obfuscate_rows,
+    rows_to_csv_chunks,
+)
+from obfuscator.parallel import (
+    bounded_map,
+    find_first_record_end,
+    find_last_record_end,
+    iter_record_blocks,
+    obfuscate_csv_blocks,
+    obfuscate_csv_file,
+)
+from obfuscator.pseudonymise import Pseudonymiser
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_parallel,
+    obfuscator_streaming,
+)
+
+
+TEST_CSV = (
+    b'name,message,email\n'
+    b'name 1,"hello\nworld",1@email.com\n'
+    b'name 2,"say ""hi""\r\nthen, leave",2@email.com\r\n'
+    b'name 3,plain,3@email.com\n'
+)
+
+
+def split_bytes(data: bytes, size: int) -> list[bytes]:
+    """Splits data into blocks of the given size."""
+
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestBoundedMap:
+    """Tests bounded_map function in obfuscator/parallel.py"""
+
+    @pytest.mark.it("Yields results in the order of the input")
+    def test_keeps_order(self):
+        """Testing results are ordered even when tasks finish out of order"""
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            result = list(bounded_map(executor, pow, range(20), 2, window=3))
+        assert result == [i ** 2 for i in range(20)]
+
+    @pytest.mark.it("Consumes input lazily")
+    def test_lazy(self):
+        """Testing an infinite input can be partially consumed."""
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            results = bounded_map(executor, abs, count(), window=2)
+            assert [next(results) for _ in range(5)] == [0, 1, 2, 3, 4]
+            results.close()
+
+
+class TestFindRecordEnd:
+    """Tests find_first_record_end & find_last_record_end functions."""
+
+    @pytest.mark.it("Finds end of first record ignoring quoted newlines")
+    def test_first_record_end(self):
+        """Testing newline inside quotes is not treated as a boundary."""
+
+        data = b'1,"a\nb"\n2,c\n'
+        assert find_first_record_end(data) == data.index(b"\n2") + 1
+
+    @pytest.mark.it("Finds end of last record ignoring quoted newlines")
+    def test_last_record_end(self):
+        """Testing an unfinished quoted field is not treated as complete."""
+
+        data = b'1,a\n2,"b\nc'
+        assert find_last_record_end(data) == 4
+
+    @pytest.mark.it("Returns -1 if there is no complete record")
+    def test_no_complete_record(self):
+        """Testing both functions return -1 with no record boundary."""
+
+        assert find_first_record_end(b'1,"a\nb') == -1
+        assert find_last_record_end(b'1,"a\nb') == -1
+
+
+class TestIterRecordBlocks:
+    """Tests iter_record_blocks function in obfuscator/parallel.py"""
+
+    @pytest.mark.it("Yields blocks of complete records for any split size")
+    def test_realigns_blocks(self):
+        """Testing each block parses on its own & all blocks join back to
+        the original data."""
+
+        expected = list(iter_csv_rows(BytesIO(TEST_CSV)))
+        for size in range(1, len(TEST_CSV) + 1):
+            blocks = list(iter_record_blocks(split_bytes(TEST_CSV, size)))
+            assert b"".join(blocks) == TEST_CSV
+            rows = []
+            for block in blocks:
+                rows.extend(iter_csv_rows(BytesIO(block)))
+            assert rows == expected
+
+
+class TestObfuscateCSVBlocks:
+    """Tests obfuscate_csv_blocks function in obfuscator/parallel.py"""
+
+    @pytest.mark.it("Output matches obfuscating the file in one piece")
+    def test_matches_serial_output(self):
+        """Testing output is identical to the streaming functions."""
+
+        fields = ["name", "email"]
+        rows = obfuscate_rows(iter_csv_rows(BytesIO(TEST_CSV)), fields)
+        expected = b"".join(rows_to_csv_chunks(rows))
+        for size in [1, 7, 50, 1000]:
+            result = obfuscate_csv_blocks(
+                split_bytes(TEST_CSV, size), fields, max_workers=3
+            )
+            assert b"".join(result) == expected
+
+    @pytest.mark.it("Uses given executor")
+    def test_given_executor(self):
+        """Testing a caller provided executor is used & left open."""
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            result = obfuscate_csv_blocks(
+                split_bytes(TEST_CSV, 10), ["name"], executor=executor
+            )
+            assert b"***" in b"".join(result)
+            assert executor.submit(abs, -1).result() == 1
+
+    @pytest.mark.it("Yields nothing if given no data")
+    def test_no_data(self):
+        """Testing empty input produces empty output."""
+
+        assert list(obfuscate_csv_blocks([], ["name"])) == []
+
+    @pytest.mark.it("Output in worker processes matches the serial output")
+    def test_processes(self):
+        """Testing obfuscate_csv_blocks and obfuscate_csv_file with a
+        process pool keep the original order."""
+
+        fields = ["name", "email"]
+        rows = obfuscate_rows(iter_csv_rows(BytesIO(TEST_CSV)), fields)
+        expected = b"".join(rows_to_csv_chunks(rows))
+        result = obfuscate_csv_blocks(
+            split_bytes(TEST_CSV, 7), fields, processes=2
+        )
+        assert b"".join(result) == expected
+        result = obfuscate_csv_file(
+            BytesIO(TEST_CSV), fields, processes=2, block_size=5
+        )
+        assert b"".join(result) == expected
+
+    @pytest.mark.it("Sends the pseudonymiser to each worker process once")
+    def test_processes_pseudonymiser(self, monkeypatch):
+        """Testing the pseudonymiser is not pickled with every block.
+
+        Uses monkeypatch fixture."""
+
+        pseudonymiser = Pseudonymiser("key")
+        getstate = Pseudonymiser.__getstate__
+        pickled = []
+
+        def count_getstate(self):
+            pickled.append(True)
+            return getstate(self)
+
+        fields = ["name", "email"]
+        rows = obfuscate_rows(
+            iter_csv_rows(BytesIO(TEST_CSV)), fields, pseudonymiser
+        )
+        expected = b"".join(rows_to_csv_chunks(rows))
+        monkeypatch.setattr(Pseudonymiser, "__getstate__", count_getstate)
+        result = b"".join(obfuscate_csv_blocks(
+            split_bytes(TEST_CSV, 7), fields, processes=2,
+            pseudonymiser=pseudonymiser,
+        ))
+        assert result == expected
+        assert 1 <= len(pickled) <= 2
+
+
+class TestObfuscatorParallel:
+    """Tests obfuscator_parallel function in obfuscator/main.py"""
+
+    @pytest.mark.it("Output with worker processes matches streaming output")
+    def test_processes(self, s3_bucket_1MB):
+        """Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        json_str = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/movies.csv",
+            "pii_fields": ["Title", "Director"],
+        })
+        expected = b"".join(obfuscator_streaming(json_str))
+        result = obfuscator_parallel(
+            json_str, range_size=256 * 1024, max_workers=4, processes=2
+        )
+        assert b"".join(result) == expected
+
+    @pytest.mark.it("Obfuscates the first field of a csv with a BOM")
+    @pytest.mark.parametrize("schema_policy", [None, "fail"])
+    def test_bom(self, mock_s3_bucket, schema_policy):
+        """Testing the BOM is not taken as part of the first field name.
+
+        Uses mock_s3_bucket fixture."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="bom.csv",
+            Body=codecs.BOM_UTF8 + b"name,x\nAlice,1\n",
+        )
+        json_str = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/bom.csv",
+            "pii_fields": ["name"],
+        })
+        result = obfuscator_parallel(
+            json_str, client=mock_s3_bucket, schema_policy=schema_policy
+        )
+        assert b"".join(result) == b"name,x\r\n***,1\r\n"
+        assert obfuscator(
+            json_str, client=mock_s3_bucket, schema_policy="fail"
+        ).getvalue() == b"name,x\r\n***,1\r\n"
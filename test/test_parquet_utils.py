@@ -0,0 +1,108 @@
+"""Testing functions in obfuscator/parquet_utils.py"""
+
+import json
+import pytest
+from io import BytesIO
+from obfuscator.main import obfuscator
+from obfuscator.parquet_utils import obfuscate_parquet, obfuscate_s3_parquet
+from obfuscator.s3_utils import S3RangeFile
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def read_parquet(data: bytes):
+    """Reads parquet bytes as a ParquetFile."""
+
+    return pq.ParquetFile(BytesIO(data))
+
+
+class TestObfuscateParquet:
+    """Tests obfuscate_parquet function in obfuscator/parquet_utils.py"""
+
+    @pytest.mark.it("Obfuscates given fields & keeps others unchanged")
+    def test_obfuscates_fields(self, s3_parquet):
+        """Testing obfuscated columns only contain the mask.
+
+        Uses s3_parquet fixture and students.parquet object."""
+
+        body = s3_parquet.get_object(
+            Bucket="test-bucket", Key="students.parquet"
+        )["Body"].read()
+        result = b"".join(
+            obfuscate_parquet(BytesIO(body), ["name", "email_address"])
+        )
+        original = read_parquet(body).read().to_pydict()
+        obfuscated = read_parquet(result).read().to_pydict()
+        assert list(obfuscated) == list(original)
+        assert set(obfuscated["name"]) == {"***"}
+        assert set(obfuscated["email_address"]) == {"***"}
+        for name in ["student_id", "course", "cohort", "notes"]:
+            assert obfuscated[name] == original[name]
+
+    @pytest.mark.it("Keeps row groups")
+    def test_row_groups(self, s3_parquet):
+        """Testing output has one row group for each input row group."""
+
+        body = s3_parquet.get_object(
+            Bucket="test-bucket", Key="students.parquet"
+        )["Body"].read()
+        chunks = list(obfuscate_parquet(BytesIO(body), ["name"]))
+        assert len(chunks) == 4  # one per row group & the footer
+        assert read_parquet(b"".join(chunks)).num_row_groups == 3
+
+
+class TestObfuscateS3Parquet:
+    """Tests obfuscate_s3_parquet function in obfuscator/parquet_utils.py"""
+
+    @pytest.mark.it("Does not download obfuscated columns")
+    def test_prunes_columns(self, s3_parquet, monkeypatch):
+        """Testing obfuscating the large notes column downloads only a
+        fraction of the file."""
+
+        files = []
+        original_init = S3RangeFile.__init__
+
+        def record_init(self, *args, **kwargs):
+            original_init(self, *args, **kwargs)
+            files.append(self)
+
+        monkeypatch.setattr(S3RangeFile, "__init__", record_init)
+        result = b"".join(
+            obfuscate_s3_parquet("test-bucket", "students.parquet", ["notes"])
+        )
+        assert set(read_parquet(result).read()["notes"].to_pylist()) == {
+            "***"
+        }
+        assert files[0].bytes_fetched < files[0].size / 10
+
+    @pytest.mark.it("Obfuscator accepts parquet files")
+    def test_obfuscator(self, s3_parquet):
+        """Testing obfuscator returns an obfuscated parquet file."""
+
+        test_request = json.dumps({
+            "file_to_obfuscate": "s3://test-bucket/students.parquet",
+            "pii_fields": ["name"],
+        })
+        result = obfuscator(test_request)
+        names = read_parquet(result.read()).read()["name"].to_pylist()
+        assert set(names) == {"***"}
+        assert len(names) == 3000
+
+
+class TestS3RangeFile:
+    """Tests S3RangeFile class in obfuscator/s3_utils.py"""
+
+    @pytest.mark.it("Reads & seeks like a local file")
+    def test_read_and_seek(self, mock_s3_bucket):
+        """Testing reads from any position match the local file."""
+
+        with open("test/test_data/students.csv", "rb") as c:
+            expected = c.read()
+        f = S3RangeFile("test-bucket", "students.csv")
+        assert f.read(10) == expected[:10]
+        f.seek(-5, 2)
+        assert f.read() == expected[-5:]
+        f.seek(3)
+        assert f.read(1000) == expected[3:]
+        assert f.read(1) == b""
+        assert f.bytes_fetched == 10 + 5 + len(expected) - 3
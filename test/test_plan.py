@@ -0,0 +1,103 @@
+"""Testing functions in obfuscator/plan.py"""
+
+import pytest
+import gzip
+import io
+from obfuscator.csv_utils import get_field_indices
+from obfuscator.main import obfuscate_s3_object
+from obfuscator.plan import ObfuscationPlan
+from obfuscator.pseudonymise import Pseudonymiser
+
+
+SOURCE = "s3://test-bucket/students.csv"
+
+
+class TestObfuscationPlan:
+    """Tests ObfuscationPlan class in obfuscator/plan.py"""
+
+    @pytest.mark.it("Obfuscates S3 objects like obfuscate_s3_object")
+    def test_obfuscate(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        plan = ObfuscationPlan(["name", "email_address", "name"])
+        assert plan.fields == ["name", "email_address"]
+        expected = b"".join(obfuscate_s3_object(
+            "test-bucket", "students.csv", ["name", "email_address"]
+        ))
+        for _ in range(2):
+            assert plan.obfuscate(SOURCE).getvalue() == expected
+            assert b"".join(plan.stream(SOURCE)) == expected
+
+    @pytest.mark.it("Saves output to S3 compressed by the key's extension")
+    def test_to_s3(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        plan = ObfuscationPlan(["name"], client=mock_s3_bucket)
+        plan.to_s3(SOURCE, "test-bucket", "out/students.csv.gz")
+        body = mock_s3_bucket.get_object(
+            Bucket="test-bucket", Key="out/students.csv.gz"
+        )["Body"].read()
+        assert gzip.decompress(body) == plan.obfuscate(SOURCE).getvalue()
+
+    @pytest.mark.it("Skips objects missing fields with schema_policy")
+    def test_schema_policy(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        plan = ObfuscationPlan(["phone"], schema_policy="skip")
+        assert plan.obfuscate(SOURCE) is None
+        assert list(plan.stream(SOURCE)) == []
+        assert plan.to_s3(SOURCE, "test-bucket", "out.csv") is None
+
+    @pytest.mark.it("Validates options when it is built")
+    def test_invalid(self):
+        """Testing invalid options raise ValueError straight away."""
+
+        with pytest.raises(ValueError):
+            ObfuscationPlan(["name"], compression="lz4")
+        with pytest.raises(ValueError):
+            ObfuscationPlan(["name"], schema_policy="ignore")
+        with pytest.raises(ValueError):
+            ObfuscationPlan(
+                ["name"], engine="bytes", pseudonymiser=Pseudonymiser("k")
+            )
+
+    @pytest.mark.it("Obfuscates streams and blocks of records")
+    def test_in_memory(self):
+        """Testing stream_file and obfuscate_csv_block."""
+
+        plan = ObfuscationPlan(["name"])
+        data = b"id,name\r\n1,A\r\n2,B\r\n"
+        chunks = plan.stream_file(io.BytesIO(data), "csv")
+        assert b"".join(chunks) == b"id,name\r\n1,***\r\n2,***\r\n"
+        out = io.BytesIO()
+        plan.obfuscate_into(memoryview(data), out)
+        assert out.getvalue() == b"id,name\r\n1,***\r\n2,***\r\n"
+
+        header = ["name", "id", "name"]
+        assert plan.field_indices(header) == [0, 2]
+        assert plan.field_indices(header) is plan.field_indices(header)
+        block = plan.obfuscate_csv_block(b"A,1,B\r\nC,2,D\r\n", header)
+        assert block == b"***,1,***\r\n***,2,***\r\n"
+
+    @pytest.mark.it("Resolves a header shared by many objects once")
+    @pytest.mark.parametrize("engine", ["csv", "bytes"])
+    def test_header_cache(self, mock_s3_bucket, monkeypatch, engine):
+        """Uses mock_s3_bucket & monkeypatch fixtures."""
+
+        calls = []
+
+        def spy(header, fields):
+            calls.append(header)
+            return get_field_indices(header, fields)
+
+        monkeypatch.setattr("obfuscator.plan.get_field_indices", spy)
+        plan = ObfuscationPlan(["name", "missing"], engine=engine)
+        expected = b"".join(obfuscate_s3_object(
+            "test-bucket", "students.csv", ["name"], engine=engine
+        ))
+        data = plan.obfuscate(SOURCE).getvalue()
+        assert data == expected
+        assert plan.obfuscate(SOURCE).getvalue() == expected
+        assert b"".join(plan.stream(SOURCE)) == expected
+        assert b"".join(plan.stream_file(io.BytesIO(data), "csv")) == data
+        assert len(calls) == 1
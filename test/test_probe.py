@@ -0,0 +1,191 @@
+"""Testing functions in obfuscator/probe.py"""
+
+import pytest
+import codecs
+import gzip
+import json
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_parallel,
+    obfuscator_streaming,
+    obfuscator_to_s3,
+)
+from obfuscator.batch import obfuscate_batch
+from obfuscator.probe import apply_schema_policy, probe_s3_object
+from obfuscator.exceptions import InvalidFileToObfuscate, PIIFieldsNotFound
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+def get_ranges(client) -> list:
+    """Records the Range of each GetObject call made with client."""
+
+    ranges = []
+    client.meta.events.register(
+        "before-call.s3.GetObject",
+        lambda params, **kwargs: ranges.append(params["headers"].get("Range")),
+    )
+    return ranges
+
+
+class TestProbeS3Object:
+    """Tests probe_s3_object function in obfuscator/probe.py"""
+
+    @pytest.mark.it("Reads the csv header with one small ranged GET")
+    def test_csv(self, s3_bucket_1MB):
+        """Uses s3_bucket_1MB fixture and movies.csv object."""
+
+        ranges = get_ranges(s3_bucket_1MB)
+        probe = probe_s3_object(
+            "test-bucket", "movies.csv", ["Title", "Email"],
+            client=s3_bucket_1MB,
+        )
+        assert ranges == ["bytes=0-16383"]
+        assert probe.found == ["Title"]
+        assert probe.missing == ["Email"]
+        assert probe.size > 1000000
+        assert probe.encoding == "utf-8"
+
+    @pytest.mark.it("Fetches more until the whole header is read")
+    def test_long_header(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        header = ",".join(f"field{i}" for i in range(5000))
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="wide.csv",
+            Body=(header + "\n" + "a," * 4999 + "a\n").encode(),
+        )
+        probe = probe_s3_object(
+            "test-bucket", "wide.csv", ["field4999"], probe_size=1024
+        )
+        assert probe.found == ["field4999"]
+        assert probe.header_end == len(header) + 1
+
+    @pytest.mark.it("Detects byte order marks")
+    def test_bom(self, mock_s3_bucket, students_csv):
+        """Testing utf-8 BOMs are dropped & other encodings are rejected.
+
+        Uses mock_s3_bucket fixture."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="bom.csv",
+            Body=codecs.BOM_UTF8 + students_csv,
+        )
+        probe = probe_s3_object("test-bucket", "bom.csv", ["student_id"])
+        assert probe.encoding == "utf-8-sig"
+        assert probe.missing == []
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="utf16.csv",
+            Body=students_csv.decode().encode("utf-16"),
+        )
+        with pytest.raises(InvalidFileToObfuscate):
+            probe_s3_object("test-bucket", "utf16.csv", ["name"])
+
+    @pytest.mark.it("Reads the header of compressed and empty files")
+    def test_compressed_and_empty(self, mock_s3_bucket, students_csv):
+        """Uses mock_s3_bucket fixture."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="s.csv.gz",
+            Body=gzip.compress(students_csv * 50),
+        )
+        probe = probe_s3_object(
+            "test-bucket", "s.csv.gz", ["name"], probe_size=64
+        )
+        assert probe.codec == "gzip"
+        assert probe.found == ["name"]
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="empty.csv", Body=b""
+        )
+        probe = probe_s3_object("test-bucket", "empty.csv", ["name"])
+        assert probe.header == [] and probe.missing == ["name"]
+
+    @pytest.mark.it("Reads parquet fields from the footer")
+    def test_parquet(self, s3_parquet):
+        """Uses s3_parquet fixture and students.parquet object."""
+
+        probe = probe_s3_object(
+            "test-bucket", "students.parquet", ["name", "phone"]
+        )
+        assert probe.found == ["name"]
+        assert probe.missing == ["phone"]
+
+    @pytest.mark.it("Does not check json files")
+    def test_json(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        probe = probe_s3_object("test-bucket", "a.json", ["name"])
+        assert probe.header is None
+        assert apply_schema_policy(probe, "fail")
+
+
+class TestSchemaPolicy:
+    """Tests schema_policy of the obfuscator functions"""
+
+    @pytest.mark.it("fail raises before the file is downloaded")
+    def test_fail(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        ranges = get_ranges(mock_s3_bucket)
+        json_str = request("students.csv", ["name", "phone"])
+        with pytest.raises(PIIFieldsNotFound):
+            obfuscator(
+                json_str, client=mock_s3_bucket, schema_policy="fail"
+            )
+        assert ranges == ["bytes=0-16383"]
+        result = obfuscator(json_str, schema_policy="warn")
+        assert result.getvalue() == obfuscator(json_str).getvalue()
+
+    @pytest.mark.it("skip skips files with nothing to obfuscate")
+    def test_skip(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        json_str = request("students.csv", ["phone"])
+        assert obfuscator(json_str, schema_policy="skip") is None
+        assert list(obfuscator_streaming(json_str, schema_policy="skip")) == []
+        assert list(obfuscator_parallel(json_str, schema_policy="skip")) == []
+        assert obfuscator_to_s3(
+            json_str, "test-bucket", "out.csv", schema_policy="skip"
+        ) is None
+        assert "Contents" not in mock_s3_bucket.list_objects_v2(
+            Bucket="test-bucket", Prefix="out"
+        )
+        manifest = obfuscate_batch(
+            ["s3://test-bucket/students.csv"], ["phone"],
+            schema_policy="skip",
+        )
+        assert manifest[0]["status"] == "skipped"
+
+        json_str = request("students.csv", ["name", "phone"])
+        result = obfuscator(json_str, schema_policy="skip")
+        assert result.getvalue() == obfuscator(json_str).getvalue()
+
+    @pytest.mark.it("Raises ValueError for unknown policies")
+    def test_invalid_policy(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        with pytest.raises(ValueError):
+            obfuscator(request("students.csv", ["name"]), schema_policy="x")
+
+    @pytest.mark.it("Obfuscates csv files starting with a BOM")
+    def test_bom_fields(self, mock_s3_bucket, students_csv):
+        """Testing the first field can be obfuscated once the BOM is found.
+
+        Uses mock_s3_bucket fixture."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="bom.csv",
+            Body=codecs.BOM_UTF8 + students_csv,
+        )
+        json_str = request("bom.csv", ["student_id"])
+        result = b"".join(obfuscator_streaming(json_str, schema_policy="fail"))
+        assert result.splitlines()[1].startswith(b"***,")
@@ -0,0 +1,203 @@
+"""Testing functions in obfuscator/pseudonymise.py"""
+
+import pytest
+import hmac
+import json
+import pickle
+from io import BytesIO
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_parallel,
+    obfuscate_s3_object,
+)
+from obfuscator.csv_utils import obfuscate_fields, obfuscate_row_lists
+from obfuscator.json_utils import obfuscate_json_stream
+from obfuscator.pseudonymise import Pseudonymiser
+
+
+TEST_JSON = json.dumps({
+    "file_to_obfuscate": "s3://test-bucket/students.csv",
+    "pii_fields": ["name", "email_address"],
+})
+
+
+class TestPseudonymiser:
+    """Tests Pseudonymiser class in obfuscator/pseudonymise.py"""
+
+    @pytest.mark.it("Gives the same token for a value with the same key")
+    def test_deterministic(self):
+        """Testing tokens depend only on the key and the value."""
+
+        first = Pseudonymiser("key")
+        second = Pseudonymiser(b"key")
+        other = Pseudonymiser("other key")
+        assert first.token("a@b.com") == second.token("a@b.com")
+        assert first.token("a@b.com") != first.token("b@b.com")
+        assert first.token("a@b.com") != other.token("a@b.com")
+        assert len(first.token("a@b.com")) == 16
+
+    @pytest.mark.it("Adds a prefix & uses the given token length")
+    def test_prefix_length(self):
+        """Testing prefix and length of hex tokens."""
+
+        token = Pseudonymiser("key", length=8, prefix="tok_").token("a")
+        assert token.startswith("tok_")
+        assert len(token) == 12
+
+    @pytest.mark.it("Preserves length, character classes and punctuation")
+    def test_preserve_format(self):
+        """Testing format preserving tokens, including long values."""
+
+        pseudonymiser = Pseudonymiser("key", preserve_format=True)
+        value = "Jo.Bloggs99@example.com " + "x" * 100
+        token = pseudonymiser.token(value)
+        assert token != value
+        assert len(token) == len(value)
+        for char, new_char in zip(value, token):
+            assert char.isdigit() == new_char.isdigit()
+            assert char.isupper() == new_char.isupper()
+            assert char.islower() == new_char.islower()
+            if not char.isalnum():
+                assert char == new_char
+
+    @pytest.mark.it("Caches tokens of repeated values in a bounded cache")
+    def test_cache(self):
+        """Testing repeated values are hits and the cache size is bounded.
+        """
+
+        pseudonymiser = Pseudonymiser("key", cache_size=2)
+        tokens = pseudonymiser.tokenise(["UK", "FR"])
+        tokens += pseudonymiser.tokenise(["UK", "DE"])
+        assert tokens[0] == tokens[2]
+        info = pseudonymiser.cache_info()
+        assert info.hits == 1
+        assert info.currsize == 2
+
+    @pytest.mark.it("Hashes each distinct value in a batch once")
+    @pytest.mark.parametrize("preserve_format", [False, True])
+    def test_tokenise_distinct(self, monkeypatch, preserve_format):
+        """Uses monkeypatch fixture."""
+
+        calls = []
+        digest = hmac.digest
+
+        def spy(key, msg, name):
+            calls.append(msg)
+            return digest(key, msg, name)
+
+        monkeypatch.setattr(hmac, "digest", spy)
+        # without a cache only the de-duplication saves hashing
+        pseudonymiser = Pseudonymiser(
+            "key", preserve_format=preserve_format, cache_size=0
+        )
+        tokens = pseudonymiser.tokenise(iter(["UK", "FR", "UK", "UK"]))
+        assert tokens[0] == tokens[2] == tokens[3] != tokens[1]
+        assert calls.count(b"UK") == 1
+        assert calls.count(b"FR") == 1
+        assert tokens[:2] == [pseudonymiser.token(v) for v in ["UK", "FR"]]
+
+    @pytest.mark.it("Can be pickled for worker processes")
+    def test_pickle(self):
+        """Testing pickled pseudonymiser gives the same tokens."""
+
+        pseudonymiser = Pseudonymiser("key", preserve_format=True)
+        copy = pickle.loads(pickle.dumps(pseudonymiser))
+        assert copy.token("abc 123") == pseudonymiser.token("abc 123")
+
+    @pytest.mark.it("Raises ValueError without a key or with a bad length")
+    def test_invalid(self):
+        """Testing arguments are validated."""
+
+        with pytest.raises(ValueError):
+            Pseudonymiser("")
+        with pytest.raises(ValueError):
+            Pseudonymiser("key", length=65)
+
+
+class TestPseudonymiseData:
+    """Tests pseudonymising csv, json & S3 objects"""
+
+    @pytest.mark.it("obfuscate_fields & obfuscate_row_lists use tokens")
+    def test_csv_functions(self):
+        """Testing both csv paths give the same tokens, leaving missing
+        values and other fields unchanged."""
+
+        pseudonymiser = Pseudonymiser("key")
+        data = [{"name": "a", "id": "1"}, {"name": "a", "id": "2"}]
+        result = obfuscate_fields(data, ["name"], pseudonymiser)
+        assert result[0]["name"] == result[1]["name"]
+        assert result[0]["name"] == pseudonymiser.token("a")
+        assert [row["id"] for row in result] == ["1", "2"]
+        assert data[0]["name"] == "a"
+
+        rows = obfuscate_row_lists(
+            [["a", "1"], ["b"], []], [0, 1], pseudonymiser=pseudonymiser
+        )
+        token = pseudonymiser.token
+        assert rows == [[token("a"), token("1")], [token("b")], []]
+
+    @pytest.mark.it("obfuscate_json_stream tokenises nested & other values")
+    def test_json(self):
+        """Testing json values are tokenised and nulls are kept."""
+
+        pseudonymiser = Pseudonymiser("key")
+        records = [{"contact": {"phone": 123}}, {"contact": {"phone": None}}]
+        data = BytesIO(json.dumps(records).encode())
+        result = json.loads(b"".join(obfuscate_json_stream(
+            data, ["contact.phone"], pseudonymiser=pseudonymiser
+        )))
+        assert result[0]["contact"]["phone"] == pseudonymiser.token("123")
+        assert result[1]["contact"]["phone"] is None
+
+    @pytest.mark.it("Entry points give the same output for csv files")
+    def test_entry_points(self, mock_s3_bucket):
+        """Testing obfuscator, streaming & parallel output is identical.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        pseudonymiser = Pseudonymiser("key")
+        result = obfuscator(TEST_JSON, pseudonymiser=pseudonymiser)
+        streamed = b"".join(obfuscate_s3_object(
+            "test-bucket", "students.csv", ["name", "email_address"],
+            pseudonymiser=pseudonymiser,
+        ))
+        parallel = b"".join(obfuscator_parallel(
+            TEST_JSON, range_size=16, pseudonymiser=pseudonymiser
+        ))
+        expected = result.getvalue().replace(b"\r\n", b"\n")
+        assert streamed.replace(b"\r\n", b"\n") == expected
+        assert parallel.replace(b"\r\n", b"\n") == expected
+        assert b"***" not in expected
+
+    @pytest.mark.it("Raises ValueError with the bytes engine")
+    def test_bytes_engine(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        with pytest.raises(ValueError):
+            obfuscate_s3_object(
+                "test-bucket", "students.csv", ["name"], engine="bytes",
+                pseudonymiser=Pseudonymiser("key"),
+            )
+
+    @pytest.mark.it("Tokenises parquet columns one distinct value at a time")
+    def test_parquet(self, s3_parquet):
+        """Testing tokens in parquet match tokens of the original values.
+
+        Uses s3_parquet fixture and students.parquet object."""
+
+        pq = pytest.importorskip("pyarrow.parquet")
+        original = pq.read_table(BytesIO(s3_parquet.get_object(
+            Bucket="test-bucket", Key="students.parquet"
+        )["Body"].read()))
+        pseudonymiser = Pseudonymiser("key")
+        chunks = obfuscate_s3_object(
+            "test-bucket", "students.parquet", ["name"],
+            pseudonymiser=pseudonymiser,
+        )
+        table = pq.read_table(BytesIO(b"".join(chunks)))
+        names = original.column("name").to_pylist()
+        assert table.column("name").to_pylist() == [
+            pseudonymiser.token(name) for name in names
+        ]
+        assert table.column("notes").equals(original.column("notes"))
+        assert pseudonymiser.cache_info().misses == len(set(names))
@@ -0,0 +1,200 @@
+"""Testing functions in obfuscator/redact.py"""
+
+import pytest
+import json
+from csv import DictReader
+from io import StringIO
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_streaming,
+    obfuscate_s3_object,
+)
+from obfuscator.cache import make_cache_key
+from obfuscator.redact import Redactor, _trie_pattern
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+NOTES = [
+    "Prefers email: jo.bloggs@example.com",
+    "Call Alice Smith on 07700 900123 after 5pm",
+    "No contact details given",
+    "Card 4111 1111 1111 1111 declined, NI AB 12 34 56 C",
+]
+
+REDACTED = [
+    "Prefers email: [email]",
+    "Call [name] on [phone] after 5pm",
+    "No contact details given",
+    "Card [card_number] declined, NI [ni_number]",
+]
+
+
+@pytest.fixture
+def notes_csv(mock_s3_bucket):
+    """Adds notes.csv to test-bucket with PII within a free text field."""
+
+    buffer = StringIO()
+    buffer.write("id,name,notes\n")
+    for i, note in enumerate(NOTES):
+        buffer.write(f'{i},Person {i},"{note}"\n')
+    mock_s3_bucket.put_object(
+        Bucket="test-bucket", Key="notes.csv",
+        Body=buffer.getvalue().encode(),
+    )
+    yield mock_s3_bucket
+
+
+class TestRedactor:
+    """Tests Redactor class in obfuscator/redact.py"""
+
+    @pytest.mark.it("Replaces only the spans of PII within text")
+    def test_redact(self):
+        """Testing each kind of PII, names and text without PII."""
+
+        redactor = Redactor(["notes"], names=["Alice Smith"], mask="[{kind}]")
+        assert redactor.redact_values(NOTES) == REDACTED
+        assert redactor.redact("lives at sw1a 1aa.") == "lives at [postcode]."
+        assert Redactor(["notes"]).redact("mail a@b.io") == "mail ***"
+
+    @pytest.mark.it("Leaves numbers which are not PII unchanged")
+    def test_not_pii(self):
+        """Testing invalid card numbers, parts of words and other types."""
+
+        redactor = Redactor(["notes"], names=["Al"])
+        for value in [
+            "4111 1111 1111 1112", "order 12345", "Alan", "2024-03-31",
+            "", None, 12,
+        ]:
+            assert redactor.redact(value) == value
+
+    @pytest.mark.it("Matches names as whole words ignoring case")
+    def test_names(self):
+        """Testing names sharing a prefix and longest matches."""
+
+        assert _trie_pattern(["ann", "anna", "bob"]) == "(?:ann(?:a)?|bob)"
+        redactor = Redactor(["notes"], names=["Ann", "Anna", "Bob"])
+        assert redactor.redact("anna, ANN and bobby") == "***, *** and bobby"
+
+    @pytest.mark.it("Skips the patterns for text without @ or digits")
+    def test_prefilter(self):
+        """Testing the patterns are only used when they can match."""
+
+        class CountingRedactor(Redactor):
+            calls = 0
+
+            def _replace(self, match):
+                CountingRedactor.calls += 1
+                return super()._replace(match)
+
+        redactor = CountingRedactor(["notes"], patterns={"word": r"[a-z]+"})
+        assert redactor.redact("no candidates") == "no candidates"
+        assert CountingRedactor.calls == 0
+        redactor = CountingRedactor(
+            ["notes"], patterns={"word": r"[a-z]+"}, candidates=None
+        )
+        assert redactor.redact("two words") == "*** ***"
+
+    @pytest.mark.it("Changes cache keys")
+    def test_cache_key(self):
+        """Testing the settings of a redactor are part of the cache key."""
+
+        keys = {
+            make_cache_key("b", "k", "v", ["name"], redactor=redactor)
+            for redactor in [
+                None, Redactor(["notes"]), Redactor(["other"]),
+                Redactor(["notes"], names=["Bob"]),
+            ]
+        }
+        assert len(keys) == 4
+
+
+class TestRedaction:
+    """Tests redactor of the obfuscator functions"""
+
+    @pytest.mark.it("Redacts csv fields with every csv path")
+    def test_csv(self, notes_csv):
+        """Testing pii_fields are masked in full and notes are redacted.
+
+        Uses notes_csv fixture."""
+
+        json_str = request("notes.csv", ["name"])
+        redactor = Redactor(["notes"], names=["Alice Smith"], mask="[{kind}]")
+        result = obfuscator(json_str, redactor=redactor).getvalue()
+        rows = list(DictReader(StringIO(result.decode())))
+        assert [row["notes"] for row in rows] == REDACTED
+        assert {row["name"] for row in rows} == {"***"}
+        assert [row["id"] for row in rows] == ["0", "1", "2", "3"]
+        streamed = b"".join(obfuscator_streaming(json_str, redactor=redactor))
+        assert streamed == result
+
+    @pytest.mark.it("Masks fields in both pii_fields and the redactor")
+    def test_pii_fields_first(self, notes_csv):
+        """Uses notes_csv fixture."""
+
+        json_str = request("notes.csv", ["notes"])
+        result = b"".join(
+            obfuscator_streaming(json_str, redactor=Redactor(["notes"]))
+        )
+        rows = list(DictReader(StringIO(result.decode())))
+        assert {row["notes"] for row in rows} == {"***"}
+
+    @pytest.mark.it("Redacts nested json fields and lists of text")
+    def test_json(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        records = [
+            {"id": 1, "contact": {"notes": NOTES[0]}, "tags": NOTES[1:3]},
+            {"id": 2, "contact": {"notes": None}, "tags": []},
+        ]
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="notes.json",
+            Body=json.dumps(records).encode(),
+        )
+        redactor = Redactor(
+            ["contact.notes", "tags"], names=["alice smith"], mask="[{kind}]"
+        )
+        result = obfuscator(request("notes.json", []), redactor=redactor)
+        assert json.loads(result.getvalue()) == [
+            {"id": 1, "contact": {"notes": REDACTED[0]},
+             "tags": REDACTED[1:3]},
+            {"id": 2, "contact": {"notes": None}, "tags": []},
+        ]
+
+    @pytest.mark.it("Redacts parquet string columns")
+    def test_parquet(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        pa = pytest.importorskip("pyarrow")
+        pq = pytest.importorskip("pyarrow.parquet")
+        table = pa.table({"id": [0, 1, 2, 3], "notes": NOTES[:3] + [None]})
+        sink = pa.BufferOutputStream()
+        pq.write_table(table, sink)
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="notes.parquet",
+            Body=sink.getvalue().to_pybytes(),
+        )
+        redactor = Redactor(["notes"], names=["Alice Smith"], mask="[{kind}]")
+        result = pq.read_table(
+            obfuscator(request("notes.parquet", []), redactor=redactor)
+        )
+        assert result.column("notes").to_pylist() == REDACTED[:3] + [None]
+        assert result.schema.field("notes").type == pa.string()
+        assert result.column("id").to_pylist() == [0, 1, 2, 3]
+
+    @pytest.mark.it("Raises ValueError with the bytes engine")
+    def test_bytes_engine(self, notes_csv):
+        """Uses notes_csv fixture."""
+
+        with pytest.raises(ValueError):
+            obfuscate_s3_object(
+                "test-bucket", "notes.csv", ["name"], engine="bytes",
+                redactor=Redactor(["notes"]),
+            )
@@ -0,0 +1,108 @@
+"""Testing functions in obfuscator/registry.py"""
+
+import pytest
+import subprocess
+import sys
+from obfuscator.registry import (
+    FORMATS,
+    STORAGE,
+    Registry,
+    measure_import_time,
+    storage_scheme,
+)
+
+
+class TestRegistry:
+    """Tests Registry class in obfuscator/registry.py"""
+
+    @pytest.mark.it("Imports modules and attributes when first loaded")
+    def test_load(self):
+        """Testing lookup of modules, attributes and unknown names."""
+
+        registry = Registry("thing")
+        registry.register("json", "json")
+        registry.register("dumps", "json:dumps")
+        assert registry.names() == ["json", "dumps"]
+        assert not registry.is_loaded("dumps")
+        assert registry.load("dumps")([1]) == "[1]"
+        assert registry.is_loaded("dumps")
+        assert registry.load("json").loads("2") == 2
+        with pytest.raises(ValueError) as err:
+            registry.load("yaml")
+        assert str(err.value) == "thing must be one of json, dumps"
+
+    @pytest.mark.it("Names the extra to install for missing modules")
+    def test_missing(self):
+        """Testing ImportError of a module which is not installed."""
+
+        registry = Registry("codec")
+        registry.register("lz", "obfuscator_missing_lz", extra="lz")
+        with pytest.raises(ImportError) as err:
+            registry.load("lz")
+        assert "pip install obfuscator[lz]" in str(err.value)
+
+    @pytest.mark.it("Registers every supported format and storage backend")
+    def test_defaults(self):
+        """Testing the default registries."""
+
+        assert FORMATS.names() == ["csv", "parquet", "json", "jsonl",
+                                   "ndjson"]
+        assert FORMATS.load("ndjson").__name__ == "obfuscator.json_utils"
+        assert storage_scheme("s3://bucket/key.csv") == "s3"
+        assert storage_scheme("data/file.csv") == "file"
+        assert hasattr(STORAGE.load("file"), "MappedFile")
+
+
+class TestImportTime:
+    """Tests import time of the obfuscator package"""
+
+    @pytest.mark.it("Imports neither boto3 nor format modules with package")
+    def test_import_is_light(self):
+        """Testing in a fresh interpreter which modules are imported."""
+
+        code = (
+            "import sys, obfuscator, obfuscator.main; "
+            "print(' '.join(sys.modules))"
+        )
+        modules = subprocess.run(
+            [sys.executable, "-c", code.replace(", obfuscator.main", "")],
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        assert "boto3" not in modules and "botocore" not in modules
+        assert [m for m in modules if m.startswith("obfuscator")] == [
+            "obfuscator"
+        ]
+
+        modules = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True,
+            check=True,
+        ).stdout.split()
+        for name in ["json_utils", "parquet_utils", "csv_bytes"]:
+            assert f"obfuscator.{name}" not in modules
+
+    @pytest.mark.it("Imports neither boto3 nor botocore for obfuscate_into")
+    def test_obfuscate_into_without_boto3(self):
+        """Testing in-memory obfuscation never loads the AWS libraries."""
+
+        code = (
+            "import sys, io; from obfuscator import obfuscate_into; "
+            "out = io.BytesIO(); obfuscate_into(b'name\\nbob\\n', out, "
+            "['name']); print(out.getvalue()); print(' '.join(sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True,
+            check=True,
+        ).stdout.splitlines()
+        assert output[0] == "b'name\\r\\n***\\r\\n'"
+        modules = output[1].split()
+        assert "boto3" not in modules and "botocore" not in modules
+
+    @pytest.mark.it("Measures import time of a module and its imports")
+    def test_measure(self):
+        """Testing modules imported before the module are not included."""
+
+        times = measure_import_time("obfuscator.registry")
+        assert "obfuscator.registry" in times
+        assert "site" not in times
+        assert all(time <= times["obfuscator.registry"]
+                   for time in times.values())
@@ -0,0 +1,253 @@
+"""Testing functions in obfuscator/resume.py"""
+
+import pytest
+import gzip
+import json
+import os
+from obfuscator.main import obfuscator
+from obfuscator.pseudonymise import Pseudonymiser
+from obfuscator.resume import (
+    Checkpoint,
+    CheckpointStore,
+    LocalCheckpointStore,
+    S3CheckpointStore,
+    checkpoint_name,
+    obfuscator_resumable,
+    _iter_parts,
+)
+from obfuscator.exceptions import InvalidFileToObfuscate
+
+
+PART_SIZE = 5 * 1024 * 1024
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+def large_csv(rows: int = 160000) -> bytes:
+    """Makes a csv file of about 11MB, two parts once obfuscated."""
+
+    lines = [b"id,name,email,notes"]
+    for i in range(rows):
+        lines.append(
+            f'{i},Person {i},p{i}@example.com,"note {i * 7919}, '
+            f'about {i % 97}"'.encode()
+        )
+    return b"\r\n".join(lines) + b"\r\n"
+
+
+def fail_upload_part(client, part_number: int) -> list:
+    """Makes the upload of one part fail, like a run dying part way.
+
+    Returns: list which stops the failure once anything is appended."""
+
+    fixed = []
+
+    def fail(params, **kwargs):
+        if not fixed and params["PartNumber"] == part_number:
+            raise RuntimeError("run died")
+
+    client.meta.events.register("provide-client-params.s3.UploadPart", fail)
+    return fixed
+
+
+def record_ranges(client) -> list:
+    """Returns list the Range of each GetObject call is appended to."""
+
+    ranges = []
+
+    def record(params, **kwargs):
+        ranges.append(params.get("Range"))
+
+    client.meta.events.register("provide-client-params.s3.GetObject", record)
+    return ranges
+
+
+def read(client, key: str) -> bytes:
+    """Returns the contents of key in test-bucket."""
+
+    return client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+
+
+class TestCheckpointStores:
+    """Tests checkpoint stores in obfuscator/resume.py"""
+
+    @pytest.mark.it("Saves, loads and deletes checkpoints")
+    def test_stores(self, tmp_path, mock_s3_bucket):
+        """Uses tmp_path & mock_s3_bucket fixtures."""
+
+        checkpoint = Checkpoint(
+            "s3://test-bucket/a.csv", '"etag"', "test-bucket", "b.csv",
+            "upload", 10, [{"ETag": '"1"', "PartNumber": 1}],
+        )
+        name = checkpoint_name("s3://test-bucket/a.csv", "test-bucket", "b")
+        stores = [
+            LocalCheckpointStore(str(tmp_path / "checkpoints")),
+            S3CheckpointStore("test-bucket", client=mock_s3_bucket),
+        ]
+        for store in stores:
+            assert store.load(name) is None
+            store.save(name, checkpoint)
+            assert store.load(name) == checkpoint
+            store.delete(name)
+            store.delete(name)
+            assert store.load(name) is None
+
+
+class TestIterParts:
+    """Tests _iter_parts function in obfuscator/resume.py"""
+
+    @pytest.mark.it("Compresses each part and counts its compressed size")
+    def test_compressed_parts(self):
+        """Testing parts reach part_size and decompress as one file."""
+
+        chunks = [(os.urandom(2000), i) for i in range(1, 11)]
+        parts = list(_iter_parts(chunks, 5000, "gzip"))
+        assert len(parts) > 1
+        assert all(len(body) >= 5000 for body, _ in parts[:-1])
+        assert parts[-1][1] == 10
+        data = gzip.decompress(b"".join(body for body, _ in parts))
+        assert data == b"".join(chunk for chunk, _ in chunks)
+
+
+class TestObfuscatorResumable:
+    """Tests obfuscator_resumable function in obfuscator/resume.py"""
+
+    @pytest.mark.it("Resumes from the last completed part after a failure")
+    def test_resume(self, tmp_path, mock_s3_bucket):
+        """Uses tmp_path & mock_s3_bucket fixtures."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="large.csv", Body=large_csv()
+        )
+        json_str = request("large.csv", ["name", "email"])
+        store = LocalCheckpointStore(str(tmp_path))
+        fixed = fail_upload_part(mock_s3_bucket, 2)
+        with pytest.raises(RuntimeError):
+            obfuscator_resumable(
+                json_str, "test-bucket", "out.csv", store, PART_SIZE,
+                client=mock_s3_bucket,
+            )
+        name = checkpoint_name(
+            "s3://test-bucket/large.csv", "test-bucket", "out.csv"
+        )
+        checkpoint = store.load(name)
+        assert len(checkpoint.parts) == 1
+        assert checkpoint.offset > PART_SIZE
+
+        fixed.append(True)
+        ranges = record_ranges(mock_s3_bucket)
+        obfuscator_resumable(
+            json_str, "test-bucket", "out.csv", store, PART_SIZE,
+            client=mock_s3_bucket,
+        )
+        assert f"bytes={checkpoint.offset}-" in ranges
+        assert store.load(name) is None
+        expected = obfuscator(json_str, client=mock_s3_bucket).getvalue()
+        assert read(mock_s3_bucket, "out.csv") == expected
+
+    @pytest.mark.it("Starts again if the input has changed")
+    def test_changed(self, tmp_path, mock_s3_bucket):
+        """Uses tmp_path & mock_s3_bucket fixtures."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="large.csv", Body=large_csv()
+        )
+        json_str = request("large.csv", ["name"])
+        store = LocalCheckpointStore(str(tmp_path))
+        fixed = fail_upload_part(mock_s3_bucket, 2)
+        with pytest.raises(RuntimeError):
+            obfuscator_resumable(
+                json_str, "test-bucket", "out.csv", store, PART_SIZE,
+                client=mock_s3_bucket,
+            )
+        fixed.append(True)
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="large.csv", Body=large_csv(1000)
+        )
+        obfuscator_resumable(
+            json_str, "test-bucket", "out.csv", store, PART_SIZE,
+            client=mock_s3_bucket,
+        )
+        expected = obfuscator(json_str, client=mock_s3_bucket).getvalue()
+        assert read(mock_s3_bucket, "out.csv") == expected
+        uploads = mock_s3_bucket.list_multipart_uploads(Bucket="test-bucket")
+        assert uploads.get("Uploads", []) == []
+
+    @pytest.mark.it("Starts again if the fields or pseudonymiser change")
+    def test_settings_changed(self, tmp_path, mock_s3_bucket):
+        """Testing no parts made with the old settings are kept.
+
+        Uses tmp_path & mock_s3_bucket fixtures."""
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="large.csv", Body=large_csv()
+        )
+        store = LocalCheckpointStore(str(tmp_path))
+        fixed = fail_upload_part(mock_s3_bucket, 2)
+        with pytest.raises(RuntimeError):
+            obfuscator_resumable(
+                request("large.csv", ["name"]), "test-bucket", "out.csv",
+                store, PART_SIZE, client=mock_s3_bucket,
+            )
+        with pytest.raises(RuntimeError):
+            obfuscator_resumable(
+                request("large.csv", ["name"]), "test-bucket", "out.csv",
+                store, PART_SIZE, client=mock_s3_bucket,
+                pseudonymiser=Pseudonymiser("key"),
+            )
+        fixed.append(True)
+
+        ranges = record_ranges(mock_s3_bucket)
+        json_str = request("large.csv", ["name", "email"])
+        obfuscator_resumable(
+            json_str, "test-bucket", "out.csv", store, PART_SIZE,
+            client=mock_s3_bucket,
+        )
+        header_end = len(b"id,name,email,notes\r\n")
+        assert ranges[-1] == f"bytes={header_end}-"
+        expected = obfuscator(json_str, client=mock_s3_bucket).getvalue()
+        assert read(mock_s3_bucket, "out.csv") == expected
+        uploads = mock_s3_bucket.list_multipart_uploads(Bucket="test-bucket")
+        assert uploads.get("Uploads", []) == []
+
+    @pytest.mark.it("Can only use stores which implement every method")
+    def test_abstract_store(self):
+        """Testing CheckpointStore is abstract."""
+
+        class PartialStore(CheckpointStore):
+            def load(self, name):
+                return None
+
+        with pytest.raises(TypeError):
+            PartialStore()
+
+    @pytest.mark.it("Compresses output and rejects compressed input")
+    def test_compression(self, tmp_path, mock_s3_bucket):
+        """Uses tmp_path & mock_s3_bucket fixtures."""
+
+        json_str = request("students.csv", ["name"])
+        store = LocalCheckpointStore(str(tmp_path))
+        obfuscator_resumable(
+            json_str, "test-bucket", "out.csv.gz", store,
+            client=mock_s3_bucket,
+        )
+        expected = obfuscator(json_str, client=mock_s3_bucket).getvalue()
+        data = read(mock_s3_bucket, "out.csv.gz")
+        assert gzip.decompress(data) == expected
+
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="students.csv.gz", Body=data
+        )
+        with pytest.raises(InvalidFileToObfuscate):
+            obfuscator_resumable(
+                request("students.csv.gz", ["name"]), "test-bucket", "x.csv",
+                store, client=mock_s3_bucket,
+            )
@@ -0,0 +1,263 @@
+"""Testing functions in obfuscator/s3_select.py"""
+
+import pytest
+import codecs
+import json
+from csv import reader
+from io import StringIO
+from types import SimpleNamespace
+from obfuscator.main import (
+    obfuscator,
+    obfuscator_streaming,
+    obfuscate_s3_object,
+)
+from obfuscator.s3_select import (
+    SelectEventStream,
+    SelectQuery,
+    select_s3_object,
+)
+from obfuscator.exceptions import IncompleteSelectResults
+
+
+def request(key: str, fields: list[str]) -> str:
+    """Returns json string for obfuscating key in test-bucket."""
+
+    return json.dumps({
+        "file_to_obfuscate": f"s3://test-bucket/{key}",
+        "pii_fields": fields,
+    })
+
+
+def stub_select(client, events: list[dict] = None, error: str = None):
+    """Answers select_object_content calls of client with a stub.
+
+    Args:
+        client: S3 client to stub.
+        events (list[dict]): events of the stubbed event stream.
+        error (str): code of an error to respond with instead.
+
+    Returns: list the parameters of each call are appended to."""
+
+    calls = []
+
+    def record(params, **kwargs):
+        calls.append(dict(params))
+
+    def respond(**kwargs):
+        if error is not None:
+            return SimpleNamespace(status_code=405), {
+                "Error": {"Code": error, "Message": "stub"}
+            }
+        return SimpleNamespace(status_code=200), {"Payload": iter(events)}
+
+    client.meta.events.register(
+        "provide-client-params.s3.SelectObjectContent", record
+    )
+    client.meta.events.register("before-call.s3.SelectObjectContent", respond)
+    return calls
+
+
+def csv_rows(data: bytes) -> list[list]:
+    """Parses csv bytes into rows."""
+
+    return list(reader(StringIO(data.decode())))
+
+
+QUERY = SelectQuery(
+    columns=["name", "course"], where=[("course", "=", "Software")]
+)
+
+
+class TestSelectQuery:
+    """Tests SelectQuery class in obfuscator/s3_select.py"""
+
+    @pytest.mark.it("Writes S3 Select SQL expressions")
+    def test_expression(self):
+        """Testing quoting, operators and json lines casts."""
+
+        query = SelectQuery(["a b", 'q"t'], [("c", "!=", "it's")])
+        assert query.expression() == (
+            'SELECT s."a b", s."q""t" FROM S3Object s '
+            "WHERE s.\"c\" <> 'it''s'"
+        )
+        query = SelectQuery(where=[("contact.age", ">=", 18)])
+        assert query.expression(json_lines=True) == (
+            "SELECT s.* FROM S3Object s "
+            "WHERE CAST(s.\"contact\".\"age\" AS STRING) >= '18'"
+        )
+        with pytest.raises(ValueError):
+            SelectQuery(where=[("c", "~", "x")])
+
+    @pytest.mark.it("Filters csv rows and json records")
+    def test_filter(self):
+        """Testing projection, conditions and missing values."""
+
+        rows = [["id", "name", "course"], ["1", "A", "Software"],
+                ["2", "B", "Data"], ["3", "C"]]
+        assert list(QUERY.filter_rows(rows)) == [
+            ["name", "course"], ["A", "Software"]
+        ]
+        records = [
+            {"id": 1, "contact": {"age": 18}}, {"id": 2, "contact": {}},
+            {"id": 3, "contact": {"age": 17}}, [1],
+        ]
+        query = SelectQuery(["id"], [("contact.age", "=", "18")])
+        assert list(query.filter_records(records)) == [{"id": 1}]
+
+
+class TestSelectEventStream:
+    """Tests SelectEventStream class in obfuscator/s3_select.py"""
+
+    @pytest.mark.it("Reads records from events as they are needed")
+    def test_read(self):
+        """Testing events are only read once earlier records are read."""
+
+        read = []
+
+        def events():
+            for event in [
+                {"Records": {"Payload": b"1,a\n"}},
+                {"Stats": {"Details": {"BytesScanned": 9}}},
+                {"Records": {"Payload": b"2,b\n"}},
+                {"End": {}},
+            ]:
+                read.append(event)
+                yield event
+
+        stream = SelectEventStream(events(), prefix=b"id,x\n")
+        assert stream.read(5) == b"id,x\n" and read == []
+        assert stream.read(4) == b"1,a\n" and len(read) == 1
+        assert stream.read() == b"2,b\n"
+        assert stream.stats == {"BytesScanned": 9}
+
+    @pytest.mark.it("Reads large payloads in small pieces")
+    def test_small_reads(self):
+        """Testing reads smaller than a payload return it in order."""
+
+        payload = b"".join(b"%d,row\n" % i for i in range(1000))
+        stream = SelectEventStream(
+            [{"Records": {"Payload": payload}}, {"End": {}}], prefix=b"id\n"
+        )
+        pieces = iter(lambda: stream.read(7), b"")
+        assert b"".join(pieces) == b"id\n" + payload
+
+    @pytest.mark.it("Raises IncompleteSelectResults without an End event")
+    def test_incomplete(self):
+        """Testing truncated event streams are not taken as complete."""
+
+        stream = SelectEventStream([{"Records": {"Payload": b"1\n"}}])
+        with pytest.raises(IncompleteSelectResults):
+            stream.read()
+
+
+class TestSelect:
+    """Tests select of the obfuscator functions"""
+
+    @pytest.mark.it("Obfuscates records selected with S3 Select")
+    def test_select(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture and students.csv object."""
+
+        calls = stub_select(mock_s3_bucket, [
+            {"Records": {"Payload": b"Person 1,Software\n"}},
+            {"Records": {"Payload": b"Person 3,Software\n"}},
+            {"End": {}},
+        ])
+        result = b"".join(obfuscate_s3_object(
+            "test-bucket", "students.csv", ["name"], client=mock_s3_bucket,
+            select=QUERY,
+        ))
+        assert csv_rows(result) == [
+            ["name", "course"], ["***", "Software"], ["***", "Software"]
+        ]
+        assert calls[0]["Expression"] == (
+            'SELECT s."name", s."course" FROM S3Object s '
+            "WHERE s.\"course\" = 'Software'"
+        )
+        assert calls[0]["InputSerialization"]["CompressionType"] == "NONE"
+
+    @pytest.mark.it("Falls back to GET when S3 Select is not available")
+    def test_fallback(self, mock_s3_bucket, students_csv):
+        """Testing the query is applied locally with the same result.
+
+        Uses mock_s3_bucket fixture and students.csv object."""
+
+        calls = stub_select(mock_s3_bucket, error="MethodNotAllowed")
+        json_str = request("students.csv", ["name"])
+        result = b"".join(obfuscator_streaming(
+            json_str, client=mock_s3_bucket, select=QUERY
+        ))
+        assert len(calls) == 1
+        header, *rows = csv_rows(students_csv)
+        course = header.index("course")
+        expected = [["name", "course"]] + [
+            ["***", "Software"] for row in rows if row[course] == "Software"
+        ]
+        assert len(expected) > 1
+        assert csv_rows(result) == expected
+        assert obfuscator(
+            json_str, client=mock_s3_bucket, select=QUERY
+        ).getvalue() == result
+
+    @pytest.mark.it("Falls back to GET with the encoding found by the probe")
+    def test_fallback_bom(self, mock_s3_bucket, students_csv):
+        """Testing a csv file starting with a BOM keeps its first field name.
+
+        Uses mock_s3_bucket fixture."""
+
+        stub_select(mock_s3_bucket, error="MethodNotAllowed")
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="bom.csv",
+            Body=codecs.BOM_UTF8 + students_csv,
+        )
+        result = obfuscator(
+            request("bom.csv", ["student_id"]), client=mock_s3_bucket,
+            schema_policy="fail", select=SelectQuery(["student_id", "name"]),
+        )
+        assert csv_rows(result.getvalue())[:2] == [
+            ["student_id", "name"], ["***", "Person 1"]
+        ]
+
+    @pytest.mark.it("Selects json lines and filters json documents locally")
+    def test_json(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        records = [{"id": i, "name": f"P{i}", "ok": i % 2 == 0}
+                   for i in range(4)]
+        mock_s3_bucket.put_object(
+            Bucket="test-bucket", Key="people.json",
+            Body=json.dumps(records).encode(),
+        )
+        query = SelectQuery(["id", "name"], [("ok", "=", "true")])
+        calls = stub_select(mock_s3_bucket, [
+            {"Records": {"Payload": b'{"id":0,"name":"P0"}\n'}}, {"End": {}},
+        ])
+        result = obfuscator(
+            request("people.json", ["name"]), client=mock_s3_bucket,
+            select=query,
+        )
+        assert calls == []
+        assert json.loads(result.getvalue()) == [
+            {"id": 0, "name": "***"}, {"id": 2, "name": "***"}
+        ]
+
+        stream = select_s3_object(
+            "test-bucket", "people.jsonl", query, client=mock_s3_bucket
+        )
+        assert stream.read() == b'{"id":0,"name":"P0"}\n'
+        assert calls[0]["InputSerialization"]["JSON"] == {"Type": "LINES"}
+
+    @pytest.mark.it("Raises errors which are not about S3 Select")
+    def test_errors(self, mock_s3_bucket):
+        """Uses mock_s3_bucket fixture."""
+
+        stub_select(mock_s3_bucket, error="AccessDenied")
+        with pytest.raises(Exception) as err:
+            select_s3_object(
+                "test-bucket", "people.jsonl", QUERY, client=mock_s3_bucket
+            )
+        assert "AccessDenied" in str(err.value)
+        with pytest.raises(ValueError):
+            obfuscate_s3_object(
+                "test-bucket", "students.csv", ["name"], engine="bytes",
+                select=QUERY,
+            )
@@ -0,0 +1,115 @@
+"""Testing functions in obfuscator/s3_utils.py"""
+
+import pytest
+import boto3
+from obfuscator.s3_utils import (
+    MIN_PART_SIZE,
+    upload_stream_to_s3,
+    get_s3_object_size,
+    get_s3_object_range,
+    iter_s3_ranges,
+)
+
+
+def generate_chunks(total_size: int, chunk_size: int = 64 * 1024):
+    """Yields chunks of bytes adding up to total_size."""
+
+    line = b"1234,Person,Software,email@email.com\r\n"
+    chunk = (line * (chunk_size // len(line) + 1))[:chunk_size]
+    for start in range(0, total_size, chunk_size):
+        yield chunk[:min(chunk_size, total_size - start)]
+
+
+class TestUploadStreamToS3:
+    """Testing upload_stream_to_s3 function in obfuscator/s3_utils.py"""
+
+    @pytest.mark.it("Uploads small data with a single put")
+    def test_small_upload(self, mock_s3_bucket):
+        """Testing data smaller than one part is saved without multipart.
+
+        Uses mock_s3_bucket fixture from conftest.py"""
+
+        response = upload_stream_to_s3(
+            [b"name\r\n", b"***\r\n"], "test-bucket", "small.csv"
+        )
+        assert "UploadId" not in response
+        body = mock_s3_bucket.get_object(Bucket="test-bucket", Key="small.csv")
+        assert body["Body"].read() == b"name\r\n***\r\n"
+
+    @pytest.mark.it("Uploads large data in multiple parts")
+    def test_multipart_upload(self, mock_s3_bucket):
+        """Testing data spanning several parts is saved in full & in order."""
+
+        total_size = MIN_PART_SIZE * 2 + 1000
+        upload_stream_to_s3(
+            generate_chunks(total_size), "test-bucket", "large.csv",
+            part_size=MIN_PART_SIZE,
+        )
+        head = mock_s3_bucket.head_object(
+            Bucket="test-bucket", Key="large.csv"
+        )
+        assert head["ETag"].strip('"').endswith("-3")
+        body = mock_s3_bucket.get_object(Bucket="test-bucket", Key="large.csv")
+        assert body["Body"].read() == b"".join(generate_chunks(total_size))
+
+    @pytest.mark.it("Aborts multipart upload if producing data fails")
+    def test_aborts_on_error(self, mock_s3_bucket):
+        """Testing no object or incomplete upload is left behind."""
+
+        def failing_chunks():
+            yield from generate_chunks(MIN_PART_SIZE + 1)
+            raise RuntimeError("failed")
+
+        with pytest.raises(RuntimeError):
+            upload_stream_to_s3(
+                failing_chunks(), "test-bucket", "failed.csv",
+                part_size=MIN_PART_SIZE,
+            )
+        client = boto3.client("s3")
+        uploads = client.list_multipart_uploads(Bucket="test-bucket")
+        assert "Uploads" not in uploads
+        keys = client.list_objects_v2(Bucket="test-bucket")["Contents"]
+        assert "failed.csv" not in [obj["Key"] for obj in keys]
+
+    @pytest.mark.it("Raises ValueError if part_size is too small")
+    def test_part_size_too_small(self, mock_s3_bucket):
+        """Testing S3 minimum part size is enforced up front."""
+
+        with pytest.raises(ValueError):
+            upload_stream_to_s3([b""], "test-bucket", "a.csv", part_size=10)
+
+
+class TestGetS3ObjectRange:
+    """Testing get_s3_object_size & get_s3_object_range functions"""
+
+    @pytest.mark.it("Gets size of object")
+    def test_object_size(self, mock_s3_bucket):
+        """Testing size matches local copy of students.csv"""
+
+        with open("test/test_data/students.csv", "rb") as c:
+            expected = len(c.read())
+        assert get_s3_object_size("test-bucket", "students.csv") == expected
+
+    @pytest.mark.it("Gets given range of bytes")
+    def test_object_range(self, mock_s3_bucket):
+        """Testing only the requested inclusive range is returned."""
+
+        result = get_s3_object_range("test-bucket", "students.csv", 0, 9)
+        assert result == b"student_id"
+
+
+class TestIterS3Ranges:
+    """Testing iter_s3_ranges function in obfuscator/s3_utils.py"""
+
+    @pytest.mark.it("Yields consecutive ranges which make up the object")
+    def test_ranges_join_to_object(self, s3_bucket_1MB):
+        """Testing ranges are in order & cover the whole object."""
+
+        with open("test/test_data/IMDB_Movies_Dataset.csv", "rb") as c:
+            expected = c.read()
+        ranges = list(iter_s3_ranges(
+            "test-bucket", "movies.csv", len(expected), range_size=100000,
+            max_workers=4,
+        ))
+        assert len(ranges) == len(expected) // 100000 + 1
+        assert b"".join(ranges) == expected